@@ -21,31 +21,82 @@ from .config import (
     PORT,
     ENABLE_DASHBOARD,
     DASHBOARD_API_KEY,
-    CUSTOM_HEADERS
+    REQUEST_BODY_STREAMING,
+    CONFIG_WATCH_INTERVAL,
+    UPSTREAM_HEDGE_DELAY,
+    COMPRESSION_PASSTHROUGH,
+    WORKERS
 )
 
 # 导入统计服务
 from .services.stats import (
     record_request_start,
+    record_request_bytes_sent,
     record_request_success,
     record_request_error,
-    periodic_stats_update,
-    cleanup_stale_requests
+    record_cache_result,
+    cleanup_stale_requests,
+    stats_aggregator
 )
 
 # 导入代理服务
 from .services.proxy import (
     process_request_body,
+    needs_body_rewrite,
+    has_request_body,
+    parse_content_length,
     filter_response_headers,
     prepare_forward_headers
 )
 
 # 导入编码工具
-from .utils.encoding import ensure_unicode
+from .utils.encoding import ensure_unicode, decompress_body
+from .services.sse import SSEUsageParser, is_event_stream
+from .services.timings import StreamTimings
+from .services.limiter import concurrency_limiter, LimiterRejected
+from .services.rate_limit import client_limiter, client_key, RATE_LIMITED
+
+# 导入上游连接服务
+from .services.upstream import (
+    create_http_client,
+    prewarm_connections,
+    get_timeout_policy,
+    classify_request_error,
+    PoolTrace
+)
+
+# 导入上游负载均衡
+from .services.balancer import select_upstream, circuit_retry_after
+from .services.runtime_config import current_config, watch_config_files
+
+# 导入重试服务
+from .services.retry import (
+    retry_budget,
+    retry_metrics,
+    is_retryable_status,
+    is_retryable_error,
+    can_retry,
+    backoff_delay,
+    should_hedge
+)
+
+# 导入响应缓存服务
+from .services.response_cache import (
+    CachedResponse,
+    is_cacheable_request,
+    build_cache_key,
+    get_or_fetch
+)
+
+# 导入日志工具
+from .utils.logger import get_logger, flush_logs
 
 # 导入 Admin 路由
 from .routers.admin import router as admin_router
 
+logger = get_logger("proxy")
+stream_logger = get_logger("stream")
+
 # Shared HTTP client for connection pooling and proper lifecycle management
 http_client: httpx.AsyncClient = None  # type: ignore
 
@@ -55,22 +106,30 @@ async def lifespan(_: FastAPI):
     """Manage application lifespan events"""
     global http_client
 
-    # 启动定时统计更新任务
-    stats_task = asyncio.create_task(periodic_stats_update())
-
-    # 启动超时请求清理任务
+    # 启动统计事件聚合任务与超时请求清理任务
+    aggregator_task = asyncio.create_task(stats_aggregator())
     cleanup_task = asyncio.create_task(cleanup_stale_requests())
 
+    # 启动配置文件轮询任务（配置变化时原子替换配置快照）
+    config_task = asyncio.create_task(watch_config_files())
+    config = current_config()
+
     # 输出应用配置信息（只在 worker 进程启动时输出一次）
     print("=" * 60)
     print("Application Configuration:")
     print(f"  Base URL: {TARGET_BASE_URL}")
+    if len(config.upstreams) > 1:
+        print(f"  Upstreams: {[f'{u.base_url} (weight={config.weights[u.name]:g})' for u in config.upstreams]}")
     print(f"  Server Port: {PORT}")
-    print(f"  Custom Headers: {len(CUSTOM_HEADERS)} headers loaded")
-    if CUSTOM_HEADERS:
-        print(f"  Custom Headers Keys: {list(CUSTOM_HEADERS.keys())}")
+    print(f"  Custom Headers: {len(config.custom_headers)} headers loaded")
+    if config.custom_headers:
+        print(f"  Custom Headers Keys: {list(config.custom_headers.keys())}")
+    if config.header_rules:
+        print(f"  Header Rules: {len(config.header_rules)} rules loaded")
+    print(f"  Config Watch Interval: {CONFIG_WATCH_INTERVAL}s" if CONFIG_WATCH_INTERVAL > 0 else "  Config Watch: disabled")
     print(f"  Debug Mode: {DEBUG_MODE}")
-    print(f"  Hot Reload: {DEBUG_MODE}")
+    print(f"  Hot Reload: {DEBUG_MODE and WORKERS == 1}")
+    print(f"  Workers: {WORKERS} (pid {os.getpid()})")
     print(f"  Dashboard Enabled: {ENABLE_DASHBOARD}")
     if ENABLE_DASHBOARD:
         print(f"  Dashboard API Key Configured: {'Yes' if DASHBOARD_API_KEY else 'No'}")
@@ -78,65 +137,48 @@ async def lifespan(_: FastAPI):
             print(f"  Dashboard Access: http://localhost:{PORT}/admin")
     print("=" * 60)
 
-    # 读取代理配置
-    http_proxy = os.getenv("HTTP_PROXY")
-    https_proxy = os.getenv("HTTPS_PROXY")
-
-    # 构建 mounts 配置（httpx 0.28.0+ 的新语法）
-    mounts = {}
-
-    if http_proxy:
-        # 确保代理 URL 包含协议
-        if "://" not in http_proxy:
-            http_proxy = f"http://{http_proxy}"
-        mounts["http://"] = httpx.AsyncHTTPTransport(proxy=http_proxy)
-        print(f"HTTP Proxy configured: {http_proxy}")
-
-    if https_proxy:
-        # 注意：HTTPS 代理通常也使用 http:// 协议（这不是错误！）
-        if "://" not in https_proxy:
-            https_proxy = f"http://{https_proxy}"
-        mounts["https://"] = httpx.AsyncHTTPTransport(proxy=https_proxy)
-        print(f"HTTPS Proxy configured: {https_proxy}")
-
     try:
-        # 使用新的 mounts 参数初始化客户端
-        if mounts:
-            http_client = httpx.AsyncClient(
-                follow_redirects=False,
-                timeout=60.0,
-                mounts=mounts
-            )
-            print(f"HTTP client initialized with proxy mounts: {list(mounts.keys())}")
-        else:
-            http_client = httpx.AsyncClient(
-                follow_redirects=False,
-                timeout=60.0
-            )
-            print("HTTP client initialized without proxy")
+        http_client = create_http_client()
     except Exception as e:
         print(f"Failed to initialize HTTP client: {e}")
         raise
 
+    # 后台预热上游连接，不阻塞启动
+    prewarm_task = asyncio.create_task(prewarm_connections(http_client))
+
     print("=" * 60)
 
     yield
 
     # Shutdown: Close HTTP client and stop background tasks
-    stats_task.cancel()
     cleanup_task.cancel()
+    config_task.cancel()
+    prewarm_task.cancel()
 
     try:
-        await stats_task
+        await cleanup_task
     except asyncio.CancelledError:
         pass
 
     try:
-        await cleanup_task
+        await config_task
+    except asyncio.CancelledError:
+        pass
+
+    try:
+        await prewarm_task
+    except asyncio.CancelledError:
+        pass
+
+    # 取消时应用剩余的统计事件
+    aggregator_task.cancel()
+    try:
+        await aggregator_task
     except asyncio.CancelledError:
         pass
 
     await http_client.aclose()
+    flush_logs()
 
 
 app = FastAPI(
@@ -181,120 +223,535 @@ async def root_redirect(request: Request):
 
 @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "HEAD"])
 async def proxy(path: str, request: Request):
+    # Dashboard 相关路径不计入客户端限流
+    if path.startswith("api/admin") or path.startswith("admin"):
+        return await forward_request(path, request)
+
+    # 按客户端限流：每秒请求数（令牌桶）与同时进行的请求数
+    client = client_key(request.headers, request.client.host if request.client else None)
+    reason, retry_after = client_limiter.acquire(client)
+    if reason is not None:
+        return await reject_client(path, request, client, reason, retry_after)
+
+    try:
+        # 配置了响应缓存的 GET 路径（如 /v1/models）走缓存，其余请求直接转发
+        if is_cacheable_request(path, request.method):
+            response = await cached_proxy(path, request)
+        else:
+            response = await forward_request(path, request)
+    except BaseException:
+        client_limiter.release(client)
+        raise
+    return release_after_response(response, lambda: client_limiter.release(client))
+
+
+def release_after_response(response: Response, release) -> Response:
+    """流式响应在传输结束（后台任务执行）后调用 release，其余响应立即调用"""
+    if not isinstance(response, StreamingResponse):
+        release()
+        return response
+
+    background = response.background
+
+    async def run_background_and_release():
+        try:
+            if background is not None:
+                await background()
+        finally:
+            release()
+
+    response.background = BackgroundTask(run_background_and_release)
+    return response
+
+
+async def reject_client(path: str, request: Request, client: str, reason: str, retry_after: int) -> Response:
+    """客户端超出限流时返回 429 并记录到统计"""
+    logger.warning(f"Client rate limited: {request.method} {path}", client=client, reason=reason, retry_after=retry_after)
+    request_id = record_request_start(path, request.method, 0)
+    record_request_error(
+        request_id,
+        path,
+        request.method,
+        "客户端请求速率超过限制" if reason == RATE_LIMITED else "客户端同时进行的请求数超过限制",
+        0,
+        None,
+        429,
+        error_type=reason,
+        attempts=0
+    )
+    return Response(
+        content="Client rate limit exceeded",
+        status_code=429,
+        headers={"Retry-After": str(retry_after)}
+    )
+
+
+async def buffer_response(response: Response) -> CachedResponse:
+    """完整读取 forward_request 返回的响应（含执行其后台统计任务），用于写入缓存"""
+    if isinstance(response, StreamingResponse):
+        chunks = [chunk async for chunk in response.body_iterator]
+        if response.background is not None:
+            await response.background()
+        body = b"".join(chunks)
+    else:
+        body = response.body
+    headers = {k: v for k, v in response.headers.items() if k.lower() != "content-length"}
+    return CachedResponse(response.status_code, headers, body)
+
+
+async def cached_proxy(path: str, request: Request):
+    """
+    带 TTL 缓存的代理：命中时直接返回缓存的响应，并发的相同请求合并为一次上游调用
+    """
+    start_time = time.time()
+    key = build_cache_key(request.method, path, request.url.query, request.headers)
+
+    async def fetch() -> CachedResponse:
+        # 缓存键不区分 Accept-Encoding，始终缓存未压缩的响应
+        return await buffer_response(await forward_request(path, request, passthrough=False))
+
+    cached, source = await get_or_fetch(key, fetch)
+    record_cache_result(source, len(cached.body))
+
+    # 未访问上游的请求（命中或合并）单独记录到统计中，访问上游的请求已由 forward_request 记录
+    if source != "miss":
+        request_id = record_request_start(path, request.method, 0)
+        if cached.status_code < 400:
+            record_request_success(
+                request_id,
+                path,
+                request.method,
+                len(cached.body),
+                time.time() - start_time,
+                cached.status_code,
+                attempts=0,
+                cache=source
+            )
+        else:
+            # 只有合并请求可能拿到错误响应（错误响应不会写入缓存）
+            record_request_error(
+                request_id,
+                path,
+                request.method,
+                f"HTTP {cached.status_code} (coalesced)",
+                time.time() - start_time,
+                None,
+                cached.status_code,
+                error_type="http_error",
+                attempts=0
+            )
+
+    response = Response(content=cached.body, status_code=cached.status_code, headers=cached.headers)
+    response.headers["X-Cache"] = source.upper()
+    return response
+
+
+async def forward_request(path: str, request: Request, passthrough: bool = COMPRESSION_PASSTHROUGH):
+    """
+    转发请求到上游并流式返回响应（含负载均衡、重试、熔断与统计）
+
+    Args:
+        passthrough: 压缩透传模式，转发客户端的 Accept-Encoding 并原样转发压缩的响应体
+    """
     # 记录请求开始
     start_time = time.time()
-    body = await request.body()
+    # 整个请求（含重试与流式传输）使用开始时的配置快照，配置热更新不影响进行中的请求
+    config = current_config()
+
+    # Content-Length 不是非负整数时直接拒绝：流式上传会原样转发它，缓冲读取也无法确定请求体长度
+    try:
+        content_length = parse_content_length(request.headers)
+    except ValueError:
+        logger.warning(f"Invalid Content-Length: {request.method} {path}",
+                       content_length=request.headers.get("content-length"))
+        return Response(content="Invalid Content-Length", status_code=400)
+
+    # 仅需要改写的路由（/v1/messages）才整体读取请求体，其余路由流式转发
+    stream_body = REQUEST_BODY_STREAMING and not needs_body_rewrite(path, config.system_prompt)
+    body = b"" if stream_body else await request.body()
 
     # 跳过 Dashboard 相关路径的统计
     if not path.startswith("api/admin") and not path.startswith("admin"):
-        request_id = await record_request_start(path, request.method, len(body))
+        request_id = record_request_start(path, request.method, len(body))
     else:
         request_id = None
 
-    # 构造目标 URL
+    # 构造目标 URL 路径（上游地址在每次尝试时由负载均衡选择）
     query = request.url.query
-    target_url = f"{TARGET_BASE_URL}/{path}"
-    if query:
-        target_url += f"?{query}"
-
-    # 仅测试环境打印详细日志
-    if DEBUG_MODE:
+    target_path = f"/{path}?{query}" if query else f"/{path}"
+
+    logger.info(
+        f"Request: {request.method} {path}",
+        body_bytes=request.headers.get("content-length", "unknown") if stream_body else len(body),
+        streaming=stream_body
+    )
+    # 请求体详情仅在 DEBUG 级别输出，且只在启用时才做解析和格式化
+    if logger.debug_enabled and not stream_body:
         try:
             data = json.loads(body.decode('utf-8'))
-            print(f"[Proxy] Original body ({len(body)} bytes): {json.dumps(data, indent=4)}")
+            logger.debug(f"Original body ({len(body)} bytes): {json.dumps(data, indent=4, ensure_ascii=False)}")
         except (json.JSONDecodeError, UnicodeDecodeError) as e:
-            print(f"[Proxy] Failed to parse JSON: {e}")
-    else:
-        print(f"[Proxy] Request: {request.method} {path}")
-        print(f"[Proxy] Original body ({len(body)} bytes): {body[:200]}..." if len(body) > 200 else f"[Proxy] Original body: {body}")
+            logger.debug(f"Original body ({len(body)} bytes, not JSON: {e}): {body[:200]}")
 
     # 处理请求体（替换 system prompt）
     # 仅在路由为 /v1/messages 时执行处理
-    print(f"[Proxy] Processing request for path: {path}")
-    if path == "v1/messages" or path == "v1/messages/":
-        body = process_request_body(body)
+    if not stream_body and needs_body_rewrite(path, config.system_prompt):
+        body = process_request_body(body, config.system_prompt)
 
-    # 准备转发的请求头
+    # 准备转发的请求头所需的原始信息（Host 取决于每次尝试选中的上游）
     incoming_headers = list(request.headers.items())
     client_host = request.client.host if request.client else None
-    forward_headers = prepare_forward_headers(incoming_headers, client_host)
+    streaming_upload = stream_body and has_request_body(request.headers)
+
+    # 流式转发请求体：边读边转发，并在上传结束后统计实际字节数
+    bytes_sent = 0
+    body_started = False  # 流式请求体一旦开始读取就无法重放，之后不再重试
+
+    async def iter_request_body():
+        nonlocal bytes_sent, body_started
+        body_started = True
+        try:
+            async for chunk in request.stream():
+                if chunk:
+                    bytes_sent += len(chunk)
+                    yield chunk
+        finally:
+            if request_id:
+                record_request_bytes_sent(path, bytes_sent)
+
+    # 按路径解析分阶段超时（连接/连接池/写入交给 httpx，首字节与空闲超时由代理计时）
+    timeouts = get_timeout_policy(path)
+
+    attempts = 0  # 实际发往上游的请求数（含重试与对冲副本）
+
+    async def send_attempt(target):
+        """向指定上游发送一次请求，返回 (响应, 上游调用句柄)；异常时结束调用计数后重新抛出"""
+        nonlocal attempts
+        attempts += 1
+        forward_headers = prepare_forward_headers(
+            incoming_headers, client_host, target.host, passthrough, path, config.header_rewriter
+        )
+        request_content = body
+        if streaming_upload:
+            request_content = iter_request_body()
+            # 请求体未被改写，原始 Content-Length 仍然有效，保留它以避免上游收到 chunked 编码
+            if content_length:
+                forward_headers["Content-Length"] = str(content_length)
+
+        call = target.start()
+        try:
+            # 首字节超时在请求发送完毕、开始等待响应头时由 trace 回调启动计时
+            async with asyncio.timeout(None) as first_byte_deadline:
+                # 构建请求但不使用 context manager
+                req = http_client.build_request(
+                    method=request.method,
+                    url=f"{target.base_url}{target_path}",
+                    headers=forward_headers,
+                    content=request_content,
+                    timeout=timeouts.to_httpx(),
+                    extensions={"trace": PoolTrace(first_byte_deadline, timeouts.first_byte)},
+                )
+
+                # 发送请求并开启流式模式 (不使用 async with)
+                resp = await http_client.send(req, stream=True)
+        except asyncio.CancelledError:
+            # 被对冲的另一路请求胜出而取消时，不计为上游失败
+            call.cancel()
+            raise
+        except BaseException:
+            call.finish(failed=True)
+            raise
+        call.first_byte()
+        return resp, call
+
+    def abandon(task):
+        """放弃一路请求：未完成时取消（send_attempt 取消时结束调用计数）；已返回响应时关闭响应并结束调用"""
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled() and task.exception() is None:
+            resp, call = task.result()
+            call.finish()
+            asyncio.create_task(resp.aclose())
+
+    async def send_hedged(primary):
+        """
+        对冲请求：主请求在 UPSTREAM_HEDGE_DELAY 内未返回响应头时，
+        向另一个上游并发发送副本，取先成功返回的一方，取消另一方
+        """
+        first = asyncio.create_task(send_attempt(primary))
+        try:
+            done, _ = await asyncio.wait({first}, timeout=UPSTREAM_HEDGE_DELAY)
+        except BaseException:
+            # asyncio.wait 不会取消等待中的任务：调用方被取消时主动放弃主请求，
+            # 避免游离的任务继续发送请求，泄漏连接与上游的 in_flight 计数
+            abandon(first)
+            raise
+        if done:
+            return await first
+        secondary = select_upstream(exclude=(primary,), pool=config.upstreams, pool_weights=config.weights)
+        if secondary is None or not retry_budget.try_acquire():
+            return await first
+
+        retry_metrics["hedged_requests"] += 1
+        second = asyncio.create_task(send_attempt(secondary))
+        pending = {first, second}
+        winner = None
+        error = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif winner is None:
+                        winner = task
+                        if task is second:
+                            retry_metrics["hedge_wins"] += 1
+                    else:
+                        # 两路同时返回时关闭落选的响应
+                        loser_resp, loser_call = task.result()
+                        await loser_resp.aclose()
+                        loser_call.finish()
+        finally:
+            for task in pending:
+                abandon(task)
+        if winner is None:
+            raise error
+        return winner.result()
 
     # 发起上游请求并流式处理响应
     response_time = 0
     bytes_received = 0
+    idle_timed_out = False
     error_response_content = b""  # 新增：缓存错误响应内容（仅当状态码 >= 400 时）
+
+    # 并发限制：达到上限时排队等待，队列满或排队超时直接拒绝，不再占用上游连接
     try:
-        # 构建请求但不使用 context manager
-        req = http_client.build_request(
-            method=request.method,
-            url=target_url,
-            headers=forward_headers,
-            content=body,
+        await concurrency_limiter.acquire()
+    except LimiterRejected as e:
+        logger.warning(f"Concurrency limit reached, rejecting: {request.method} {path}", reason=e.reason, retry_after=e.retry_after)
+        if request_id:
+            record_request_error(
+                request_id,
+                path,
+                request.method,
+                "并发请求数已达上限，排队队列已满" if e.status_code == 429 else "并发请求数已达上限，排队超时",
+                time.time() - start_time,
+                None,
+                e.status_code,
+                error_type=e.reason,
+                attempts=0
+            )
+        return Response(
+            content="Too many concurrent requests",
+            status_code=e.status_code,
+            headers={"Retry-After": str(e.retry_after)}
         )
 
-        # 发送请求并开启流式模式 (不使用 async with)
-        resp = await http_client.send(req, stream=True)
+    retry_budget.record_request()
+
+    # 选择上游（多上游时按 TTFB EWMA 与进行中请求数负载均衡）；全部熔断时快速失败，不再等待超时
+    upstream = select_upstream(pool=config.upstreams, pool_weights=config.weights)
+    if upstream is None:
+        concurrency_limiter.release()
+        retry_after = circuit_retry_after(config.upstreams)
+        logger.warning(f"Upstream circuit open, rejecting: {request.method} {path}", retry_after=retry_after)
+        if request_id:
+            record_request_error(
+                request_id,
+                path,
+                request.method,
+                "上游已熔断，请求被快速拒绝",
+                time.time() - start_time,
+                None,
+                503,
+                error_type="circuit_open",
+                attempts=0
+            )
+        return Response(
+            content="Upstream circuit open",
+            status_code=503,
+            headers={"Retry-After": str(retry_after)}
+        )
+
+    hedge = should_hedge(path, request.method) and not streaming_upload
+    tried = []
+    retry_count = 0
+    upstream_call = None
+    handed_off = False  # 响应交给 StreamingResponse 后，由后台任务结束上游计数
+    try:
+        # 在向客户端返回任何字节之前，可重试的错误按退避策略重试（受次数上限与重试预算限制）
+        while True:
+            tried.append(upstream)
+            error = None
+            try:
+                if hedge:
+                    resp, upstream_call = await send_hedged(upstream)
+                else:
+                    resp, upstream_call = await send_attempt(upstream)
+                upstream = upstream_call.upstream
+            except (TimeoutError, httpx.RequestError) as e:
+                error = e
+                error_type = "first_byte_timeout" if isinstance(e, TimeoutError) else classify_request_error(e)
+
+            if error is None and not is_retryable_status(resp.status_code):
+                if retry_count:
+                    retry_metrics["recovered_requests"] += 1
+                break
+
+            retryable = (
+                can_retry(retry_count)
+                and not body_started
+                and (error is None or is_retryable_error(error_type, request.method))
+            )
+            # 重试时优先换一个上游；所有上游均已熔断时不再重试
+            next_upstream = select_upstream(pool=config.upstreams, pool_weights=config.weights, avoid=tried) if retryable else None
+            if next_upstream is None or not retry_budget.try_acquire():
+                if error is not None:
+                    raise error
+                # 无法继续重试时把最后一次的错误响应原样返回给客户端
+                break
+
+            retry_count += 1
+            retry_metrics["retries"] += 1
+            delay = backoff_delay(retry_count)
+            logger.warning(
+                f"Retrying upstream request: {request.method} {path}",
+                upstream=upstream.name,
+                reason=error_type if error is not None else f"HTTP {resp.status_code}",
+                retry=retry_count,
+                delay_ms=round(delay * 1000)
+            )
+            if error is None:
+                await resp.aclose()
+                upstream_call.finish(failed=True)
+                upstream_call = None
+            await asyncio.sleep(delay)
+            upstream = next_upstream
 
         # 过滤响应头
-        response_headers = filter_response_headers(resp.headers.items())
+        response_headers = filter_response_headers(resp.headers.items(), passthrough)
 
-        # 统计响应时间
+        # 统计响应时间（响应头延迟），流式阶段的耗时由 StreamTimings 分解记录
         response_time = time.time() - start_time
+        timings = StreamTimings(start_time)
+
+        # SSE 流边转发边解析 token 用量（数据块原样转发）
+        usage_parser = SSEUsageParser() if resp.status_code < 400 and is_event_stream(resp.headers) else None
 
         # 异步生成器:流式读取响应内容并统计字节数
         async def iter_response():
             nonlocal bytes_received
             nonlocal error_response_content
+            nonlocal idle_timed_out
+            # 压缩透传时读取原始字节，不在代理中解压
+            chunks = resp.aiter_raw() if passthrough else resp.aiter_bytes()
             try:
-                async for chunk in resp.aiter_bytes():
+                while True:
+                    # 空闲超时只作用于等待上游数据块，不包含向客户端写出的时间
+                    wait_start = time.time()
+                    try:
+                        async with asyncio.timeout(timeouts.idle):
+                            chunk = await anext(chunks)
+                    except StopAsyncIteration:
+                        break
+                    timings.on_chunk(time.time() - wait_start)
                     bytes_received += len(chunk)
+                    if usage_parser is not None:
+                        usage_parser.feed(chunk)
+                        if usage_parser.content_started:
+                            timings.on_first_token()
                     # 如果是错误响应，缓存内容（限制 50KB）
                     if resp.status_code >= 400 and len(error_response_content) < 50*1024:
                         error_response_content += chunk
                     yield chunk
+            except TimeoutError:
+                idle_timed_out = True
+                stream_logger.warning(
+                    f"Upstream stream idle timeout: {request.method} {path}",
+                    idle_timeout=timeouts.idle,
+                    bytes_received=bytes_received
+                )
             except Exception as e:
-                # 优雅处理客户端断开连接
-                if DEBUG_MODE:
-                    print(f"[Stream Error] {e}")
-                # 静默处理,避免日志污染
+                # 优雅处理客户端断开连接，仅在 DEBUG 级别记录，避免日志污染
+                stream_logger.debug("Stream interrupted", path=path, error=str(e))
             finally:
                 # 确保资源被释放 (作为备份,主要由 BackgroundTask 处理)
                 pass
 
         # 创建响应完成后的统计任务
         async def close_and_record():
-            await resp.aclose()
+            failed = idle_timed_out or resp.status_code >= 500
+            try:
+                await resp.aclose()
+            finally:
+                # 关闭响应出错（如 HTTP/2 流被重置）时也要归还并发名额并结束上游计数，否则容量永久减少
+                try:
+                    # 上游 TTFB 不含排队时间，反馈给自适应并发上限
+                    concurrency_limiter.observe(upstream_call.ttfb, failed)
+                finally:
+                    concurrency_limiter.release()
+                    upstream_call.finish(failed=failed)
+            stream_timings = timings.result()
             if request_id:
-                if resp.status_code < 400:
-                    await record_request_success(
+                if idle_timed_out:
+                    record_request_error(
+                        request_id,
+                        path,
+                        request.method,
+                        f"上游响应流空闲超时（{timeouts.idle:g}秒无数据）",
+                        time.time() - start_time,
+                        None,
+                        504,
+                        error_type="idle_timeout",
+                        upstream=upstream.name,
+                        attempts=attempts,
+                        timings=stream_timings
+                    )
+                elif resp.status_code < 400:
+                    record_request_success(
                         request_id,
                         path,
                         request.method,
                         bytes_received,
                         response_time,
-                        resp.status_code
+                        resp.status_code,
+                        upstream=upstream.name,
+                        attempts=attempts,
+                        usage=usage_parser.result() if usage_parser is not None else None,
+                        timings=stream_timings
                     )
                 else:
-                    # 使用缓存的响应内容
-                    response_content = ensure_unicode(error_response_content) if error_response_content else None
-                    if DEBUG_MODE:
-                        print(f"[Proxy] Response: {response_content}")
-                    else:
-                        err_content_len = len(error_response_content)
-                        print(f"[Proxy] Response ({err_content_len} bytes): {response_content[:200]}..." if err_content_len > 200 else f"[Proxy] Response: {response_content}")
+                    # 使用缓存的响应内容（压缩透传时缓存的是压缩字节，仅在此处解压）
+                    error_body = error_response_content
+                    if passthrough:
+                        error_body = decompress_body(error_body, resp.headers.get("content-encoding"))
+                    response_content = ensure_unicode(error_body) if error_body else None
+                    logger.warning(
+                        f"Upstream error response: {request.method} {path}",
+                        status_code=resp.status_code,
+                        content_bytes=len(error_body)
+                    )
+                    if logger.debug_enabled:
+                        logger.debug(f"Response: {response_content}")
 
                     # 记录错误到统计服务
-                    await record_request_error(
+                    record_request_error(
                         request_id,
                         path,
                         request.method,
                         f"HTTP {resp.status_code}: {resp.reason_phrase}",
                         response_time,
                         response_content,  # 新增参数
-                        resp.status_code
+                        resp.status_code,
+                        error_type="http_error",
+                        upstream=upstream.name,
+                        attempts=attempts,
+                        timings=stream_timings
                     )
 
         # 使用 BackgroundTask 在响应完成后关闭连接和记录统计
+        handed_off = True
         return StreamingResponse(
             iter_response(),
             status_code=resp.status_code,
@@ -302,23 +759,55 @@ async def proxy(path: str, request: Request):
             background=BackgroundTask(close_and_record),
         )
 
+    except TimeoutError:
+        # 首字节超时：上游已收到完整请求，但在限定时间内未返回响应头
+        logger.error(f"Upstream first byte timeout: {request.method} {path}", first_byte_timeout=timeouts.first_byte)
+        concurrency_limiter.observe(None, failed=True)
+        if request_id:
+            record_request_error(
+                request_id,
+                path,
+                request.method,
+                f"上游首字节超时（{timeouts.first_byte:g}秒未返回响应头）",
+                time.time() - start_time,
+                None,
+                504,
+                error_type="first_byte_timeout",
+                upstream=upstream.name,
+                attempts=attempts
+            )
+        return Response(content="Upstream first byte timeout", status_code=504)
+
     except httpx.RequestError as e:
+        error_type = classify_request_error(e)
+        status_code = 504 if isinstance(e, httpx.TimeoutException) else 502
+        logger.error(f"Upstream request failed: {request.method} {path}", error=str(e) or type(e).__name__, error_type=error_type)
+        concurrency_limiter.observe(None, failed=True)
         # 记录请求错误
         if request_id:
-            await record_request_error(
+            record_request_error(
                 request_id,
                 path,
                 request.method,
-                str(e),
+                str(e) or type(e).__name__,
                 time.time() - start_time,
                 None,
-                502
+                status_code,
+                error_type=error_type,
+                upstream=upstream.name,
+                attempts=attempts
             )
-        return Response(content=f"Upstream request failed: {e}", status_code=502)
+        return Response(content=f"Upstream request failed: {str(e) or type(e).__name__}", status_code=status_code)
+
+    finally:
+        # 未能交给 StreamingResponse（异常或被取消）时在此结束上游计数并释放并发名额
+        if not handed_off:
+            concurrency_limiter.release()
+            if upstream_call is not None:
+                upstream_call.finish(failed=True)
 
 
 if __name__ == "__main__":
-    import uvicorn
-    # 开发模式启用热重载，生产模式禁用（通过 DEBUG_MODE 环境变量控制）
-    # 注意：使用模块路径而非文件路径，以支持相对导入
-    uvicorn.run("backend.app:app", host="0.0.0.0", port=PORT, reload=DEBUG_MODE)
+    # 生产启动参数（worker 数、事件循环、监听队列等）见 backend/server.py
+    from .server import main
+    main()
@@ -16,6 +16,99 @@ load_dotenv()
 TARGET_BASE_URL = os.getenv("API_BASE_URL", "https://anyrouter.top")
 PRESERVE_HOST = False  # 是否保留原始 Host
 
+# ===== 多上游负载均衡配置 =====
+# 多个兼容的上游地址，逗号分隔，可用 "|权重" 指定权重（默认 1），例如:
+# https://anyrouter.top|3,https://backup.example.com|1
+# 未设置时只使用 API_BASE_URL
+API_BASE_URLS = os.getenv("API_BASE_URLS", "")
+# 首字节时间（TTFB）EWMA 的平滑系数，越大越偏向最近的样本
+UPSTREAM_EWMA_ALPHA = float(os.getenv("UPSTREAM_EWMA_ALPHA", "0.3"))
+
+# ===== 上游连接池配置 =====
+# 最大连接数 / 最大空闲保活连接数 / 空闲连接保活时间（秒）
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+# 是否启用 HTTP/2 多路复用（需要安装 h2，未安装时自动回退到 HTTP/1.1）
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "false").lower() in ("true", "1", "yes")
+# 启动时预热的连接数，0 表示不预热（建议不超过 UPSTREAM_MAX_KEEPALIVE_CONNECTIONS）
+UPSTREAM_PREWARM_CONNECTIONS = int(os.getenv("UPSTREAM_PREWARM_CONNECTIONS", "0"))
+
+# 上游超时配置（秒，0 表示不限制）
+# 连接超时：TCP/TLS 建连；连接池超时：等待空闲连接；写超时：发送请求体
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "10"))
+UPSTREAM_POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "30"))
+UPSTREAM_WRITE_TIMEOUT = float(os.getenv("UPSTREAM_WRITE_TIMEOUT", "60"))
+# 首字节超时：请求发送完毕到收到响应头（非流式请求需等待完整生成，默认较长）
+UPSTREAM_FIRST_BYTE_TIMEOUT = float(os.getenv("UPSTREAM_FIRST_BYTE_TIMEOUT", "300"))
+# 空闲超时：响应流相邻两个数据块之间的最长间隔，超时后中断卡住的 SSE 流
+UPSTREAM_IDLE_TIMEOUT = float(os.getenv("UPSTREAM_IDLE_TIMEOUT", "90"))
+# 按路径覆盖超时（JSON，fnmatch 通配，按顺序首个匹配生效），例如:
+# {"v1/messages*": {"first_byte": 600, "idle": 120}, "v1/models": {"first_byte": 10}}
+UPSTREAM_TIMEOUT_RULES = os.getenv("UPSTREAM_TIMEOUT_RULES", "")
+
+# ===== 上游重试与对冲配置 =====
+# 在尚未向客户端返回任何字节前，对连接失败、可重试状态码等错误自动重试的最大次数，0 表示不重试
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+# 触发重试的上游状态码
+UPSTREAM_RETRY_STATUS_CODES = os.getenv("UPSTREAM_RETRY_STATUS_CODES", "502,503,529")
+# 重试退避：第 n 次重试等待 random(0, min(MAX, BASE * 2^(n-1))) 秒（full jitter）
+UPSTREAM_RETRY_BACKOFF_BASE = float(os.getenv("UPSTREAM_RETRY_BACKOFF_BASE", "0.2"))
+UPSTREAM_RETRY_BACKOFF_MAX = float(os.getenv("UPSTREAM_RETRY_BACKOFF_MAX", "2"))
+# 重试预算：最近 10 秒内重试（含对冲）次数不超过 请求数 × RATIO + MIN_PER_SECOND × 10，防止重试风暴
+UPSTREAM_RETRY_BUDGET_RATIO = float(os.getenv("UPSTREAM_RETRY_BUDGET_RATIO", "0.2"))
+UPSTREAM_RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("UPSTREAM_RETRY_BUDGET_MIN_PER_SECOND", "1"))
+# 对冲请求：匹配的路径（逗号分隔，fnmatch 通配，仅对无请求体的请求生效）在 DELAY 秒内未返回响应头时，
+# 向另一个上游并发发送副本，取先返回者；为空表示不启用
+UPSTREAM_HEDGE_PATHS = os.getenv("UPSTREAM_HEDGE_PATHS", "")
+UPSTREAM_HEDGE_DELAY = float(os.getenv("UPSTREAM_HEDGE_DELAY", "1"))
+
+# ===== 上游熔断配置 =====
+# 每个上游独立熔断：WINDOW 秒内请求数不少于 MIN_REQUESTS 且失败（5xx/超时/连接错误）比例达到 FAILURE_RATE 时熔断，
+# 熔断 OPEN_SECONDS 秒内直接返回 503；之后半开，放行 HALF_OPEN_PROBES 个探测请求，全部成功则恢复
+UPSTREAM_BREAKER_ENABLED = os.getenv("UPSTREAM_BREAKER_ENABLED", "true").lower() in ("true", "1", "yes")
+UPSTREAM_BREAKER_FAILURE_RATE = float(os.getenv("UPSTREAM_BREAKER_FAILURE_RATE", "0.5"))
+UPSTREAM_BREAKER_MIN_REQUESTS = int(os.getenv("UPSTREAM_BREAKER_MIN_REQUESTS", "20"))
+UPSTREAM_BREAKER_WINDOW = int(os.getenv("UPSTREAM_BREAKER_WINDOW", "30"))
+UPSTREAM_BREAKER_OPEN_SECONDS = float(os.getenv("UPSTREAM_BREAKER_OPEN_SECONDS", "30"))
+UPSTREAM_BREAKER_HALF_OPEN_PROBES = int(os.getenv("UPSTREAM_BREAKER_HALF_OPEN_PROBES", "3"))
+
+# ===== 并发限制配置 =====
+# 同时进行的上游请求上限（含流式响应的整个传输过程），0 表示不限制
+CONCURRENCY_LIMIT = int(os.getenv("CONCURRENCY_LIMIT", "0"))
+# 达到上限后排队等待的请求数上限，队列满时直接返回 429
+CONCURRENCY_QUEUE_SIZE = int(os.getenv("CONCURRENCY_QUEUE_SIZE", "100"))
+# 排队等待的最长时间（秒），超时返回 503
+CONCURRENCY_QUEUE_TIMEOUT = float(os.getenv("CONCURRENCY_QUEUE_TIMEOUT", "10"))
+# 自适应并发上限（AIMD）：上游 TTFB 超过基线的 TOLERANCE 倍或请求失败（5xx/超时）时上限乘以 BACKOFF_RATIO，
+# 否则在并发接近上限时每个成功请求增加 1/上限（约每轮加 1）；上限在 [MIN_LIMIT, MAX_LIMIT] 之间调整，
+# 初始值为 CONCURRENCY_LIMIT（为 0 时取 MAX_LIMIT）
+CONCURRENCY_ADAPTIVE = os.getenv("CONCURRENCY_ADAPTIVE", "false").lower() in ("true", "1", "yes")
+CONCURRENCY_MIN_LIMIT = int(os.getenv("CONCURRENCY_MIN_LIMIT", "4"))
+CONCURRENCY_MAX_LIMIT = int(os.getenv("CONCURRENCY_MAX_LIMIT", "200"))
+CONCURRENCY_LATENCY_TOLERANCE = float(os.getenv("CONCURRENCY_LATENCY_TOLERANCE", "3"))
+CONCURRENCY_BACKOFF_RATIO = float(os.getenv("CONCURRENCY_BACKOFF_RATIO", "0.9"))
+
+# ===== 按客户端限流配置 =====
+# 客户端按 Authorization / x-api-key 的哈希区分，没有鉴权头时按客户端 IP 区分
+# 每个客户端每秒请求数（令牌桶补充速率），0 表示不限制；BURST 为令牌桶容量（允许的突发请求数）
+CLIENT_RATE_LIMIT_RPS = float(os.getenv("CLIENT_RATE_LIMIT_RPS", "0"))
+CLIENT_RATE_LIMIT_BURST = int(os.getenv("CLIENT_RATE_LIMIT_BURST", "20"))
+# 每个客户端同时进行的请求（含流式响应）上限，0 表示不限制
+CLIENT_MAX_CONCURRENT = int(os.getenv("CLIENT_MAX_CONCURRENT", "0"))
+# 空闲超过该秒数的客户端状态被清除 / 最多跟踪的客户端数
+CLIENT_IDLE_TTL = float(os.getenv("CLIENT_IDLE_TTL", "600"))
+CLIENT_MAX_TRACKED = int(os.getenv("CLIENT_MAX_TRACKED", "10000"))
+
+# ===== 响应缓存配置 =====
+# 缓存 GET 响应的路径（逗号分隔，fnmatch 通配），为空表示不启用，例如: v1/models,v1/models/*
+# 缓存键包含查询参数与鉴权头的哈希，不同 API Key 之间不会共享缓存
+RESPONSE_CACHE_PATHS = os.getenv("RESPONSE_CACHE_PATHS", "")
+# 缓存条目存活时间（秒）/ 最大条目数 / 单个响应体的最大缓存字节数
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "60"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+RESPONSE_CACHE_MAX_BODY = int(os.getenv("RESPONSE_CACHE_MAX_BODY", str(1024 * 1024)))
+
 # System prompt 替换配置
 # 设置为字符串以替换请求体中 system 数组的第一个元素的 text 内容
 # 设置为 None 则保持原样不修改
@@ -27,6 +120,11 @@ SYSTEM_PROMPT_REPLACEMENT = os.getenv("SYSTEM_PROMPT_REPLACEMENT")  # 例如: "
 # 通过环境变量 SYSTEM_PROMPT_BLOCK_INSERT_IF_NOT_EXIST 配置，默认为 false
 SYSTEM_PROMPT_BLOCK_INSERT_IF_NOT_EXIST = os.getenv("SYSTEM_PROMPT_BLOCK_INSERT_IF_NOT_EXIST", "false").lower() in ("true", "1", "yes")
 
+# System prompt 改写结果缓存容量
+# 以 system[0].text 的哈希为键缓存改写结果，重复的 prompt 无需再次判断和序列化
+# 通过环境变量 SYSTEM_PROMPT_CACHE_SIZE 配置，默认 256，设置为 0 禁用缓存
+SYSTEM_PROMPT_CACHE_SIZE = int(os.getenv("SYSTEM_PROMPT_CACHE_SIZE", "256"))
+
 # 关键字常量定义
 # 用于判断是否需要执行替换操作
 CLAUDE_CODE_KEYWORD = "Claude Code"
@@ -34,9 +132,59 @@ CLAUDE_CODE_KEYWORD = "Claude Code"
 # 调试模式配置
 DEBUG_MODE = os.getenv("DEBUG_MODE", "false").lower() in ("true", "1", "yes")
 
+# 日志配置
+# 日志级别：DEBUG / INFO / WARNING / ERROR，未设置时 DEBUG_MODE=true 对应 DEBUG，否则为 INFO
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG" if DEBUG_MODE else "INFO").upper()
+# 日志格式：text（便于阅读）或 json（结构化，便于日志平台采集）
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# 按分类采样（仅作用于 WARNING 以下级别），格式："proxy=0.1,system_prompt=0.5"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+# 日志队列容量，队列满时新日志被丢弃并计数
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
 # 服务端口配置
 PORT = int(os.getenv("PORT", "8088"))
 
+# 多 worker 部署配置
+# WORKERS > 1 时由 uvicorn 启动多个 worker 进程，请求统计（计数器、延迟直方图、每分钟统计）
+# 写入共享内存段并在查询时汇总；并发限制、客户端限流、熔断器与响应缓存仍按 worker 独立
+WORKERS = max(1, int(os.getenv("WORKERS", "1")))
+# 共享统计文件路径，留空时使用 /dev/shm/anyrouter-stats-{PORT}.mmap（不存在 /dev/shm 时使用临时目录）
+SHARED_STATS_PATH = os.getenv("SHARED_STATS_PATH", "")
+# 统计事件批量应用间隔（秒）：请求路径只把统计事件放入队列，由后台任务按此间隔批量写入统计
+# （查询统计时会先应用剩余事件，不影响数据的实时性）
+STATS_FLUSH_INTERVAL = max(0.01, float(os.getenv("STATS_FLUSH_INTERVAL", "0.1")))
+# 保留的最近请求明细条数（列式存储，含 request_id 索引每条约 270 字节，10 万条约 27MB）
+RECENT_REQUESTS_SIZE = max(1, int(os.getenv("RECENT_REQUESTS_SIZE", "10000")))
+
+# 入站服务配置（uvicorn）
+# 事件循环：auto（可用时使用 uvloop）/ uvloop / asyncio
+SERVER_LOOP = os.getenv("SERVER_LOOP", "auto").lower()
+# HTTP 解析器：auto（可用时使用 httptools）/ httptools / h11
+SERVER_HTTP = os.getenv("SERVER_HTTP", "auto").lower()
+# 监听队列长度（listen backlog），突发连接较多时调大，实际值受内核 net.core.somaxconn 限制
+SERVER_BACKLOG = int(os.getenv("SERVER_BACKLOG", "2048"))
+# 客户端 Keep-Alive 空闲超时（秒），位于负载均衡之后时应大于负载均衡的空闲超时
+SERVER_KEEP_ALIVE_TIMEOUT = int(os.getenv("SERVER_KEEP_ALIVE_TIMEOUT", "5"))
+# 每个 worker 同时处理的连接/请求上限，超出时直接返回 503（0 表示不限制）；
+# 与 CONCURRENCY_LIMIT 不同，不排队，仅作为防止 worker 过载的最后一道保护
+SERVER_LIMIT_CONCURRENCY = int(os.getenv("SERVER_LIMIT_CONCURRENCY", "0"))
+# 多 worker 时每个 worker 以 SO_REUSEPORT 绑定各自的监听 socket，由内核在 worker 间均衡分配连接
+# （默认共享同一个 socket，繁忙的 worker 可能抢到更多连接）；仅 Linux 等支持 SO_REUSEPORT 的平台生效
+SERVER_REUSE_PORT = os.getenv("SERVER_REUSE_PORT", "false").lower() in ("true", "1", "yes")
+# 停止服务时等待进行中请求结束的最长秒数（流式响应可能持续较久，0 表示一直等待）
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))
+
+# 请求体流式转发配置
+# 启用时，不需要改写请求体的路由直接将 request.stream() 透传给上游，不再整体缓冲到内存
+# 通过环境变量 REQUEST_BODY_STREAMING 配置，默认为 true
+REQUEST_BODY_STREAMING = os.getenv("REQUEST_BODY_STREAMING", "true").lower() in ("true", "1", "yes")
+
+# 压缩透传：转发客户端的 Accept-Encoding，并原样转发上游的压缩响应（保留 Content-Encoding）
+# 关闭时强制 Accept-Encoding: identity，由上游返回未压缩内容
+# 通过环境变量 COMPRESSION_PASSTHROUGH 配置，默认为 false
+COMPRESSION_PASSTHROUGH = os.getenv("COMPRESSION_PASSTHROUGH", "false").lower() in ("true", "1", "yes")
+
 # Dashboard 配置
 # 是否启用 Web 管理面板
 ENABLE_DASHBOARD = os.getenv("ENABLE_DASHBOARD", "false").lower() in ("true", "1", "yes")
@@ -56,6 +204,15 @@ HOP_BY_HOP_HEADERS = {
 }
 
 
+# 可热更新的配置文件（修改后由后台任务自动重新加载，见 services/runtime_config）
+HEADERS_FILE = "env/.env.headers.json"
+HEADER_RULES_FILE = "env/.env.header-rules.json"
+# 覆盖 System Prompt 与上游配置的环境变量（管理面板修改后写入此文件）
+RUNTIME_CONFIG_FILE = "env/.env.runtime.json"
+# 配置文件轮询间隔（秒），0 表示不自动重新加载
+CONFIG_WATCH_INTERVAL = float(os.getenv("CONFIG_WATCH_INTERVAL", "2"))
+
+
 def load_custom_headers() -> dict:
     """
     从 env/.env.headers.json 文件加载自定义请求头配置
@@ -63,7 +220,7 @@ def load_custom_headers() -> dict:
     Returns:
         dict: 自定义请求头字典，如果加载失败则返回空字典 {}
     """
-    headers_file = "env/.env.headers.json"
+    headers_file = HEADERS_FILE
 
     # 检查文件是否存在
     if not os.path.exists(headers_file):
@@ -97,5 +254,62 @@ def load_custom_headers() -> dict:
         return {}
 
 
-# 加载自定义请求头
-CUSTOM_HEADERS = load_custom_headers()
+
+def load_header_rules() -> list:
+    """
+    从 env/.env.header-rules.json 文件加载请求头改写规则（drop / set / append / rename，可按路径生效）
+
+    Returns:
+        list: 规则列表（由 services/header_rules 校验与编译），如果加载失败则返回空列表 []
+    """
+    rules_file = HEADER_RULES_FILE
+
+    if not os.path.exists(rules_file):
+        return []
+
+    try:
+        with open(rules_file, 'r', encoding='utf-8') as f:
+            rules = json.load(f)
+
+        if not isinstance(rules, list):
+            print(f"[Header Rules] Config file content is not a list (type: {type(rules)}), using default empty list []")
+            return []
+
+        # 过滤掉注释（字符串元素或包含 __comment 的对象）
+        rules = [rule for rule in rules if isinstance(rule, dict) and "__comment" not in rule]
+        print(f"[Header Rules] Successfully loaded {len(rules)} header rules from '{rules_file}'")
+        return rules
+
+    except json.JSONDecodeError as e:
+        print(f"[Header Rules] Failed to parse JSON from '{rules_file}': {e}, using default empty list []")
+        return []
+    except Exception as e:
+        print(f"[Header Rules] Failed to load '{rules_file}': {e}, using default empty list []")
+        return []
+
+
+
+def load_runtime_overrides() -> dict:
+    """
+    从 env/.env.runtime.json 文件加载覆盖环境变量的运行时配置
+    （system_prompt_replacement / system_prompt_block_insert_if_not_exist / api_base_urls）
+
+    Returns:
+        dict: 文件中出现的配置项，如果文件不存在或加载失败则返回空字典 {}
+    """
+    if not os.path.exists(RUNTIME_CONFIG_FILE):
+        return {}
+
+    try:
+        with open(RUNTIME_CONFIG_FILE, 'r', encoding='utf-8') as f:
+            overrides = json.load(f)
+
+        if not isinstance(overrides, dict):
+            print(f"[Runtime Config] Config file content is not a dict (type: {type(overrides)}), ignoring")
+            return {}
+
+        return {k: v for k, v in overrides.items() if not k.startswith("__")}
+
+    except Exception as e:
+        print(f"[Runtime Config] Failed to load '{RUNTIME_CONFIG_FILE}': {e}, ignoring")
+        return {}
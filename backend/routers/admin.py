@@ -5,7 +5,6 @@ Admin 路由模块
 """
 
 import asyncio
-import json
 import os
 import time
 import mimetypes
@@ -22,20 +21,32 @@ from ..config import (
     DASHBOARD_API_KEY,
     TARGET_BASE_URL,
     PRESERVE_HOST,
-    SYSTEM_PROMPT_REPLACEMENT,
-    SYSTEM_PROMPT_BLOCK_INSERT_IF_NOT_EXIST,
     DEBUG_MODE,
     PORT,
-    CUSTOM_HEADERS
+    WORKERS
 )
+from ..services.proxy import system_prompt_cache
+from ..services.runtime_config import current_config, update_config as apply_config_update
+from ..services.upstream import get_pool_stats
+from ..services.balancer import upstreams, set_draining, get_upstream_stats, validate_upstreams
+from ..services.retry import get_retry_stats
+from ..services.response_cache import get_cache_stats
+from ..services.limiter import get_limiter_stats, get_limit_history
+from ..services.rate_limit import get_client_stats
+from ..utils.logger import get_logger, get_log_stats
 from ..services.stats import (
-    request_stats,
     path_stats,
-    stats_lock,
     format_bytes,
-    calculate_percentiles,
-    get_time_filtered_data
+    get_time_filtered_data,
+    get_request_totals,
+    get_response_cache_summary,
+    get_token_usage_summary,
+    get_uptime_seconds,
+    get_latency_summary,
+    get_path_latency,
+    get_aggregator_stats
 )
+from ..services.shared_stats import shared_stats
 
 def _normalize_status_code(entry: dict) -> dict:
     """确保 status_code 为数字，避免前端出现 "--" 与错误颜色不一致"""
@@ -53,6 +64,7 @@ def _normalize_status_code(entry: dict) -> dict:
 
 # 创建路由器
 router = APIRouter()
+logger = get_logger("config")
 
 # Dashboard 认证方案
 security = HTTPBearer(auto_error=False)
@@ -61,6 +73,14 @@ security = HTTPBearer(auto_error=False)
 # 配置更新请求模型
 class ConfigUpdateRequest(BaseModel):
     custom_headers: Optional[dict] = None
+    system_prompt_replacement: Optional[str] = None
+    system_prompt_block_insert_if_not_exist: Optional[bool] = None
+    api_base_urls: Optional[str] = None  # "url|weight,url|weight" 格式
+
+
+# 上游状态更新请求模型
+class UpstreamUpdateRequest(BaseModel):
+    draining: bool
 
 
 async def verify_dashboard_api_key(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> bool:
@@ -139,51 +159,57 @@ async def admin_health(authenticated: bool = Depends(verify_dashboard_api_key)):
 
 @router.get("/api/admin/config")
 async def get_config(authenticated: bool = Depends(verify_dashboard_api_key)):
-    """获取当前配置信息"""
+    """获取当前配置信息（可热更新的部分来自当前配置快照）"""
+    snapshot = current_config()
     return {
         "target_base_url": TARGET_BASE_URL,
         "preserve_host": PRESERVE_HOST,
-        "system_prompt_replacement": SYSTEM_PROMPT_REPLACEMENT,
-        "system_prompt_block_insert_if_not_exist": SYSTEM_PROMPT_BLOCK_INSERT_IF_NOT_EXIST,
+        "system_prompt_replacement": snapshot.system_prompt.replacement,
+        "system_prompt_block_insert_if_not_exist": snapshot.system_prompt.insert_if_not_exist,
         "debug_mode": DEBUG_MODE,
         "port": PORT,
-        "custom_headers": CUSTOM_HEADERS,
-        "dashboard_enabled": ENABLE_DASHBOARD
+        "custom_headers": dict(snapshot.custom_headers),
+        "dashboard_enabled": ENABLE_DASHBOARD,
+        "system_prompt_cache": system_prompt_cache.stats(),
+        "upstreams": [{"name": u.name, "base_url": u.base_url, "weight": snapshot.weights[u.name]} for u in snapshot.upstreams],
+        "config_version": snapshot.version,
+        "config_loaded_at": snapshot.loaded_at,
+        "config_source": snapshot.source
     }
 
 
 @router.put("/api/admin/config")
 async def update_config(config_data: ConfigUpdateRequest, authenticated: bool = Depends(verify_dashboard_api_key)):
-    """更新配置信息（仅支持运行时动态配置）"""
+    """
+    更新配置信息（写入 env/ 下的配置文件后立即生效，无需重启）
+
+    新请求使用新的配置快照，进行中的请求继续使用开始时的快照；其他 worker 通过配置文件轮询同步
+    """
     try:
-        updated_fields = []
-
-        # 更新自定义请求头
-        if config_data.custom_headers is not None:
-            if isinstance(config_data.custom_headers, dict):
-                # 导入全局配置
-                from .. import config as config_module
-                config_module.CUSTOM_HEADERS = config_data.custom_headers
-                updated_fields.append("custom_headers")
-
-                # 保存到文件
-                headers_file = "env/.env.headers.json"
-                try:
-                    os.makedirs("env", exist_ok=True)
-                    with open(headers_file, 'w', encoding='utf-8') as f:
-                        json.dump(config_data.custom_headers, f, ensure_ascii=False, indent=2)
-                    print(f"[Config] Saved custom headers to {headers_file}")
-                except Exception as e:
-                    print(f"[Config] Failed to save custom headers: {e}")
-                    raise HTTPException(status_code=500, detail=f"保存配置失败: {e}")
-            else:
-                raise HTTPException(status_code=400, detail="custom_headers 必须是字典类型")
-
-        # 注意：System Prompt 等核心配置需要环境变量修改，这里仅返回说明
+        # 只处理请求中显式给出的字段（system_prompt_replacement 可以为 null，表示关闭替换）
+        changes = {field: getattr(config_data, field) for field in config_data.model_fields_set}
+        if "custom_headers" in changes and not isinstance(changes["custom_headers"], dict):
+            raise HTTPException(status_code=400, detail="custom_headers 必须是字典类型")
+        if "api_base_urls" in changes:
+            # 先校验再写入配置文件，避免无效的上游地址被持久化
+            try:
+                if changes["api_base_urls"] is None:
+                    raise ValueError("must be a string")
+                validate_upstreams(changes["api_base_urls"])
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"api_base_urls 无效: {e}")
+
+        try:
+            snapshot = apply_config_update(changes)
+        except OSError as e:
+            logger.error("Failed to save config", error=str(e))
+            raise HTTPException(status_code=500, detail=f"保存配置失败: {e}")
+
         return {
             "success": True,
-            "updated_fields": updated_fields,
-            "message": "配置更新成功。注意：某些核心配置需要重启服务后生效。",
+            "updated_fields": sorted(changes),
+            "config_version": snapshot.version,
+            "message": "配置更新成功，新请求立即使用新配置，进行中的请求不受影响。",
             "current_config": await get_config(authenticated)
         }
 
@@ -200,51 +226,56 @@ async def get_stats(
     end_time: Optional[float] = None,
     limit: Optional[int] = 100
 ):
-    """获取系统统计信息"""
+    """
+    获取系统统计信息
+
+    汇总数据（请求数、成功率、字节数、延迟分布、每分钟统计）来自共享内存，包含所有 worker；
+    时间序列按范围选择秒级 / 分钟级 / 小时级分辨率（time_series.resolution）；查询范围内的延迟分布
+    最多覆盖最近 48 小时，performance.lifetime 为统计起始以来的分布。
+    top_paths（含各路径的延迟分布）与 recent_requests 为响应本次查询的 worker 的明细
+    """
     try:
-        filtered_requests, filtered_errors, filtered_time_series = await get_time_filtered_data(start_time, end_time)
-        normalized_requests = [_normalize_status_code(dict(req)) for req in filtered_requests]
-
-        # 计算基本统计
-        total_filtered_requests = len(normalized_requests)
-        successful_filtered_requests = len([
-            r for r in normalized_requests
-            if (
-                (r.get("status_code") is not None and r.get("status_code", 0) < 400) or
-                (r.get("status_code") is None and r.get("status") not in ("error", "pending"))
-            )
-        ])
-        error_filtered_requests = len([
-            r for r in normalized_requests
-            if (
-                (r.get("status_code") is not None and r.get("status_code", 0) >= 400) or
-                r.get("status") == "error"
-            )
-        ])
-
-        # 计算响应时间统计
-        response_times = [r["response_time"] * 1000 for r in normalized_requests if r["response_time"] > 0]  # 转换为毫秒
-        response_time_stats = calculate_percentiles(response_times, [50, 95, 99])
+        range_end = end_time or time.time()
+        range_start = start_time or (range_end - 3600)
+        filtered_requests, filtered_errors, filtered_time_series = await get_time_filtered_data(range_start, range_end)
+        # 只为返回的最新 limit 条记录生成 dict（tail 返回新对象，可直接修改）
+        normalized_requests = [_normalize_status_code(req) for req in filtered_requests.tail(limit)]
+
+        # 所有 worker 在范围内的请求数、成功数、错误数与响应字节数（来自所选分辨率的时间序列）
+        range_totals = filtered_time_series["totals"]
+        total_filtered_requests = range_totals["requests"]
+        successful_filtered_requests = range_totals["successes"]
+        error_filtered_requests = range_totals["errors"]
+        total_bytes_sent = range_totals["bytes"]
+
+        # 延迟分布（响应头延迟，以及流式阶段的首字节、首个内容增量、完整流耗时、最大数据块间隔）
+        latency = {name: get_latency_summary(name, range_start, range_end) for name in (
+            "response_time", "first_byte_time", "first_token_time", "duration", "chunk_gap_max"
+        )}
+
+        def timing_percentiles(name: str) -> dict:
+            return {key: latency[name][key] for key in ("p50", "p95", "p99", "p999")}
 
         # 计算QPS（每秒请求数）
-        time_range = (end_time or time.time()) - (start_time or (time.time() - 3600))
+        time_range = range_end - range_start
         qps = total_filtered_requests / time_range if time_range > 0 else 0
-
-        # 计算总字节数
-        total_bytes_sent = sum(r.get("bytes", 0) for r in normalized_requests)
+        totals = get_request_totals()
 
         # 获取路径统计
         path_stats_filtered = {}
-        async with stats_lock:
-            for path, stats in path_stats.items():
-                if stats["count"] > 0:  # 只显示有请求的路径
-                    path_stats_filtered[path] = {
-                        "count": stats["count"],
-                        "bytes": stats["bytes"],
-                        "errors": stats["errors"],
-                        "avg_response_time": round(stats["avg_response_time"] * 1000, 2),  # 毫秒
-                        "success_rate": (stats["count"] - stats["errors"]) / stats["count"] if stats["count"] > 0 else 1.0
-                    }
+        # 事件已在 get_time_filtered_data 中应用，读取过程中没有 await，无需加锁
+        for path, stats in path_stats.items():
+            if stats["count"] > 0:  # 只显示有请求的路径
+                path_stats_filtered[path] = {
+                    "count": stats["count"],
+                    "bytes": stats["bytes"],
+                    "errors": stats["errors"],
+                    "avg_response_time": round(stats["avg_response_time"] * 1000, 2),  # 毫秒
+                    "avg_duration": round(stats["total_duration"] / stats["duration_count"] * 1000, 2) if stats["duration_count"] else None,
+                    "avg_first_token_time": round(stats["total_first_token_time"] / stats["first_token_count"] * 1000, 2) if stats["first_token_count"] else None,
+                    "success_rate": (stats["count"] - stats["errors"]) / stats["count"] if stats["count"] > 0 else 1.0,
+                    "latency_ms": get_path_latency(path)
+                }
 
         # 按请求数排序路径
         top_paths = sorted(path_stats_filtered.items(), key=lambda x: x[1]["count"], reverse=True)[:10]
@@ -255,28 +286,94 @@ async def get_stats(
                 "successful_requests": successful_filtered_requests,
                 "failed_requests": error_filtered_requests,
                 "success_rate": successful_filtered_requests / total_filtered_requests if total_filtered_requests > 0 else 1.0,
-                "avg_response_time": sum(response_times) / len(response_times) if response_times else 0,
+                "avg_response_time": latency["response_time"]["avg"],
                 "requests_per_second": qps,
                 "total_bytes_sent": total_bytes_sent,
                 "total_bytes_sent_formatted": format_bytes(total_bytes_sent),
-                "uptime_seconds": time.time() - request_stats["start_time"]
+                "uptime_seconds": get_uptime_seconds()
             },
             "performance": {
-                "response_time_ms": {
-                    "p50": response_time_stats.get(50, 0),
-                    "p95": response_time_stats.get(95, 0),
-                    "p99": response_time_stats.get(99, 0)
+                "response_time_ms": timing_percentiles("response_time"),
+                "first_byte_ms": timing_percentiles("first_byte_time"),
+                "first_token_ms": timing_percentiles("first_token_time"),
+                "duration_ms": timing_percentiles("duration"),
+                "chunk_gap_max_ms": timing_percentiles("chunk_gap_max"),
+                # 统计起始以来（不限于查询范围）的分布
+                "lifetime": {
+                    "response_time_ms": get_latency_summary("response_time"),
+                    "first_token_ms": get_latency_summary("first_token_time"),
+                    "duration_ms": get_latency_summary("duration")
                 }
             },
             "time_series": filtered_time_series,
             "top_paths": dict(top_paths),
-            "recent_requests": normalized_requests[-limit:] if limit > 0 else normalized_requests
+            "upstream_pool": get_pool_stats(),
+            "upstreams": get_upstream_stats(),
+            "retries": get_retry_stats(),
+            "response_cache": {**get_response_cache_summary(totals), "store": get_cache_stats()},
+            "token_usage": get_token_usage_summary(totals),
+            "error_types": totals["errors_by_type"],
+            "workers": {
+                "configured": WORKERS,
+                "shared": shared_stats.path is not None,
+                "current_pid": os.getpid(),
+                "slots": shared_stats.workers()
+            },
+            "concurrency": get_limiter_stats(),
+            "clients": get_client_stats(),
+            "logging": get_log_stats(),
+            "stats_pipeline": get_aggregator_stats(),
+            "recent_requests": normalized_requests
         }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取统计数据失败: {str(e)}")
 
 
+@router.get("/api/admin/upstreams")
+async def get_upstreams(authenticated: bool = Depends(verify_dashboard_api_key)):
+    """获取各上游的负载、延迟与错误统计"""
+    return {"upstreams": get_upstream_stats()}
+
+
+@router.get("/api/admin/circuit-breakers")
+async def get_circuit_breakers(authenticated: bool = Depends(verify_dashboard_api_key)):
+    """获取各上游熔断器的状态、滚动窗口失败率与状态转换记录"""
+    return {
+        "circuit_breakers": [
+            {
+                "upstream": u.name,
+                **u.breaker.stats(),
+                "transitions": list(u.breaker.transitions)
+            }
+            for u in upstreams
+        ]
+    }
+
+
+@router.get("/api/admin/concurrency")
+async def get_concurrency(authenticated: bool = Depends(verify_dashboard_api_key)):
+    """获取并发限制状态与自适应并发上限的调整历史（用于压测时检查上限是否收敛）"""
+    return {
+        **get_limiter_stats(),
+        "history": get_limit_history()
+    }
+
+
+@router.get("/api/admin/clients")
+async def get_clients(authenticated: bool = Depends(verify_dashboard_api_key), limit: int = 100):
+    """获取按客户端的请求数、进行中请求数与限流拒绝次数（客户端标识为鉴权头哈希或 IP）"""
+    return get_client_stats(limit)
+
+
+@router.put("/api/admin/upstreams/{name}")
+async def update_upstream(name: str, update: UpstreamUpdateRequest, authenticated: bool = Depends(verify_dashboard_api_key)):
+    """设置上游摘流状态（摘流后不再分配新请求，进行中的请求正常完成）"""
+    if not set_draining(name, update.draining):
+        raise HTTPException(status_code=404, detail=f"上游不存在: {name}")
+    return {"success": True, "upstreams": get_upstream_stats()}
+
+
 @router.get("/api/admin/errors")
 async def get_errors(
     authenticated: bool = Depends(verify_dashboard_api_key),
@@ -307,6 +404,7 @@ async def get_errors(
                 "request_id": error["request_id"],
                 "path": error["path"],
                 "error": error["error"],
+                "error_type": error.get("error_type"),
                 "timestamp": error["timestamp"],
                 "formatted_time": datetime.fromtimestamp(error["timestamp"]).strftime("%Y-%m-%d %H:%M:%S"),
                 "response_time": round(error["response_time"] * 1000, 2),  # 毫秒
@@ -315,11 +413,14 @@ async def get_errors(
 
         # 计算错误统计
         error_by_path = {}
+        error_by_type = {}
         for error in filtered_errors:
             path = error["path"]
             if path not in error_by_path:
                 error_by_path[path] = 0
             error_by_path[path] += 1
+            error_type = error.get("error_type") or "unknown"
+            error_by_type[error_type] = error_by_type.get(error_type, 0) + 1
 
         total_requests = len(filtered_requests)
         error_rate = len(filtered_errors) / total_requests if total_requests > 0 else 0
@@ -336,7 +437,8 @@ async def get_errors(
                 "total_errors": total_errors,
                 "total_requests": total_requests,
                 "error_rate": error_rate,
-                "errors_by_path": dict(sorted(error_by_path.items(), key=lambda x: x[1], reverse=True)[:10])
+                "errors_by_path": dict(sorted(error_by_path.items(), key=lambda x: x[1], reverse=True)[:10]),
+                "errors_by_type": dict(sorted(error_by_type.items(), key=lambda x: x[1], reverse=True))
             }
         }
 
@@ -0,0 +1,132 @@
+"""
+服务启动模块
+
+按环境变量配置 uvicorn 的事件循环、HTTP 解析器、worker 数、监听队列长度、Keep-Alive 超时与并发上限，
+启动前输出生效的配置；启用 SERVER_REUSE_PORT 时每个 worker 以 SO_REUSEPORT 绑定独立的监听 socket
+"""
+
+import importlib.util
+import platform
+import socket
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+from .config import (
+    PORT,
+    DEBUG_MODE,
+    WORKERS,
+    SERVER_LOOP,
+    SERVER_HTTP,
+    SERVER_BACKLOG,
+    SERVER_KEEP_ALIVE_TIMEOUT,
+    SERVER_LIMIT_CONCURRENCY,
+    SERVER_REUSE_PORT,
+    SERVER_GRACEFUL_TIMEOUT
+)
+
+APP = "backend.app:app"
+HOST = "0.0.0.0"
+
+
+def resolve_loop(loop: str) -> str:
+    """auto 时与 uvicorn 的选择一致：已安装 uvloop 且不是 Windows / PyPy 时使用 uvloop"""
+    if loop != "auto":
+        return loop
+    if platform.system() == "Windows" or platform.python_implementation() == "PyPy":
+        return "asyncio"
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+
+def resolve_http(http: str) -> str:
+    """auto 时已安装 httptools 则使用 httptools，否则使用 h11"""
+    if http != "auto":
+        return http
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+
+def reuse_port_supported() -> bool:
+    return hasattr(socket, "SO_REUSEPORT")
+
+
+def server_options() -> dict:
+    """根据环境变量生成 uvicorn 参数（开发模式热重载只支持单 worker）"""
+    return {
+        "host": HOST,
+        "port": PORT,
+        "loop": resolve_loop(SERVER_LOOP),
+        "http": resolve_http(SERVER_HTTP),
+        "workers": WORKERS,
+        "backlog": SERVER_BACKLOG,
+        "timeout_keep_alive": SERVER_KEEP_ALIVE_TIMEOUT,
+        "limit_concurrency": SERVER_LIMIT_CONCURRENCY or None,
+        "timeout_graceful_shutdown": SERVER_GRACEFUL_TIMEOUT or None,
+        "reload": DEBUG_MODE and WORKERS == 1
+    }
+
+
+def bind_reuse_port(host: str, port: int) -> socket.socket:
+    """绑定设置了 SO_REUSEPORT 的监听 socket（多个进程可绑定同一端口，由内核分配连接）"""
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.set_inheritable(True)
+    return sock
+
+
+class ReusePortWorker:
+    """在 worker 进程内绑定独立的 SO_REUSEPORT socket 后启动服务（由 uvicorn 的多进程管理器拉起与重启）"""
+
+    def __init__(self, config: uvicorn.Config):
+        self.config = config
+
+    def run(self, sockets: list | None = None):
+        sock = bind_reuse_port(self.config.host, self.config.port)
+        uvicorn.Server(self.config).run(sockets=[sock])
+
+
+def print_startup_report(config: uvicorn.Config, reuse_port: bool):
+    """输出生效的入站服务配置"""
+    print("=" * 60)
+    print("Server Configuration:")
+    print(f"  Listen: {config.host}:{config.port}")
+    print(f"  Workers: {config.workers}")
+    print(f"  Event Loop: {config.loop} (SERVER_LOOP={SERVER_LOOP})")
+    print(f"  HTTP Parser: {config.http} (SERVER_HTTP={SERVER_HTTP})")
+    print(f"  Listen Backlog: {config.backlog}")
+    print(f"  Keep-Alive Timeout: {config.timeout_keep_alive}s")
+    print(f"  Limit Concurrency: {config.limit_concurrency or 'unlimited'} per worker")
+    print(f"  Graceful Shutdown Timeout: {f'{config.timeout_graceful_shutdown}s' if config.timeout_graceful_shutdown else 'unlimited'}")
+    print(f"  SO_REUSEPORT: {reuse_port}" + (" (not supported on this platform)" if SERVER_REUSE_PORT and not reuse_port_supported() else ""))
+    print(f"  Hot Reload: {config.reload}")
+    print("=" * 60)
+
+
+def main():
+    from .services.shared_stats import shared_stats
+    # 清空上次运行遗留的共享统计，worker 启动后各自认领槽位
+    shared_stats.reset()
+
+    options = server_options()
+    # 注意：使用模块路径而非文件路径，以支持相对导入
+    config = uvicorn.Config(APP, **options)
+    reuse_port = SERVER_REUSE_PORT and reuse_port_supported() and not config.reload
+    print_startup_report(config, reuse_port)
+
+    if not reuse_port:
+        uvicorn.run(APP, **options)
+        return
+
+    worker = ReusePortWorker(config)
+    try:
+        if config.workers > 1:
+            Multiprocess(config, target=worker.run, sockets=[]).run()
+        else:
+            worker.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+上游负载均衡模块
+
+管理多个兼容的上游地址，按 "首字节时间 EWMA × (进行中请求数 + 1) / 权重" 选择负载最低的上游，
+支持权重（属于配置快照，不保存在上游对象上）与摘流（draining：不再分配新请求，进行中的请求正常完成），跳过已熔断的上游，并按上游统计延迟与错误
+"""
+
+import random
+import time
+from types import MappingProxyType
+from urllib.parse import urlparse
+
+from ..config import TARGET_BASE_URL, API_BASE_URLS, UPSTREAM_EWMA_ALPHA
+from ..utils.logger import get_logger
+from .circuit_breaker import CircuitBreaker
+from ..utils.sketch import LatencySketch
+
+logger = get_logger("balancer")
+
+# 请求失败时计入 EWMA 的惩罚样本（秒），使失败的上游在一段时间内分到更少的请求
+ERROR_PENALTY_SECONDS = 10.0
+
+
+class Upstream:
+    """单个上游地址及其负载、延迟统计（跨配置版本共享的运行状态；权重随配置快照保存）"""
+
+    def __init__(self, name: str, base_url: str):
+        self.name = name
+        self.base_url = base_url
+        self.host = urlparse(base_url).netloc
+        self.draining = False
+        self.ewma_ttfb = None  # 首字节时间的 EWMA（秒），尚无样本时为 None
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        # 首字节时间与请求耗时的延迟草图（固定内存，重新加载上游列表时随对象保留）
+        self.ttfb_sketch = LatencySketch()
+        self.duration_sketch = LatencySketch()
+        self.breaker = CircuitBreaker(name)
+
+    def observe_ttfb(self, ttfb: float):
+        """记录一次首字节时间样本并更新 EWMA"""
+        self.ttfb_sketch.add(ttfb)
+        self._update_ewma(ttfb)
+
+    def _update_ewma(self, sample: float):
+        if self.ewma_ttfb is None:
+            self.ewma_ttfb = sample
+        else:
+            self.ewma_ttfb += UPSTREAM_EWMA_ALPHA * (sample - self.ewma_ttfb)
+
+    def start(self) -> "UpstreamCall":
+        """开始一次请求，返回用于结束计数的句柄"""
+        self.in_flight += 1
+        self.requests += 1
+        return UpstreamCall(self, self.breaker.on_request())
+
+
+class UpstreamCall:
+    """一次上游请求的生命周期句柄，finish 可重复调用但只生效一次"""
+
+    __slots__ = ("upstream", "started", "finished", "probe", "ttfb")
+
+    def __init__(self, upstream: Upstream, probe: int = 0):
+        self.upstream = upstream
+        self.started = time.perf_counter()
+        self.finished = False
+        self.probe = probe  # 熔断半开状态下的探测请求所属阶段，普通请求为 0
+        self.ttfb = None
+
+    def first_byte(self):
+        """收到响应头时调用，记录本次请求的首字节时间"""
+        self.ttfb = time.perf_counter() - self.started
+        self.upstream.observe_ttfb(self.ttfb)
+
+    def cancel(self):
+        """
+        请求在收到响应头前被取消（如对冲请求落选）：已等待的时间是 TTFB 的下限，计入 EWMA，
+        避免从未返回过响应的上游一直按"未测量"被优先选择
+        """
+        if self.finished:
+            return
+        self.upstream._update_ewma(time.perf_counter() - self.started)
+        self.upstream.breaker.on_cancel(self.probe)
+        self.finish(record=False)
+
+    def finish(self, failed: bool = False, record: bool = True):
+        """结束请求：减少进行中计数，记录耗时并反馈给熔断器；失败时计入错误并惩罚 EWMA"""
+        if self.finished:
+            return
+        self.finished = True
+        upstream = self.upstream
+        upstream.in_flight -= 1
+        upstream.duration_sketch.add(time.perf_counter() - self.started)
+        if record:
+            upstream.breaker.on_result(failed, self.probe)
+        if failed:
+            upstream.errors += 1
+            upstream._update_ewma(max(ERROR_PENALTY_SECONDS, upstream.ewma_ttfb or 0))
+
+
+def _parse_entry(item: str) -> tuple:
+    """
+    解析单个 "url|weight" 条目
+
+    Raises:
+        ValueError: 地址不是 http(s) 地址，或权重不是正数
+    """
+    url, _, weight = item.partition("|")
+    url = url.strip().rstrip("/")
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.netloc:
+        raise ValueError(f"invalid upstream url {url!r}")
+    try:
+        weight = float(weight) if weight.strip() else 1.0
+    except ValueError:
+        raise ValueError(f"invalid upstream weight {weight.strip()!r}")
+    if not weight > 0:
+        raise ValueError(f"upstream weight must be positive, got {weight:g}")
+    return url, weight
+
+
+def validate_upstreams(raw: str):
+    """
+    校验上游列表配置（管理面板保存前调用）
+
+    Raises:
+        ValueError: 任一条目无效
+    """
+    for item in raw.split(","):
+        item = item.strip()
+        if item:
+            _parse_entry(item)
+
+
+def parse_upstreams(raw: str, default_url: str) -> list:
+    """
+    解析上游列表配置（无效的权重按 1 处理）
+
+    Args:
+        raw: "url|weight,url|weight" 格式的字符串，为空时只使用 default_url
+        default_url: 默认上游地址（API_BASE_URL）
+
+    Returns:
+        list[tuple[Upstream, float]]: (上游, 权重) 列表（名称为 host，重名时追加序号）
+    """
+    entries = []
+    for item in raw.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            entries.append(_parse_entry(item))
+        except ValueError as e:
+            url, _, _ = item.partition("|")
+            logger.warning("Invalid upstream entry, using weight 1", item=item, error=str(e))
+            entries.append((url.strip().rstrip("/"), 1.0))
+
+    if not entries:
+        entries = [(default_url.rstrip("/"), 1.0)]
+
+    result = []
+    names = set()
+    for url, weight in entries:
+        name = urlparse(url).netloc or url
+        if name in names:
+            name = f"{name}#{len(result) + 1}"
+        names.add(name)
+        result.append((Upstream(name, url), weight))
+    return result
+
+
+def _install(pairs: list):
+    """替换当前上游列表（原地替换）与权重表（整体替换，已取得的权重表不受影响）"""
+    global weights
+    upstreams[:] = [upstream for upstream, _ in pairs]
+    weights = MappingProxyType({upstream.name: weight for upstream, weight in pairs})
+
+
+upstreams = []
+# 当前配置的上游权重（上游名称 -> 权重）；配置快照持有各自版本的权重表
+weights = MappingProxyType({})
+_install(parse_upstreams(API_BASE_URLS, TARGET_BASE_URL))
+
+
+def reload_upstreams(raw: str, default_url: str) -> list:
+    """
+    按新配置替换当前上游列表与权重表（配置热更新时调用）
+
+    名称与地址都相同的上游沿用已有对象（保留 EWMA、熔断器、摘流状态与进行中计数）；
+    权重不写入上游对象，进行中的请求继续使用开始时配置快照中的权重
+
+    Returns:
+        list[tuple[Upstream, float]]: 新的 (上游, 权重) 列表
+    """
+    existing = {(u.name, u.base_url): u for u in upstreams}
+    result = []
+    for upstream, weight in parse_upstreams(raw, default_url):
+        result.append((existing.get((upstream.name, upstream.base_url), upstream), weight))
+    _install(result)
+    return result
+
+
+def _score(upstream: Upstream, weight: float, unmeasured_ttfb: float) -> float:
+    ttfb = upstream.ewma_ttfb if upstream.ewma_ttfb is not None else unmeasured_ttfb
+    return ttfb * (upstream.in_flight + 1) / weight
+
+
+def select_upstream(exclude: tuple = (), pool=None, pool_weights=None, avoid: tuple = ()) -> Upstream | None:
+    """
+    选择负载最低的上游（摘流的上游不参与选择；全部摘流时仍从全部上游中选择，避免请求失败）
+
+    Args:
+        exclude: 不能选择的上游（如对冲请求的主请求所在上游）
+        pool: 候选上游（请求开始时的配置快照中的上游列表），默认为当前上游列表
+        pool_weights: 上游名称 -> 权重（与 pool 同一配置快照），默认为当前权重表
+        avoid: 优先避开的上游（如重试时已尝试过的上游），没有其他候选时仍可选择
+
+    Returns:
+        Upstream | None: 选中的上游；所有上游均已熔断，或排除 exclude 后没有候选时返回 None
+    """
+    pool = upstreams if pool is None else pool
+    pool_weights = weights if pool_weights is None else pool_weights
+    open_circuit = [u for u in pool if not u.breaker.available()]
+    if open_circuit:
+        healthy = [u for u in pool if u not in open_circuit]
+        if not healthy:
+            for upstream in open_circuit:
+                upstream.breaker.rejected += 1
+            return None
+    else:
+        healthy = pool
+    if exclude:
+        healthy = [u for u in healthy if u not in exclude]
+        if not healthy:
+            return None
+
+    if len(healthy) == 1:
+        return healthy[0]
+
+    available = [u for u in healthy if not u.draining] or healthy
+    candidates = [u for u in available if u not in avoid] or available
+    # 尚无样本的上游按已知最低的 EWMA 计算，使其能尽快获得样本
+    measured = [u.ewma_ttfb for u in candidates if u.ewma_ttfb is not None]
+    unmeasured_ttfb = min(measured) if measured else 1.0
+    # 分数相同时随机选择，避免总是落到列表中的第一个
+    return min(candidates, key=lambda u: (_score(u, pool_weights.get(u.name, 1.0), unmeasured_ttfb), random.random()))
+
+
+def circuit_retry_after(pool=None) -> int:
+    """所有上游均已熔断时，距离最早进入半开状态的剩余秒数"""
+    pool = upstreams if pool is None else pool
+    return min((u.breaker.retry_after() for u in pool), default=0) or 1
+
+
+def get_upstream(name: str) -> Upstream | None:
+    """按名称查找上游"""
+    for upstream in upstreams:
+        if upstream.name == name:
+            return upstream
+    return None
+
+
+def set_draining(name: str, draining: bool) -> bool:
+    """
+    设置上游的摘流状态
+
+    Returns:
+        bool: 上游是否存在
+    """
+    upstream = get_upstream(name)
+    if upstream is None:
+        return False
+    upstream.draining = draining
+    logger.info("Upstream draining updated", upstream=name, draining=draining, in_flight=upstream.in_flight)
+    return True
+
+
+def get_upstream_stats() -> list:
+    """
+    获取各上游的负载与延迟统计
+
+    Returns:
+        list: 每个上游的权重、摘流状态、进行中请求数、错误率、TTFB EWMA 与 TTFB/耗时分布（当前 worker 启动以来）
+    """
+    result = []
+    for upstream in upstreams:
+        result.append({
+            "name": upstream.name,
+            "base_url": upstream.base_url,
+            "weight": weights.get(upstream.name, 1.0),
+            "draining": upstream.draining,
+            "in_flight": upstream.in_flight,
+            "requests": upstream.requests,
+            "errors": upstream.errors,
+            "error_rate": upstream.errors / upstream.requests if upstream.requests else 0.0,
+            "ewma_ttfb_ms": round(upstream.ewma_ttfb * 1000, 2) if upstream.ewma_ttfb is not None else None,
+            "ttfb_ms": upstream.ttfb_sketch.summary(),
+            "duration_ms": upstream.duration_sketch.summary(),
+            "circuit_breaker": upstream.breaker.stats()
+        })
+    return result
@@ -0,0 +1,184 @@
+"""
+熔断器模块
+
+为每个上游维护一个熔断器：滚动窗口内失败（5xx、超时、连接错误）比例超过阈值时熔断（open），
+熔断期间直接拒绝请求而不是等待超时；熔断时长结束后进入半开（half_open），
+只放行有限数量的探测请求，探测全部成功后恢复（closed），任一失败则重新熔断
+"""
+
+import time
+from collections import deque
+
+from ..config import (
+    UPSTREAM_BREAKER_ENABLED,
+    UPSTREAM_BREAKER_FAILURE_RATE,
+    UPSTREAM_BREAKER_MIN_REQUESTS,
+    UPSTREAM_BREAKER_WINDOW,
+    UPSTREAM_BREAKER_OPEN_SECONDS,
+    UPSTREAM_BREAKER_HALF_OPEN_PROBES
+)
+from ..utils.logger import get_logger
+
+logger = get_logger("circuit_breaker")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """单个上游的熔断器（仅在事件循环线程内使用，无需加锁）"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate: float = UPSTREAM_BREAKER_FAILURE_RATE,
+        min_requests: int = UPSTREAM_BREAKER_MIN_REQUESTS,
+        window: int = UPSTREAM_BREAKER_WINDOW,
+        open_seconds: float = UPSTREAM_BREAKER_OPEN_SECONDS,
+        half_open_probes: int = UPSTREAM_BREAKER_HALF_OPEN_PROBES,
+        enabled: bool = UPSTREAM_BREAKER_ENABLED
+    ):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.enabled = enabled
+
+        self.state = CLOSED
+        self.phase = 1  # 每次状态转换加一，用于识别探测请求属于哪一次半开
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        self.rejected = 0
+        self._buckets = deque()  # [秒, 请求数, 失败数]
+        self.transitions = deque(maxlen=50)
+
+    # ===== 滚动窗口 =====
+
+    def _current_bucket(self, now: float) -> list:
+        second = int(now)
+        buckets = self._buckets
+        if not buckets or buckets[-1][0] != second:
+            buckets.append([second, 0, 0])
+        while buckets[0][0] <= second - self.window:
+            buckets.popleft()
+        return buckets[-1]
+
+    def _window_totals(self) -> tuple:
+        total = failures = 0
+        for _, bucket_total, bucket_failures in self._buckets:
+            total += bucket_total
+            failures += bucket_failures
+        return total, failures
+
+    # ===== 状态转换 =====
+
+    def _transition(self, new_state: str, reason: str):
+        old_state = self.state
+        self.state = new_state
+        self.phase += 1
+        self.transitions.append({
+            "timestamp": time.time(),
+            "from": old_state,
+            "to": new_state,
+            "reason": reason
+        })
+        if new_state == OPEN:
+            self.opened_at = time.monotonic()
+            logger.warning(f"Circuit opened for upstream {self.name}", reason=reason, open_seconds=self.open_seconds)
+        else:
+            logger.info(f"Circuit {new_state} for upstream {self.name}", reason=reason)
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        if new_state == CLOSED:
+            # 恢复后重新开始统计，避免熔断前的失败立即再次触发熔断
+            self._buckets.clear()
+
+    def _refresh(self):
+        """熔断时长结束后进入半开状态"""
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN, f"open for {self.open_seconds:g}s")
+
+    def available(self) -> bool:
+        """是否允许新请求（不占用探测名额，用于选择上游）"""
+        if not self.enabled:
+            return True
+        self._refresh()
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN:
+            return self.probes_in_flight < self.half_open_probes
+        return False
+
+    def on_request(self) -> int:
+        """
+        请求开始时调用
+
+        Returns:
+            int: 半开状态下的探测请求返回当前阶段编号，普通请求返回 0
+        """
+        if self.enabled and self.state == HALF_OPEN:
+            self.probes_in_flight += 1
+            return self.phase
+        return 0
+
+    def _is_current_probe(self, probe: int) -> bool:
+        return probe != 0 and probe == self.phase and self.state == HALF_OPEN
+
+    def on_result(self, failed: bool, probe: int = 0):
+        """记录一次请求结果，按滚动窗口失败率和探测结果转换状态"""
+        if not self.enabled:
+            return
+
+        if self._is_current_probe(probe):
+            self.probes_in_flight -= 1
+            if failed:
+                self._transition(OPEN, "probe failed")
+                return
+            self.probe_successes += 1
+            if self.probe_successes >= self.half_open_probes:
+                self._transition(CLOSED, f"{self.probe_successes} probes succeeded")
+            return
+
+        if self.state != CLOSED:
+            # 熔断前已发出的请求在熔断后才返回，不再影响状态
+            return
+
+        bucket = self._current_bucket(time.monotonic())
+        bucket[1] += 1
+        if failed:
+            bucket[2] += 1
+            total, failures = self._window_totals()
+            if total >= self.min_requests and failures / total >= self.failure_rate:
+                self._transition(OPEN, f"failure rate {failures}/{total} in {self.window}s")
+
+    def on_cancel(self, probe: int = 0):
+        """请求被取消（结果未知）时释放探测名额"""
+        if self._is_current_probe(probe):
+            self.probes_in_flight -= 1
+
+    def retry_after(self) -> int:
+        """距离进入半开状态的剩余秒数（用于 Retry-After 响应头）"""
+        if self.state != OPEN:
+            return 0
+        return max(1, int(self.open_seconds - (time.monotonic() - self.opened_at) + 0.999))
+
+    def stats(self) -> dict:
+        self._refresh()
+        self._current_bucket(time.monotonic())
+        total, failures = self._window_totals()
+        return {
+            "enabled": self.enabled,
+            "state": self.state,
+            "window_requests": total,
+            "window_failures": failures,
+            "window_failure_rate": failures / total if total else 0.0,
+            "probes_in_flight": self.probes_in_flight,
+            "probe_successes": self.probe_successes,
+            "rejected": self.rejected,
+            "retry_after": self.retry_after(),
+            "transitions": list(self.transitions)[-10:]
+        }
@@ -0,0 +1,198 @@
+"""
+请求头改写规则模块
+
+转发请求头的全部处理（移除 hop-by-hop 头、Host、Accept-Encoding、自定义请求头注入与声明式改写规则）
+在配置加载时编译为按小写头名查找的改写计划，每个请求只遍历一次原始请求头；
+带路径条件的规则按 (路径, 压缩透传) 编译一次后缓存。
+头名只在查找与去重时不区分大小写，转发时保留客户端发送或配置中声明的大小写
+
+规则格式（env/.env.header-rules.json，按顺序生效）：
+    {"action": "drop", "name": "x-debug"}
+    {"action": "rename", "name": "x-old", "to": "x-new"}
+    {"action": "set", "name": "anthropic-beta", "value": "...", "path": "v1/messages*"}
+    {"action": "append", "name": "anthropic-beta", "value": "..."}
+
+处理顺序：原始请求头按 drop / rename 处理 → Host → set（自定义请求头视为最先声明的 set 规则）→ append →
+X-Forwarded-For；同一头名的多条 set 规则以最后一条为准，append 按声明顺序以 ", " 追加。
+path 为 fnmatch 模式（不含开头的 /），与超时规则一致
+"""
+
+import fnmatch
+from typing import Iterable
+
+from ..config import (
+    HOP_BY_HOP_HEADERS,
+    PRESERVE_HOST,
+    COMPRESSION_PASSTHROUGH
+)
+from ..utils.logger import get_logger
+from ..utils.lru_cache import LRUCache
+
+logger = get_logger("config")
+
+ACTIONS = ("drop", "set", "append", "rename")
+
+# 带路径条件的规则按路径编译的计划缓存条目数（路径由客户端决定，需要限制数量）
+PLAN_CACHE_SIZE = 256
+
+_DROP = object()
+
+
+class HeaderRule:
+    """一条已校验的改写规则（name / to 为配置中的头名，key / to_key 为对应的小写查找键）"""
+
+    __slots__ = ("action", "name", "key", "value", "to", "to_key", "path")
+
+    def __init__(self, action: str, name: str, value: str | None = None, to: str | None = None, path: str | None = None):
+        self.action = action
+        self.name = name
+        self.key = name.lower()
+        self.value = value
+        self.to = to or None
+        self.to_key = to.lower() if to else None
+        self.path = path
+
+    def matches(self, path: str) -> bool:
+        return self.path is None or fnmatch.fnmatchcase(path, self.path)
+
+
+def parse_rules(raw_rules: list) -> list:
+    """
+    校验规则配置，跳过无效规则
+
+    Returns:
+        list[HeaderRule]: 有效规则
+    """
+    rules = []
+    for index, raw in enumerate(raw_rules):
+        try:
+            action = raw["action"]
+            if action not in ACTIONS:
+                raise ValueError(f"unknown action {action!r}")
+            name = raw["name"]
+            if not isinstance(name, str) or not name:
+                raise ValueError("name must be a non-empty string")
+            value = raw.get("value")
+            if action in ("set", "append") and not isinstance(value, str):
+                raise ValueError("value must be a string")
+            to = raw.get("to")
+            if action == "rename" and (not isinstance(to, str) or not to):
+                raise ValueError("rename requires 'to'")
+            path = raw.get("path")
+            if path is not None and not isinstance(path, str):
+                raise ValueError("path must be a string")
+            rules.append(HeaderRule(action, name, value, to, path.lstrip("/") if path else None))
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning("Skipping invalid header rule", index=index, error=str(e))
+    return rules
+
+
+class HeaderPlan:
+    """
+    某个路径的改写计划
+
+    incoming: 原始请求头小写名 -> _DROP 或重命名后的 (小写名, 头名)；
+    sets / appends / defaults: 小写名 -> (头名, 值)
+    """
+
+    __slots__ = ("incoming", "sets", "appends", "defaults")
+
+    def __init__(self, rules: list, passthrough: bool):
+        incoming = {name: _DROP for name in HOP_BY_HOP_HEADERS}
+        # 移除 Content-Length，让 httpx 根据实际内容自动计算（请求体可能被改写）
+        incoming["content-length"] = _DROP
+        if not PRESERVE_HOST:
+            incoming["host"] = _DROP
+        sets = {}
+        defaults = {}
+        # 显式设置 Accept-Encoding，避免 httpx 默认补充 gzip, deflate, br；
+        # 压缩透传模式下使用客户端声明的编码（未声明时仍为 identity），响应原样转发给客户端解压
+        if passthrough:
+            defaults["accept-encoding"] = ("Accept-Encoding", "identity")
+        else:
+            sets["accept-encoding"] = ("Accept-Encoding", "identity")
+        appends = {}
+
+        for rule in rules:
+            if rule.action == "drop":
+                incoming[rule.key] = _DROP
+                sets.pop(rule.key, None)
+                defaults.pop(rule.key, None)
+                appends.pop(rule.key, None)
+            elif rule.action == "rename":
+                incoming[rule.key] = (rule.to_key, rule.to)
+            elif rule.action == "set":
+                sets[rule.key] = (rule.name, rule.value)
+            else:
+                name, values = appends.setdefault(rule.key, (rule.name, []))
+                values.append(rule.value)
+
+        self.incoming = incoming
+        self.sets = sets
+        self.appends = {key: (name, ", ".join(values)) for key, (name, values) in appends.items()}
+        self.defaults = defaults
+
+    def apply(self, headers: Iterable[tuple], host: str | None, client_host: str | None) -> dict:
+        """单次遍历原始请求头生成转发请求头（按小写头名查找与去重，保留原有的头名大小写）"""
+        out = {}  # 小写头名 -> (头名, 值)
+        incoming = self.incoming
+        for name, value in headers:
+            key = name.lower()
+            target = incoming.get(key)
+            if target is None:
+                out[key] = (name, value)
+            elif target is not _DROP:
+                out[target[0]] = (target[1], value)
+
+        if host:
+            out["host"] = ("Host", host)
+        if self.sets:
+            out.update(self.sets)
+        for key, entry in self.defaults.items():
+            out.setdefault(key, entry)
+        for key, (name, value) in self.appends.items():
+            existing = out.get(key)
+            out[key] = (existing[0], f"{existing[1]}, {value}") if existing else (name, value)
+        if client_host:
+            existing = out.get("x-forwarded-for")
+            out["x-forwarded-for"] = (existing[0], f"{existing[1]}, {client_host}") if existing else ("X-Forwarded-For", client_host)
+        return dict(out.values())
+
+
+class HeaderRewriter:
+    """编译后的转发请求头改写器（属于配置快照，规则变更时随快照整体替换，见 runtime_config）"""
+
+    def __init__(self, custom_headers: dict, rules: list, default_host: str | None):
+        self.custom_headers = dict(custom_headers)
+        self.declared_rules = list(rules)
+        # 自定义请求头等价于最先声明的无条件 set 规则
+        self.rules = [HeaderRule("set", k, str(v)) for k, v in custom_headers.items()] + self.declared_rules
+        self.default_host = default_host
+        self.conditional = any(rule.path is not None for rule in self.rules)
+        unconditional = [rule for rule in self.rules if rule.path is None]
+        self._base = {
+            False: HeaderPlan(unconditional, passthrough=False),
+            True: HeaderPlan(unconditional, passthrough=True)
+        }
+        self._plans = LRUCache(PLAN_CACHE_SIZE)
+
+    def plan_for(self, path: str, passthrough: bool) -> HeaderPlan:
+        if not self.conditional:
+            return self._base[passthrough]
+        key = (path, passthrough)
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = HeaderPlan([rule for rule in self.rules if rule.matches(path)], passthrough)
+            self._plans.put(key, plan)
+        return plan
+
+    def rewrite(
+        self,
+        headers: Iterable[tuple],
+        path: str = "",
+        client_host: str | None = None,
+        target_host: str | None = None,
+        passthrough: bool = COMPRESSION_PASSTHROUGH
+    ) -> dict:
+        host = None if PRESERVE_HOST else (target_host or self.default_host)
+        return self.plan_for(path, passthrough).apply(headers, host, client_host)
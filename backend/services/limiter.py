@@ -0,0 +1,287 @@
+"""
+并发限制模块
+
+限制同时进行的上游请求数：达到上限后新请求按先后顺序（FIFO）排队，
+队列满时立即拒绝（429），排队超时拒绝（503），避免突发流量占满连接池导致所有请求一起变慢；
+启用自适应模式时按上游 TTFB 与失败情况用 AIMD 调整上限
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+
+from ..config import (
+    CONCURRENCY_LIMIT,
+    CONCURRENCY_QUEUE_SIZE,
+    CONCURRENCY_QUEUE_TIMEOUT,
+    CONCURRENCY_ADAPTIVE,
+    CONCURRENCY_MIN_LIMIT,
+    CONCURRENCY_MAX_LIMIT,
+    CONCURRENCY_LATENCY_TOLERANCE,
+    CONCURRENCY_BACKOFF_RATIO
+)
+from ..utils.logger import get_logger
+from .stats import calculate_percentiles
+
+logger = get_logger("limiter")
+
+QUEUE_FULL = "queue_full"
+QUEUE_TIMEOUT = "queue_timeout"
+
+# TTFB 基线取最近 BASELINE_WINDOW 秒内的最小 TTFB（按 BASELINE_BUCKET 秒分桶），
+# 上游整体变慢时基线随窗口滚动跟上，持续过载的样本不会抬高基线
+BASELINE_WINDOW = 300
+BASELINE_BUCKET = 10
+# 两次乘性下调的最小间隔（秒）：同一轮过载产生的多个慢样本只下调一次
+DECREASE_INTERVAL = 1.0
+
+
+class LimiterRejected(Exception):
+    """请求被并发限制拒绝"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def status_code(self) -> int:
+        # 队列满是瞬时过载，客户端稍后重试即可；排队超时说明上游整体处理不过来
+        return 429 if self.reason == QUEUE_FULL else 503
+
+
+class AIMDLimit:
+    """
+    AIMD 并发上限控制器
+
+    上游 TTFB 超过基线的 tolerance 倍或请求失败视为过载，上限乘以 backoff_ratio（每秒最多一次）；
+    否则在进行中请求数达到上限一半以上时，每个成功请求让上限增加 1/上限
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, tolerance: float, backoff_ratio: float):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff_ratio = backoff_ratio
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.baseline_ttfb = None
+        self._min_buckets = deque()  # [桶编号, 桶内最小 TTFB]
+        self.last_decrease = 0.0
+        self.increases = 0
+        self.decreases = 0
+        self.history = deque(maxlen=500)  # 上限变化记录 {timestamp, limit, reason}
+        self._record(int(self.limit), "initial")
+
+    def _record(self, limit: int, reason: str):
+        self.history.append({"timestamp": time.time(), "limit": limit, "reason": reason})
+
+    def _update_baseline(self, ttfb: float, now: float):
+        bucket = int(now // BASELINE_BUCKET)
+        buckets = self._min_buckets
+        if buckets and buckets[-1][0] == bucket:
+            buckets[-1][1] = min(buckets[-1][1], ttfb)
+        else:
+            buckets.append([bucket, ttfb])
+        while buckets[0][0] <= bucket - BASELINE_WINDOW // BASELINE_BUCKET:
+            buckets.popleft()
+        self.baseline_ttfb = min(value for _, value in buckets)
+
+    def update(self, ttfb: float | None, failed: bool, in_flight: int) -> int:
+        """
+        根据一次请求结果调整上限
+
+        Args:
+            ttfb: 上游首字节时间（秒，不含排队时间），请求未收到响应头时为 None
+            failed: 请求是否失败（5xx、超时、连接错误）
+            in_flight: 当前进行中的请求数
+
+        Returns:
+            int: 调整后的并发上限
+        """
+        previous = int(self.limit)
+        now = time.monotonic()
+        reason = "failure" if failed else None
+        if ttfb is not None:
+            self._update_baseline(ttfb, now)
+            if reason is None and ttfb > self.baseline_ttfb * self.tolerance:
+                reason = f"ttfb {ttfb * 1000:.0f}ms > {self.tolerance:g}x baseline {self.baseline_ttfb * 1000:.0f}ms"
+
+        if reason is not None:
+            if now - self.last_decrease < DECREASE_INTERVAL:
+                return previous
+            self.last_decrease = now
+            self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+            self.decreases += 1
+        elif in_flight * 2 >= self.limit:
+            # 只在并发确实接近上限时增加，避免低负载时上限无限增长
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.increases += 1
+            reason = "increase"
+
+        current = int(self.limit)
+        if current != previous:
+            self._record(current, reason)
+            if current < previous:
+                logger.info("Concurrency limit decreased", limit=current, reason=reason)
+        return current
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "baseline_ttfb_ms": round(self.baseline_ttfb * 1000, 2) if self.baseline_ttfb is not None else None,
+            "tolerance": self.tolerance,
+            "backoff_ratio": self.backoff_ratio,
+            "increases": self.increases,
+            "decreases": self.decreases
+        }
+
+
+class ConcurrencyLimiter:
+    """
+    带有界 FIFO 等待队列的并发限制器（仅在事件循环线程内使用，无需加锁）
+
+    释放的名额直接交给队首的等待者，新请求不能插队；limit 可通过 set_limit 在运行时调整，
+    传入 adaptive 控制器时由 observe 反馈的请求结果自动调整
+    """
+
+    def __init__(self, limit: int, max_queue: int, queue_timeout: float, adaptive: AIMDLimit | None = None):
+        self.adaptive = adaptive
+        self.limit = int(adaptive.limit) if adaptive is not None else limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters = deque()
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = {QUEUE_FULL: 0, QUEUE_TIMEOUT: 0}
+        self.wait_times = deque(maxlen=1000)  # 最近排队请求的等待时间（秒）
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0
+
+    def _has_capacity(self) -> bool:
+        return not self.enabled or self.in_flight < self.limit
+
+    async def acquire(self) -> float:
+        """
+        获取一个名额，必要时排队等待
+
+        Returns:
+            float: 排队等待的秒数
+
+        Raises:
+            LimiterRejected: 队列已满或排队超时
+        """
+        if self._has_capacity() and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return 0.0
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected[QUEUE_FULL] += 1
+            raise LimiterRejected(QUEUE_FULL, self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        start = time.monotonic()
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await waiter
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # 名额已交给本请求，但请求在恢复执行前被取消或超时，转交给下一个等待者
+                self.release()
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, TimeoutError):
+                self.rejected[QUEUE_TIMEOUT] += 1
+                raise LimiterRejected(QUEUE_TIMEOUT, self.retry_after()) from None
+            raise
+
+        wait = time.monotonic() - start
+        self.wait_times.append(wait)
+        self.admitted += 1
+        return wait
+
+    def release(self):
+        """释放一个名额（请求结束时调用），有等待者时按 FIFO 交给队首"""
+        self.in_flight -= 1
+        self._wake()
+
+    def set_limit(self, limit: int):
+        """运行时调整并发上限，上调时立即唤醒排队的请求"""
+        self.limit = limit
+        self._wake()
+
+    def observe(self, ttfb: float | None, failed: bool):
+        """反馈一次上游请求结果（自适应模式下用于调整上限）"""
+        if self.adaptive is None:
+            return
+        limit = self.adaptive.update(ttfb, failed, self.in_flight)
+        if limit != self.limit:
+            self.set_limit(limit)
+
+    def _wake(self):
+        while self._waiters and self._has_capacity():
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            waiter.set_result(None)
+            self.in_flight += 1
+
+    def retry_after(self) -> int:
+        """建议客户端重试的秒数：最近排队请求的平均等待时间（至少 1 秒）"""
+        if not self.wait_times:
+            return 1
+        return max(1, math.ceil(sum(self.wait_times) / len(self.wait_times)))
+
+    def stats(self) -> dict:
+        wait_ms = calculate_percentiles([w * 1000 for w in self.wait_times], [50, 95, 99])
+        return {
+            "enabled": self.enabled,
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queue_depth": len(self._waiters),
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": dict(self.rejected),
+            "wait_ms": {"p50": wait_ms.get(50, 0), "p95": wait_ms.get(95, 0), "p99": wait_ms.get(99, 0)},
+            "adaptive": self.adaptive.stats() if self.adaptive is not None else None
+        }
+
+
+concurrency_limiter = ConcurrencyLimiter(
+    CONCURRENCY_LIMIT,
+    CONCURRENCY_QUEUE_SIZE,
+    CONCURRENCY_QUEUE_TIMEOUT,
+    adaptive=AIMDLimit(
+        CONCURRENCY_LIMIT or CONCURRENCY_MAX_LIMIT,
+        CONCURRENCY_MIN_LIMIT,
+        CONCURRENCY_MAX_LIMIT,
+        CONCURRENCY_LATENCY_TOLERANCE,
+        CONCURRENCY_BACKOFF_RATIO
+    ) if CONCURRENCY_ADAPTIVE else None
+)
+
+
+def get_limiter_stats() -> dict:
+    """获取并发限制状态与排队统计"""
+    return concurrency_limiter.stats()
+
+
+def get_limit_history() -> list:
+    """获取自适应并发上限的调整历史（未启用自适应时为空）"""
+    if concurrency_limiter.adaptive is None:
+        return []
+    return list(concurrency_limiter.adaptive.history)
@@ -4,59 +4,42 @@
 负责处理 HTTP 请求和响应，包括请求头过滤、请求体处理和 System Prompt 替换
 """
 
+import hashlib
 import json
 from typing import Iterable
-from urllib.parse import urlparse
 
 from ..config import (
     HOP_BY_HOP_HEADERS,
-    PRESERVE_HOST,
     SYSTEM_PROMPT_REPLACEMENT,
     SYSTEM_PROMPT_BLOCK_INSERT_IF_NOT_EXIST,
     CLAUDE_CODE_KEYWORD,
-    CUSTOM_HEADERS,
-    TARGET_BASE_URL
+    SYSTEM_PROMPT_CACHE_SIZE,
+    COMPRESSION_PASSTHROUGH
 )
+from .header_rules import HeaderRewriter
+from .runtime_config import SystemPromptSettings, current_config
+from ..utils.json_splice import SpliceError, locate_system_text
+from ..utils.logger import get_logger
+from ..utils.lru_cache import LRUCache
 
+logger = get_logger("system_prompt")
 
-def filter_request_headers(headers: Iterable[tuple]) -> dict:
-    """
-    过滤请求头，移除 hop-by-hop 头部和 Content-Length
+# System prompt 改写结果缓存：(system[0].text 原始字节的哈希, 当前配置) -> (是否插入, 拼接用的字节)
+system_prompt_cache = LRUCache(SYSTEM_PROMPT_CACHE_SIZE)
 
-    Args:
-        headers: 原始请求头（可迭代的元组列表）
 
-    Returns:
-        dict: 过滤后的请求头字典
-    """
-    out = {}
-    for k, v in headers:
-        lk = k.lower()
-        if lk in HOP_BY_HOP_HEADERS:
-            continue
-        if lk == "host" and not PRESERVE_HOST:
-            continue
-        # 移除 Content-Length，让 httpx 根据实际内容自动计算
-        # 因为我们可能会修改请求体，导致长度改变
-        if lk == "content-length":
-            continue
-        # 移除 Accept-Encoding，后续会显式设置为 identity
-        # 避免代理转发压缩内容时出现 ZlibError（客户端解压已解压内容）
-        if lk == "accept-encoding":
-            continue
-        out[k] = v
-    # 显式设置 Accept-Encoding 为 identity，强制上游返回未压缩内容
-    # 仅移除原有头部不够，httpx 会默认补充 gzip, deflate, br
-    out["Accept-Encoding"] = "identity"
-    return out
+def default_system_prompt_settings() -> SystemPromptSettings:
+    """启动时的 System Prompt 配置（未传入配置快照时使用）"""
+    return SystemPromptSettings(SYSTEM_PROMPT_REPLACEMENT, SYSTEM_PROMPT_BLOCK_INSERT_IF_NOT_EXIST)
 
 
-def filter_response_headers(headers: Iterable[tuple]) -> dict:
+def filter_response_headers(headers: Iterable[tuple], passthrough: bool = COMPRESSION_PASSTHROUGH) -> dict:
     """
     过滤响应头，移除 hop-by-hop 头部和 Content-Length
 
     Args:
         headers: 原始响应头（可迭代的元组列表）
+        passthrough: 压缩透传模式，响应体原样转发，保留 Content-Encoding
 
     Returns:
         dict: 过滤后的响应头字典
@@ -72,13 +55,83 @@ def filter_response_headers(headers: Iterable[tuple]) -> dict:
             continue
         # 移除 Content-Encoding，httpx 会自动解压 gzip/deflate
         # 保留此头部会导致客户端重复解压，引发 ZlibError
-        if lk == "content-encoding":
+        if lk == "content-encoding" and not passthrough:
             continue
         out[k] = v
     return out
 
 
-def process_request_body(body: bytes) -> bytes:
+def needs_body_rewrite(path: str, settings: SystemPromptSettings | None = None) -> bool:
+    """
+    判断该路由的请求体是否需要改写
+
+    目前仅 /v1/messages 在配置了 SYSTEM_PROMPT_REPLACEMENT 时需要替换 system prompt，
+    其余路由的请求体可以直接流式转发给上游
+
+    Args:
+        path: 请求路径（不含前导 /）
+        settings: System Prompt 配置，默认使用启动时的配置
+
+    Returns:
+        bool: 需要读取完整请求体并改写时返回 True
+    """
+    settings = settings or default_system_prompt_settings()
+    if settings.replacement is None:
+        return False
+    return path == "v1/messages" or path == "v1/messages/"
+
+
+def parse_content_length(headers) -> int | None:
+    """
+    解析请求头中的 Content-Length
+
+    Args:
+        headers: 原始请求头（支持 .get 的映射，键名大小写不敏感）
+
+    Returns:
+        int | None: 请求体字节数，没有 Content-Length 时返回 None
+
+    Raises:
+        ValueError: Content-Length 不是非负整数
+    """
+    content_length = headers.get("content-length")
+    if content_length is None:
+        return None
+    value = content_length.strip()
+    if not value.isascii() or not value.isdigit():
+        raise ValueError(f"Invalid Content-Length: {content_length!r}")
+    return int(value)
+
+
+def has_request_body(headers) -> bool:
+    """
+    根据请求头判断请求是否携带请求体
+
+    没有 Content-Length（或为 0）且没有 Transfer-Encoding 的请求（如普通 GET）视为无请求体，
+    此时不应以流的形式转发，否则 httpx 会给上游发送 chunked 编码的空请求体
+
+    Args:
+        headers: 原始请求头（支持 .get 的映射，键名大小写不敏感）
+
+    Returns:
+        bool: 携带请求体时返回 True
+
+    Raises:
+        ValueError: Content-Length 不是非负整数（调用方应先用 parse_content_length 校验）
+    """
+    if headers.get("transfer-encoding"):
+        return True
+    return bool(parse_content_length(headers))
+    content_length = headers.get("content-length")
+    if not content_length:
+        return False
+    try:
+        return int(content_length) > 0
+    except ValueError:
+        return True
+
+
+def process_request_body(body: bytes, settings: SystemPromptSettings | None = None) -> bytes:
     """
     处理请求体,替换 system 数组中第一个元素的 text 内容
 
@@ -87,38 +140,140 @@ def process_request_body(body: bytes) -> bytes:
 
     Args:
         body: 原始请求体（bytes）
+        settings: System Prompt 配置（请求开始时的配置快照），默认使用启动时的配置
 
     Returns:
         处理后的请求体（bytes），如果无法处理则返回原始 body
     """
+    settings = settings or default_system_prompt_settings()
     # 如果未配置替换文本，直接返回原始 body
-    if SYSTEM_PROMPT_REPLACEMENT is None:
-        print("[System Replacement] Not configured, keeping original body")
+    if settings.replacement is None:
+        logger.debug("Not configured, keeping original body")
         # try:
         #     print(f"[System Replacement None] Original system[0].text: {json.loads(body.decode('utf-8'))['system'][0]['text']}")
         # except (json.JSONDecodeError, UnicodeDecodeError, KeyError, IndexError, TypeError) as e:
         #     print(f"[System Replacement None] Failed to parse or access system prompt: {e}")
         return body
 
+    # 优先使用字节拼接：只定位 system[0].text 并就地替换，其余字节原样保留
+    try:
+        return _splice_system_prompt(body, settings)
+    except SpliceError as e:
+        logger.warning("Byte scan failed, falling back to full JSON rewrite", error=str(e))
+
+    return _rewrite_system_prompt_json(body, settings)
+
+
+def _splice_system_prompt(body: bytes, settings: SystemPromptSettings | None = None) -> bytes:
+    """
+    通过字节拼接替换 system[0].text，不对整个请求体做 json.loads / json.dumps
+
+    Args:
+        body: 原始请求体（bytes）
+
+    Returns:
+        处理后的请求体（bytes）
+
+    Raises:
+        SpliceError: 扫描失败，调用方应回退到 _rewrite_system_prompt_json
+    """
+    settings = settings or default_system_prompt_settings()
+    location = locate_system_text(body)
+    if location is None:
+        logger.debug("No usable system[0].text found, keeping original body")
+        return body
+
+    original_token = body[location.text_start:location.text_end]
+    # 键中带上当前配置，配置变化后旧条目自然失效
+    cache_key = (
+        hashlib.blake2b(original_token, digest_size=16).digest(),
+        settings.replacement,
+        settings.insert_if_not_exist
+    )
+    cached = system_prompt_cache.get(cache_key)
+    if cached is None:
+        cached = _build_system_prompt_splice(original_token, settings)
+        system_prompt_cache.put(cache_key, cached)
+    else:
+        logger.debug("Cache hit for system[0].text", text_bytes=len(original_token))
+
+    insert, splice_bytes = cached
+    if insert:
+        # 插入模式且不包含关键字：在 system[0] 之前插入新元素
+        modified_body = body[:location.element_start] + splice_bytes + body[location.element_start:]
+    else:
+        # 原始模式，或插入模式下包含关键字：直接替换 text 的值
+        modified_body = body[:location.text_start] + splice_bytes + body[location.text_end:]
+
+    logger.info("Spliced system prompt", original_size=len(body), new_size=len(modified_body), inserted=insert)
+    return modified_body
+
+
+def _build_system_prompt_splice(original_token: bytes, settings: SystemPromptSettings) -> tuple:
+    """
+    根据 system[0].text 的原始字节计算需要拼接的内容（结果会被缓存）
+
+    Args:
+        original_token: text 字符串值的原始字节（含引号）
+        settings: System Prompt 配置
+
+    Returns:
+        tuple: (是否插入新元素, 拼接用的字节)
+
+    Raises:
+        SpliceError: text 无法解码
+    """
+    # 只解码 text 字符串本身
+    try:
+        original_text = json.loads(original_token)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise SpliceError(f"failed to decode system[0].text: {e}") from e
+
+    if logger.debug_enabled:
+        logger.debug(f"Original system[0].text: {original_text[:100]}..." if len(original_text) > 100 else f"Original system[0].text: {original_text}")
+        logger.debug(f"original_text == SYSTEM_PROMPT_REPLACEMENT:{settings.replacement == original_text}")
+
+    replacement = json.dumps(settings.replacement, ensure_ascii=False).encode('utf-8')
+
+    if settings.insert_if_not_exist and CLAUDE_CODE_KEYWORD.lower() not in original_text.lower():
+        logger.debug(f"'{CLAUDE_CODE_KEYWORD}' not found, inserting at position 0")
+        return True, b'{"type":"text","text":' + replacement + b',"cache_control":{"type":"ephemeral"}},'
+
+    if logger.debug_enabled:
+        logger.debug(f"Replaced with: {settings.replacement[:100]}..." if len(settings.replacement) > 100 else f"Replaced with: {settings.replacement}")
+    return False, replacement
+
+
+def _rewrite_system_prompt_json(body: bytes, settings: SystemPromptSettings | None = None) -> bytes:
+    """
+    完整解析 JSON 后替换 system[0].text 并重新序列化（字节拼接失败时的回退路径）
+
+    Args:
+        body: 原始请求体（bytes）
+
+    Returns:
+        处理后的请求体（bytes），如果无法处理则返回原始 body
+    """
+    settings = settings or default_system_prompt_settings()
     # 尝试解析 JSON
     try:
         data = json.loads(body.decode('utf-8'))
-        print("[System Replacement] Successfully parsed JSON body")
+        logger.debug("Successfully parsed JSON body")
     except (json.JSONDecodeError, UnicodeDecodeError) as e:
-        print(f"[System Replacement] Failed to parse JSON: {e}, keeping original body")
+        logger.warning("Failed to parse JSON, keeping original body", error=str(e))
         return body
 
     # 检查 system 字段是否存在且为列表
     if "system" not in data:
-        print("[System Replacement] No 'system' field found, keeping original body")
+        logger.debug("No 'system' field found, keeping original body")
         return body
 
     if not isinstance(data["system"], list):
-        print(f"[System Replacement] 'system' field is not a list (type: {type(data['system'])}), keeping original body")
+        logger.debug(f"'system' field is not a list (type: {type(data['system'])}), keeping original body")
         return body
 
     if len(data["system"]) == 0:
-        print("[System Replacement] 'system' array is empty, keeping original body")
+        logger.debug("'system' array is empty, keeping original body")
         return body
 
     # 获取第一个元素
@@ -126,76 +281,73 @@ def process_request_body(body: bytes) -> bytes:
 
     # 检查第一个元素是否有 'text' 字段
     if not isinstance(first_element, dict) or "text" not in first_element:
-        print(f"[System Replacement] First element doesn't have 'text' field, keeping original body")
+        logger.debug("First element doesn't have 'text' field, keeping original body")
         return body
 
     # 记录原始内容
     original_text = first_element["text"]
-    print(f"[System Replacement] Original system[0].text: {original_text[:100]}..." if len(original_text) > 100 else f"[System Replacement] Original system[0].text: {original_text}")
+    if logger.debug_enabled:
+        logger.debug(f"Original system[0].text: {original_text[:100]}..." if len(original_text) > 100 else f"Original system[0].text: {original_text}")
 
     # 判断是否启用插入模式
-    if SYSTEM_PROMPT_BLOCK_INSERT_IF_NOT_EXIST:
+    if settings.insert_if_not_exist:
         # 插入模式：检查是否包含关键字（忽略大小写）
         if CLAUDE_CODE_KEYWORD.lower() in original_text.lower():
             # 包含关键字：执行替换
-            first_element["text"] = SYSTEM_PROMPT_REPLACEMENT
-            print(f"[System Replacement] Found '{CLAUDE_CODE_KEYWORD}', replacing with: {SYSTEM_PROMPT_REPLACEMENT[:100]}..." if len(SYSTEM_PROMPT_REPLACEMENT) > 100 else f"[System Replacement] Found '{CLAUDE_CODE_KEYWORD}', replacing with: {SYSTEM_PROMPT_REPLACEMENT}")
+            first_element["text"] = settings.replacement
+            logger.debug(f"Found '{CLAUDE_CODE_KEYWORD}', replacing system[0].text")
         else:
             # 不包含关键字：执行插入
             new_element = {
                 "type": "text",
-                "text": SYSTEM_PROMPT_REPLACEMENT,
+                "text": settings.replacement,
                 "cache_control": {
                     "type": "ephemeral"
                 }
             }
             data["system"].insert(0, new_element)
-            print(f"[System Replacement] '{CLAUDE_CODE_KEYWORD}' not found, inserting at position 0: {SYSTEM_PROMPT_REPLACEMENT[:100]}..." if len(SYSTEM_PROMPT_REPLACEMENT) > 100 else f"[System Replacement] '{CLAUDE_CODE_KEYWORD}' not found, inserting at position 0: {SYSTEM_PROMPT_REPLACEMENT}")
-            print(f"[System Replacement] Array length changed: {len(data['system'])-1} -> {len(data['system'])}")
+            logger.debug(f"'{CLAUDE_CODE_KEYWORD}' not found, inserting at position 0")
+            logger.debug(f"Array length changed: {len(data['system'])-1} -> {len(data['system'])}")
     else:
         # 原始模式：直接替换
-        first_element["text"] = SYSTEM_PROMPT_REPLACEMENT
-        print(f"[System Replacement] Replaced with: {SYSTEM_PROMPT_REPLACEMENT[:100]}..." if len(SYSTEM_PROMPT_REPLACEMENT) > 100 else f"[System Replacement] Replaced with: {SYSTEM_PROMPT_REPLACEMENT}")
+        first_element["text"] = settings.replacement
+        logger.debug("Replaced system[0].text")
 
-    print(f"[System Replacement] original_text == SYSTEM_PROMPT_REPLACEMENT:{SYSTEM_PROMPT_REPLACEMENT == original_text}")
+    if logger.debug_enabled:
+        logger.debug(f"original_text == SYSTEM_PROMPT_REPLACEMENT:{settings.replacement == original_text}")
 
     # 转换回 JSON bytes
     try:
         # 这里必须加 separators 压缩空格，我也不知道为什么有空格不行。。。
         modified_body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
-        print(f"[System Replacement] Successfully modified body (original size: {len(body)} bytes, new size: {len(modified_body)} bytes)")
+        logger.info("Rewrote system prompt via JSON", original_size=len(body), new_size=len(modified_body))
         return modified_body
     except Exception as e:
-        print(f"[System Replacement] Failed to serialize modified JSON: {e}, keeping original body")
+        logger.error("Failed to serialize modified JSON, keeping original body", error=str(e))
         return body
 
 
-def prepare_forward_headers(incoming_headers: Iterable[tuple], client_host: str = None) -> dict:
+def prepare_forward_headers(
+    incoming_headers: Iterable[tuple],
+    client_host: str = None,
+    target_host: str = None,
+    passthrough: bool = COMPRESSION_PASSTHROUGH,
+    path: str = "",
+    rewriter: HeaderRewriter | None = None
+) -> dict:
     """
-    准备转发的请求头
+    准备转发的请求头（按编译好的改写计划单次遍历，见 header_rules）
 
     Args:
         incoming_headers: 原始请求头
         client_host: 客户端 IP 地址
+        target_host: 选中上游的 Host（多上游时由负载均衡决定），默认取 TARGET_BASE_URL
+        passthrough: 压缩透传模式，转发客户端的 Accept-Encoding
+        path: 请求路径（不含开头的 /），用于匹配带路径条件的改写规则
+        rewriter: 请求开始时配置快照中的改写器，默认使用当前配置
 
     Returns:
-        dict: 准备好的转发请求头
+        dict: 准备好的转发请求头（保留客户端发送或配置中声明的头名大小写）
     """
-    # 复制并过滤请求头
-    forward_headers = filter_request_headers(incoming_headers)
-
-    # 设置 Host
-    if not PRESERVE_HOST:
-        parsed = urlparse(TARGET_BASE_URL)
-        forward_headers["Host"] = parsed.netloc
-
-    # 注入自定义 Header
-    for k, v in CUSTOM_HEADERS.items():
-        forward_headers[k] = v
-
-    # 添加 X-Forwarded-For
-    if client_host:
-        existing = forward_headers.get("X-Forwarded-For")
-        forward_headers["X-Forwarded-For"] = f"{existing}, {client_host}" if existing else client_host
-
-    return forward_headers
+    rewriter = rewriter or current_config().header_rewriter
+    return rewriter.rewrite(incoming_headers, path, client_host, target_host, passthrough)
@@ -0,0 +1,177 @@
+"""
+按客户端限流模块
+
+多个团队共用一个代理实例时，避免单个失控的客户端（如死循环的 Agent）占满上游：
+每个客户端一个令牌桶限制每秒请求数，并限制同时进行的请求数。
+客户端按 Authorization / x-api-key 的哈希区分，没有鉴权头时按客户端 IP 区分；
+状态按最近访问顺序保存在 OrderedDict 中，每次请求 O(1)，空闲的客户端从队首清除
+"""
+
+import hashlib
+import math
+import time
+from collections import OrderedDict
+
+from ..config import (
+    CLIENT_RATE_LIMIT_RPS,
+    CLIENT_RATE_LIMIT_BURST,
+    CLIENT_MAX_CONCURRENT,
+    CLIENT_IDLE_TTL,
+    CLIENT_MAX_TRACKED
+)
+
+RATE_LIMITED = "rate_limited"
+TOO_MANY_CONCURRENT = "client_concurrency"
+
+# 每次请求最多检查的队首条目数（清除空闲客户端的开销保持常数）
+EVICT_SCAN = 4
+
+
+def client_key(headers, client_host: str | None) -> str:
+    """
+    计算客户端标识：鉴权头的哈希（不保存原始密钥），没有鉴权头时使用客户端 IP
+
+    Args:
+        headers: 请求头（支持 .get 的映射，键名大小写不敏感）
+        client_host: 客户端 IP 地址
+    """
+    credential = headers.get("authorization") or headers.get("x-api-key")
+    if credential:
+        return "key:" + hashlib.blake2b(credential.encode(), digest_size=6).hexdigest()
+    return f"ip:{client_host or 'unknown'}"
+
+
+class ClientState:
+    """单个客户端的令牌桶、进行中请求数与使用计数"""
+
+    __slots__ = ("tokens", "updated", "last_seen", "in_flight", "requests", "rejected", "first_seen")
+
+    def __init__(self, burst: int, now: float):
+        self.tokens = float(burst)
+        self.updated = now
+        self.last_seen = now
+        self.first_seen = time.time()
+        self.in_flight = 0
+        self.requests = 0
+        self.rejected = {RATE_LIMITED: 0, TOO_MANY_CONCURRENT: 0}
+
+
+class ClientRateLimiter:
+    """按客户端的令牌桶 + 并发限制（仅在事件循环线程内使用，无需加锁）"""
+
+    def __init__(
+        self,
+        rps: float,
+        burst: int,
+        max_concurrent: int,
+        idle_ttl: float,
+        max_tracked: int
+    ):
+        self.rps = rps
+        self.burst = max(burst, 1)
+        self.max_concurrent = max_concurrent
+        self.idle_ttl = idle_ttl
+        self.max_tracked = max_tracked
+        self.clients = OrderedDict()  # 客户端标识 -> ClientState，按最近访问排序
+        self.evicted = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rps > 0 or self.max_concurrent > 0
+
+    def _evict(self, now: float):
+        """从队首（最久未访问）清除空闲或超出数量上限的客户端，每次最多检查 EVICT_SCAN 个"""
+        clients = self.clients
+        for _ in range(EVICT_SCAN):
+            if not clients:
+                return
+            key, state = next(iter(clients.items()))
+            expired = now - state.last_seen > self.idle_ttl
+            if not expired and len(clients) <= self.max_tracked:
+                return
+            if state.in_flight > 0:
+                # 长时间运行的流式请求：保留状态，移到队尾
+                clients.move_to_end(key)
+                continue
+            del clients[key]
+            self.evicted += 1
+
+    def acquire(self, key: str) -> tuple:
+        """
+        请求开始时调用
+
+        Returns:
+            tuple: (拒绝原因, Retry-After 秒数)，允许时为 (None, 0)；允许的请求结束后必须调用 release
+        """
+        now = time.monotonic()
+        self._evict(now)
+        state = self.clients.get(key)
+        if state is None:
+            state = self.clients[key] = ClientState(self.burst, now)
+        else:
+            self.clients.move_to_end(key)
+        state.last_seen = now
+        state.requests += 1
+
+        if self.max_concurrent > 0 and state.in_flight >= self.max_concurrent:
+            state.rejected[TOO_MANY_CONCURRENT] += 1
+            return TOO_MANY_CONCURRENT, 1
+
+        if self.rps > 0:
+            state.tokens = min(self.burst, state.tokens + (now - state.updated) * self.rps)
+            state.updated = now
+            if state.tokens < 1:
+                state.rejected[RATE_LIMITED] += 1
+                return RATE_LIMITED, max(1, math.ceil((1 - state.tokens) / self.rps))
+            state.tokens -= 1
+
+        state.in_flight += 1
+        return None, 0
+
+    def release(self, key: str):
+        """请求结束（含流式响应传输完毕）时调用"""
+        state = self.clients.get(key)
+        if state is not None:
+            state.in_flight -= 1
+            state.last_seen = time.monotonic()
+
+    def stats(self, limit: int = 20) -> dict:
+        """按请求数排序的客户端使用情况（仅在查询统计时排序）"""
+        now = time.monotonic()
+        top = sorted(self.clients.items(), key=lambda item: item[1].requests, reverse=True)
+        if limit > 0:
+            top = top[:limit]
+        return {
+            "enabled": self.enabled,
+            "rps": self.rps,
+            "burst": self.burst,
+            "max_concurrent": self.max_concurrent,
+            "tracked": len(self.clients),
+            "evicted": self.evicted,
+            "clients": [
+                {
+                    "client": key,
+                    "requests": state.requests,
+                    "in_flight": state.in_flight,
+                    "rejected": dict(state.rejected),
+                    "tokens": round(min(self.burst, state.tokens + (now - state.updated) * self.rps), 2) if self.rps > 0 else None,
+                    "idle_seconds": round(now - state.last_seen, 1),
+                    "first_seen": state.first_seen
+                }
+                for key, state in top
+            ]
+        }
+
+
+client_limiter = ClientRateLimiter(
+    CLIENT_RATE_LIMIT_RPS,
+    CLIENT_RATE_LIMIT_BURST,
+    CLIENT_MAX_CONCURRENT,
+    CLIENT_IDLE_TTL,
+    CLIENT_MAX_TRACKED
+)
+
+
+def get_client_stats(limit: int = 20) -> dict:
+    """获取按客户端的限流配置与使用计数"""
+    return client_limiter.stats(limit)
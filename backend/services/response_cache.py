@@ -0,0 +1,123 @@
+"""
+响应缓存模块
+
+对配置的 GET 路径（如 /v1/models）在内存中按 TTL + LRU 缓存上游响应，
+并把并发的相同请求合并为一次上游调用（in-flight coalescing）
+"""
+
+import asyncio
+import fnmatch
+import hashlib
+from typing import Awaitable, Callable, NamedTuple
+
+from ..config import (
+    RESPONSE_CACHE_PATHS,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_SIZE,
+    RESPONSE_CACHE_MAX_BODY
+)
+from ..utils.lru_cache import LRUCache
+
+# 参与缓存键计算的请求头：不同 API Key / 版本的响应可能不同
+KEY_HEADERS = ("authorization", "x-api-key", "anthropic-version", "anthropic-beta")
+
+CACHE_PATH_PATTERNS = [p.strip().lstrip("/") for p in RESPONSE_CACHE_PATHS.split(",") if p.strip()]
+
+
+class CachedResponse(NamedTuple):
+    """已完整读取的上游响应"""
+    status_code: int
+    headers: dict
+    body: bytes
+
+
+response_cache = LRUCache(RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+
+# 正在向上游请求的缓存键 -> Task（同一个键的后续请求等待它的结果）
+_inflight: dict = {}
+
+
+def is_cacheable_request(path: str, method: str) -> bool:
+    """请求是否走响应缓存（仅 GET，且路径匹配 RESPONSE_CACHE_PATHS）"""
+    if method != "GET" or not CACHE_PATH_PATTERNS:
+        return False
+    return any(fnmatch.fnmatchcase(path, pattern) for pattern in CACHE_PATH_PATTERNS)
+
+
+def is_cacheable_response(response: CachedResponse) -> bool:
+    """响应是否可以写入缓存（2xx、未声明 no-store/private、大小不超过上限）"""
+    if not 200 <= response.status_code < 300 or response.status_code == 206:
+        return False
+    if len(response.body) > RESPONSE_CACHE_MAX_BODY:
+        return False
+    cache_control = next((v for k, v in response.headers.items() if k.lower() == "cache-control"), "").lower()
+    return "no-store" not in cache_control and "private" not in cache_control
+
+
+def build_cache_key(method: str, path: str, query: str, headers) -> tuple:
+    """
+    构造缓存键：方法 + 路径 + 查询参数 + 鉴权/版本相关请求头的哈希
+
+    Args:
+        headers: 原始请求头（支持 .get 的映射，键名大小写不敏感）
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for name in KEY_HEADERS:
+        digest.update(name.encode())
+        digest.update(b"\0")
+        digest.update((headers.get(name) or "").encode())
+        digest.update(b"\0")
+    return method, path, query, digest.digest()
+
+
+async def _fetch_and_store(key: tuple, fetch: Callable[[], Awaitable[CachedResponse]]) -> CachedResponse:
+    try:
+        result = await fetch()
+    finally:
+        _inflight.pop(key, None)
+    if is_cacheable_response(result):
+        response_cache.put(key, result)
+    return result
+
+
+def _consume_exception(task: asyncio.Task):
+    """读取任务异常，所有等待者都已取消时避免 "exception was never retrieved" 警告"""
+    if not task.cancelled():
+        task.exception()
+
+
+async def get_or_fetch(key: tuple, fetch: Callable[[], Awaitable[CachedResponse]]) -> tuple:
+    """
+    从缓存读取响应，未命中时调用 fetch 获取；同一键的并发请求只调用一次 fetch
+
+    fetch 在独立任务中执行，发起请求的客户端断开时不会影响其他等待同一结果的请求
+
+    Args:
+        key: build_cache_key 构造的缓存键
+        fetch: 向上游请求并返回 CachedResponse 的协程函数
+
+    Returns:
+        tuple: (CachedResponse, 来源)，来源为 "hit" / "coalesced" / "miss"
+    """
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached, "hit"
+
+    task = _inflight.get(key)
+    source = "coalesced"
+    if task is None:
+        task = asyncio.ensure_future(_fetch_and_store(key, fetch))
+        task.add_done_callback(_consume_exception)
+        _inflight[key] = task
+        source = "miss"
+    return await asyncio.shield(task), source
+
+
+def get_cache_stats() -> dict:
+    """获取缓存配置与命中统计"""
+    return {
+        "paths": CACHE_PATH_PATTERNS,
+        "max_body": RESPONSE_CACHE_MAX_BODY,
+        "inflight": len(_inflight),
+        **response_cache.stats()
+    }
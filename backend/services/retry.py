@@ -0,0 +1,166 @@
+"""
+上游重试模块
+
+在尚未向客户端返回任何字节之前，对可重试的上游错误（连接失败、502/503/529 等）进行带抖动退避的重试，
+并对配置的慢首字节路径发送对冲请求；重试与对冲总量受全局重试预算（按流量比例）限制，防止上游故障时形成重试风暴
+"""
+
+import fnmatch
+import random
+import time
+from collections import deque
+
+from ..config import (
+    UPSTREAM_MAX_RETRIES,
+    UPSTREAM_RETRY_STATUS_CODES,
+    UPSTREAM_RETRY_BACKOFF_BASE,
+    UPSTREAM_RETRY_BACKOFF_MAX,
+    UPSTREAM_RETRY_BUDGET_RATIO,
+    UPSTREAM_RETRY_BUDGET_MIN_PER_SECOND,
+    UPSTREAM_HEDGE_PATHS,
+    UPSTREAM_HEDGE_DELAY
+)
+
+# 幂等方法：请求可能已送达上游时（如首字节超时）也可以安全重试
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# 请求必定未送达上游的错误类型，任何方法都可以安全重试
+UNSENT_ERROR_TYPES = {"connect_error", "connect_timeout", "pool_timeout"}
+
+# 重试预算的统计窗口（秒）
+BUDGET_WINDOW_SECONDS = 10
+
+
+def _parse_status_codes(raw: str) -> set:
+    """解析逗号分隔的状态码列表，忽略无效项"""
+    codes = set()
+    for item in raw.split(","):
+        item = item.strip()
+        if item.isdigit():
+            codes.add(int(item))
+    return codes
+
+
+RETRY_STATUS_CODES = _parse_status_codes(UPSTREAM_RETRY_STATUS_CODES)
+HEDGE_PATH_PATTERNS = [p.strip().lstrip("/") for p in UPSTREAM_HEDGE_PATHS.split(",") if p.strip()]
+
+
+class RetryBudget:
+    """
+    重试预算：最近 window 秒内的重试次数不超过 请求数 × ratio + min_per_second × window
+
+    按秒分桶计数，检查时只需累加不超过 window 个桶
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, window: int = BUDGET_WINDOW_SECONDS):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self._buckets = deque()  # [秒, 请求数, 重试数]
+        self.exhausted = 0
+
+    def _current_bucket(self) -> list:
+        now = int(time.monotonic())
+        buckets = self._buckets
+        if not buckets or buckets[-1][0] != now:
+            buckets.append([now, 0, 0])
+        while buckets[0][0] <= now - self.window:
+            buckets.popleft()
+        return buckets[-1]
+
+    def _totals(self) -> tuple:
+        requests = retries = 0
+        for _, bucket_requests, bucket_retries in self._buckets:
+            requests += bucket_requests
+            retries += bucket_retries
+        return requests, retries
+
+    def record_request(self):
+        """记录一次原始请求（为预算充值）"""
+        self._current_bucket()[1] += 1
+
+    def try_acquire(self) -> bool:
+        """
+        申请一次重试额度
+
+        Returns:
+            bool: 预算允许时返回 True 并计入重试数，否则返回 False
+        """
+        bucket = self._current_bucket()
+        requests, retries = self._totals()
+        if retries + 1 > requests * self.ratio + self.min_per_second * self.window:
+            self.exhausted += 1
+            return False
+        bucket[2] += 1
+        return True
+
+    def stats(self) -> dict:
+        self._current_bucket()
+        requests, retries = self._totals()
+        return {
+            "window_seconds": self.window,
+            "ratio": self.ratio,
+            "min_per_second": self.min_per_second,
+            "window_requests": requests,
+            "window_retries": retries,
+            "available": max(0, int(requests * self.ratio + self.min_per_second * self.window) - retries),
+            "exhausted": self.exhausted
+        }
+
+
+retry_budget = RetryBudget(UPSTREAM_RETRY_BUDGET_RATIO, UPSTREAM_RETRY_BUDGET_MIN_PER_SECOND)
+
+# 重试与对冲计数
+retry_metrics = {
+    "retries": 0,
+    "recovered_requests": 0,  # 重试后成功（返回非可重试状态）的请求数
+    "hedged_requests": 0,
+    "hedge_wins": 0  # 对冲副本先于原请求返回的次数
+}
+
+
+def is_retryable_status(status_code: int) -> bool:
+    """上游状态码是否可重试"""
+    return status_code in RETRY_STATUS_CODES
+
+
+def is_retryable_error(error_type: str, method: str) -> bool:
+    """
+    上游请求异常是否可重试
+
+    请求必定未送达上游的错误（连接失败、连接池等待超时）总是可重试；
+    其他错误（如首字节超时）上游可能已经处理了请求，只对幂等方法重试
+    """
+    return error_type in UNSENT_ERROR_TYPES or method in IDEMPOTENT_METHODS
+
+
+def can_retry(retry_count: int) -> bool:
+    """已重试次数是否还在上限内"""
+    return retry_count < UPSTREAM_MAX_RETRIES
+
+
+def backoff_delay(retry_number: int) -> float:
+    """
+    第 retry_number 次重试（从 1 开始）前的等待时间（full jitter 指数退避）
+    """
+    cap = min(UPSTREAM_RETRY_BACKOFF_MAX, UPSTREAM_RETRY_BACKOFF_BASE * (2 ** (retry_number - 1)))
+    return random.uniform(0, cap)
+
+
+def should_hedge(path: str, method: str) -> bool:
+    """请求是否启用对冲（仅幂等方法且路径匹配 UPSTREAM_HEDGE_PATHS）"""
+    if not HEDGE_PATH_PATTERNS or method not in IDEMPOTENT_METHODS:
+        return False
+    return any(fnmatch.fnmatchcase(path, pattern) for pattern in HEDGE_PATH_PATTERNS)
+
+
+def get_retry_stats() -> dict:
+    """获取重试、对冲计数与重试预算状态"""
+    return {
+        "max_retries": UPSTREAM_MAX_RETRIES,
+        "retry_status_codes": sorted(RETRY_STATUS_CODES),
+        "hedge_paths": HEDGE_PATH_PATTERNS,
+        "hedge_delay": UPSTREAM_HEDGE_DELAY,
+        **retry_metrics,
+        "budget": retry_budget.stats()
+    }
@@ -0,0 +1,194 @@
+"""
+运行时配置模块
+
+可热更新的配置（自定义请求头、请求头改写规则、System Prompt 设置、上游列表）组成不可变的版本化快照，
+更新时整体替换。每个请求开始时取一次快照，并在整个请求（含重试与流式传输）中使用，
+更新不影响进行中的请求。
+
+后台任务轮询 env/ 下配置文件的修改时间，变化时重新加载；管理面板的修改先写入配置文件再重新加载，
+多 worker 部署时其他 worker 通过文件轮询同步
+"""
+
+import asyncio
+import json
+import os
+import time
+from types import MappingProxyType
+from typing import NamedTuple
+from urllib.parse import urlparse
+
+from ..config import (
+    TARGET_BASE_URL,
+    API_BASE_URLS,
+    SYSTEM_PROMPT_REPLACEMENT,
+    SYSTEM_PROMPT_BLOCK_INSERT_IF_NOT_EXIST,
+    CONFIG_WATCH_INTERVAL,
+    HEADERS_FILE,
+    HEADER_RULES_FILE,
+    RUNTIME_CONFIG_FILE,
+    load_custom_headers,
+    load_header_rules,
+    load_runtime_overrides
+)
+from ..utils.logger import get_logger
+from . import balancer
+from .header_rules import HeaderRewriter, parse_rules
+
+logger = get_logger("config")
+
+WATCHED_FILES = (HEADERS_FILE, HEADER_RULES_FILE, RUNTIME_CONFIG_FILE)
+
+# env/.env.runtime.json 中可覆盖的环境变量配置
+RUNTIME_KEYS = ("system_prompt_replacement", "system_prompt_block_insert_if_not_exist", "api_base_urls")
+
+
+class SystemPromptSettings(NamedTuple):
+    """System Prompt 改写配置"""
+    replacement: str | None
+    insert_if_not_exist: bool
+
+
+class ConfigSnapshot(NamedTuple):
+    """某一版本的运行时配置（不可变，更新时整体替换）"""
+    version: int
+    loaded_at: float
+    source: str  # startup / file / admin
+    custom_headers: MappingProxyType
+    header_rules: tuple
+    system_prompt: SystemPromptSettings
+    api_base_urls: str
+    upstreams: tuple
+    weights: MappingProxyType  # 上游名称 -> 权重（本版本配置的权重，更新时不影响进行中的请求）
+    header_rewriter: HeaderRewriter
+
+    def describe(self) -> dict:
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "source": self.source,
+            "custom_headers": dict(self.custom_headers),
+            "header_rules": len(self.header_rules),
+            "system_prompt_replacement": self.system_prompt.replacement,
+            "system_prompt_block_insert_if_not_exist": self.system_prompt.insert_if_not_exist,
+            "upstreams": [{"name": u.name, "base_url": u.base_url, "weight": self.weights[u.name]} for u in self.upstreams]
+        }
+
+
+def load_settings() -> dict:
+    """从配置文件读取可热更新的配置，env/.env.runtime.json 中的值覆盖环境变量"""
+    overrides = load_runtime_overrides()
+    return {
+        "custom_headers": load_custom_headers(),
+        "header_rules": load_header_rules(),
+        "system_prompt_replacement": overrides.get("system_prompt_replacement", SYSTEM_PROMPT_REPLACEMENT),
+        "system_prompt_block_insert_if_not_exist": bool(overrides.get(
+            "system_prompt_block_insert_if_not_exist", SYSTEM_PROMPT_BLOCK_INSERT_IF_NOT_EXIST
+        )),
+        "api_base_urls": overrides.get("api_base_urls", API_BASE_URLS)
+    }
+
+
+def _files_signature() -> tuple:
+    signature = []
+    for path in WATCHED_FILES:
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def _build_snapshot(settings: dict, version: int, source: str, upstreams: list, weights) -> ConfigSnapshot:
+    rules = parse_rules(settings["header_rules"])
+    return ConfigSnapshot(
+        version=version,
+        loaded_at=time.time(),
+        source=source,
+        custom_headers=MappingProxyType(dict(settings["custom_headers"])),
+        header_rules=tuple(rules),
+        system_prompt=SystemPromptSettings(
+            settings["system_prompt_replacement"],
+            settings["system_prompt_block_insert_if_not_exist"]
+        ),
+        api_base_urls=settings["api_base_urls"],
+        upstreams=tuple(upstreams),
+        weights=weights,
+        header_rewriter=HeaderRewriter(settings["custom_headers"], rules, urlparse(TARGET_BASE_URL).netloc)
+    )
+
+
+# 启动时的配置（上游列表由 balancer 按环境变量创建，这里只在 env/.env.runtime.json 覆盖时重建）
+_signature = _files_signature()
+_settings = load_settings()
+if _settings["api_base_urls"] != API_BASE_URLS:
+    balancer.reload_upstreams(_settings["api_base_urls"], TARGET_BASE_URL)
+_snapshot = _build_snapshot(_settings, 1, "startup", balancer.upstreams, balancer.weights)
+
+
+def current_config() -> ConfigSnapshot:
+    """当前配置快照（请求开始时调用一次，之后只使用这个快照）"""
+    return _snapshot
+
+
+def reload_config(source: str = "file") -> ConfigSnapshot | None:
+    """
+    重新读取配置文件，配置有变化时原子替换快照
+
+    Returns:
+        ConfigSnapshot | None: 新的快照，配置未变化时为 None
+    """
+    global _snapshot, _settings, _signature
+    _signature = _files_signature()
+    settings = load_settings()
+    if settings == _settings:
+        return None
+
+    if settings["api_base_urls"] != _settings["api_base_urls"]:
+        balancer.reload_upstreams(settings["api_base_urls"], TARGET_BASE_URL)
+    changed = [key for key in settings if settings[key] != _settings[key]]
+    _snapshot = _build_snapshot(settings, _snapshot.version + 1, source, balancer.upstreams, balancer.weights)
+    _settings = settings
+    logger.info("Config reloaded", version=_snapshot.version, source=source, changed=",".join(changed))
+    return _snapshot
+
+
+def _write_json(path: str, data):
+    """先写临时文件再重命名，避免其他 worker 读到写了一半的文件"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def update_config(changes: dict) -> ConfigSnapshot:
+    """
+    持久化配置修改并立即生效（管理面板调用）
+
+    Args:
+        changes: custom_headers 与 RUNTIME_KEYS 中的任意字段
+
+    Returns:
+        ConfigSnapshot: 修改后的当前快照
+    """
+    if "custom_headers" in changes:
+        _write_json(HEADERS_FILE, changes["custom_headers"])
+    runtime_changes = {key: changes[key] for key in RUNTIME_KEYS if key in changes}
+    if runtime_changes:
+        _write_json(RUNTIME_CONFIG_FILE, {**load_runtime_overrides(), **runtime_changes})
+    reload_config("admin")
+    return _snapshot
+
+
+async def watch_config_files():
+    """轮询配置文件的修改时间与大小，变化时重新加载（后台任务）"""
+    if CONFIG_WATCH_INTERVAL <= 0:
+        return
+    while True:
+        await asyncio.sleep(CONFIG_WATCH_INTERVAL)
+        try:
+            if _files_signature() != _signature:
+                reload_config("file")
+        except Exception as e:
+            logger.error("Failed to reload config", error=str(e))
@@ -0,0 +1,440 @@
+"""
+共享内存统计模块
+
+多 worker 部署时，各 worker 进程的计数器、延迟直方图与每分钟统计写入同一个 mmap 共享内存段：
+每个 worker 独占一个固定布局的槽位（单写者，无需跨进程锁），读取时把所有槽位相加，
+因此无论哪个 worker 响应 /api/admin/stats，返回的都是全部 worker 的汇总。
+单进程模式使用匿名 mmap，布局与读写方式完全相同
+
+段布局（均为 int64）：
+    头部: magic, 布局校验值, 槽位数, 槽位长度, 创建时间
+    每个槽位: pid, 认领时间, 计数器, 错误类型计数, 各分辨率的时间序列环与直方图环, 启动以来的累计直方图
+
+时间序列按秒、分钟、小时三种分辨率在记录时同时累加（环形缓冲区，每行以桶编号标记，过期行在复用时清零），
+查询时按时间范围选择能覆盖该范围的最细分辨率（见 pick_resolution）。
+直方图的分桶与百分位估算见 utils.sketch，各槽位、各时间桶的直方图可直接按桶相加合并
+"""
+
+import mmap
+import os
+import tempfile
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 平台不支持跨进程共享，退化为进程内统计
+    fcntl = None
+
+from ..config import WORKERS, SHARED_STATS_PATH, PORT
+from ..utils.logger import get_logger
+from ..utils.sketch import HIST_BUCKETS, HIST_GROWTH, LatencySketch, bucket_index
+
+logger = get_logger("shared_stats")
+
+COUNTERS = (
+    "total_requests",
+    "successful_requests",
+    "failed_requests",
+    "total_bytes_sent",
+    "total_bytes_received",
+    # 从 SSE 流中解析出的 token 用量
+    "token_requests",
+    "input_tokens",
+    "output_tokens",
+    "cache_read_input_tokens",
+    "cache_creation_input_tokens",
+    "generation_ms",
+    # 响应缓存
+    "cache_hits",
+    "cache_coalesced",
+    "cache_misses",
+    "cache_bytes_saved"
+)
+
+# 固定的错误类型列表，未列出的类型计入 other
+ERROR_TYPES = (
+    "connect_timeout",
+    "pool_timeout",
+    "write_timeout",
+    "read_timeout",
+    "connect_error",
+    "protocol_error",
+    "request_error",
+    "first_byte_timeout",
+    "idle_timeout",
+    "http_error",
+    "circuit_open",
+    "queue_full",
+    "queue_timeout",
+    "rate_limited",
+    "client_concurrency",
+    "stale_timeout",
+    "other"
+)
+
+# 延迟直方图（各分辨率保存最近的若干个时间桶，另有一份启动以来的累计直方图）
+HISTOGRAMS = ("response_time", "first_byte_time", "first_token_time", "duration", "chunk_gap_max")
+SERIES_FIELDS = ("requests", "successes", "errors", "bytes", "input_tokens", "output_tokens")
+
+# 时间序列分辨率：(名称, 桶长度秒, 时间序列桶数, 直方图桶数)
+# 秒级保留 10 分钟（直方图 2 分钟），分钟级保留 24 小时（直方图 60 分钟），小时级保留 30 天（直方图 48 小时）
+RESOLUTIONS = (
+    ("second", 1, 600, 120),
+    ("minute", 60, 1440, 60),
+    ("hour", 3600, 720, 48)
+)
+# 时间序列查询返回的最大点数（超过时使用更粗的分辨率）
+SERIES_MAX_POINTS = 1440
+
+MAGIC = 0x414E5953544154  # "ANYSTAT"
+HEADER_SIZE = 8
+
+_COUNTER_INDEX = {name: i for i, name in enumerate(COUNTERS)}
+_ERROR_INDEX = {name: i for i, name in enumerate(ERROR_TYPES)}
+_HIST_INDEX = {name: i for i, name in enumerate(HISTOGRAMS)}
+
+_COUNTERS_OFFSET = 2
+_ERRORS_OFFSET = _COUNTERS_OFFSET + len(COUNTERS)
+_SERIES_ROW = 1 + len(SERIES_FIELDS)  # 桶编号 + 各字段
+_HIST_SIZE = HIST_BUCKETS + 1  # 各桶计数 + 总耗时（微秒）
+_HIST_ROW = 1 + len(HISTOGRAMS) * _HIST_SIZE  # 桶编号 + 各直方图
+
+
+class _Ring:
+    """某个分辨率的时间序列环与直方图环在槽位内的位置"""
+
+    __slots__ = ("name", "step", "rows", "hist_rows", "series_offset", "hist_offset")
+
+    def __init__(self, name: str, step: int, rows: int, hist_rows: int, offset: int):
+        self.name = name
+        self.step = step
+        self.rows = rows
+        self.hist_rows = hist_rows
+        self.series_offset = offset
+        self.hist_offset = offset + rows * _SERIES_ROW
+
+    @property
+    def end_offset(self) -> int:
+        return self.hist_offset + self.hist_rows * _HIST_ROW
+
+
+def _layout_rings() -> tuple:
+    offset = _ERRORS_OFFSET + len(ERROR_TYPES)
+    rings = []
+    for name, step, rows, hist_rows in RESOLUTIONS:
+        ring = _Ring(name, step, rows, hist_rows, offset)
+        rings.append(ring)
+        offset = ring.end_offset
+    return tuple(rings)
+
+
+_RINGS = _layout_rings()
+_RING_BY_NAME = {ring.name: ring for ring in _RINGS}
+RESOLUTION_STEPS = {ring.name: ring.step for ring in _RINGS}
+_LIFETIME_OFFSET = _RINGS[-1].end_offset
+SLOT_SIZE = _LIFETIME_OFFSET + len(HISTOGRAMS) * _HIST_SIZE
+
+LAYOUT_CHECKSUM = zlib.crc32(repr((COUNTERS, ERROR_TYPES, HISTOGRAMS, SERIES_FIELDS, RESOLUTIONS,
+                                   HIST_BUCKETS, HIST_GROWTH)).encode())
+
+_ZEROS = memoryview(bytearray(8 * max(_SERIES_ROW, _HIST_ROW))).cast("q")
+
+
+def pick_resolution(start_time: float, end_time: float, histogram: bool = False, now: float | None = None) -> str:
+    """
+    选择能覆盖时间范围的最细分辨率：范围起点仍在该分辨率的保留期内（允许起点所在的不完整时间桶已被覆盖），
+    且时间序列点数不超过 SERIES_MAX_POINTS；都不满足时使用最粗的分辨率（只返回保留期内的部分）
+
+    Args:
+        histogram: 为 True 时按直方图的保留期选择（直方图合并为一个分布，不限制点数）
+    """
+    now = max(now if now is not None else time.time(), end_time)
+    for ring in _RINGS:
+        retention = (ring.hist_rows if histogram else ring.rows) * ring.step
+        if now - start_time > retention + ring.step:
+            continue
+        if histogram or (end_time - start_time) / ring.step <= SERIES_MAX_POINTS + 1:
+            return ring.name
+    return _RINGS[-1].name
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedStats:
+    """固定布局的共享统计段（每个进程只写自己认领的槽位）"""
+
+    def __init__(self, path: str | None, slots: int):
+        self.path = path if fcntl is not None else None
+        self.slots = slots
+        size = 8 * (HEADER_SIZE + slots * SLOT_SIZE)
+        if self.path:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            with self._locked():
+                if os.fstat(self._fd).st_size != size:
+                    os.ftruncate(self._fd, 0)
+                    os.ftruncate(self._fd, size)
+                self._mmap = mmap.mmap(self._fd, size)
+                self.view = memoryview(self._mmap).cast("q")
+                if not self._header_valid():
+                    self._init_header()
+        else:
+            self._fd = None
+            self._mmap = mmap.mmap(-1, size)
+            self.view = memoryview(self._mmap).cast("q")
+            self._init_header()
+
+        # 写入目标：认领槽位后指向共享段，槽位全部被占用时指向进程私有内存
+        self._pid = None
+        self._writer = None
+        self._base = 0
+
+    # ===== 段管理 =====
+
+    def _locked(self):
+        fd = self._fd
+
+        class _Lock:
+            def __enter__(self):
+                if fd is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+
+            def __exit__(self, *exc):
+                if fd is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+
+        return _Lock()
+
+    def _header_valid(self) -> bool:
+        v = self.view
+        return v[0] == MAGIC and v[1] == LAYOUT_CHECKSUM and v[2] == self.slots and v[3] == SLOT_SIZE
+
+    def _init_header(self):
+        v = self.view
+        v[0] = MAGIC
+        v[1] = LAYOUT_CHECKSUM
+        v[2] = self.slots
+        v[3] = SLOT_SIZE
+        v[4] = int(time.time())
+
+    @property
+    def created_at(self) -> float:
+        return float(self.view[4])
+
+    def reset(self):
+        """清空所有槽位（主进程启动 worker 前调用，避免沿用上次运行的数据）"""
+        with self._locked():
+            zeros = memoryview(bytearray(8 * SLOT_SIZE)).cast("q")
+            for slot in range(self.slots):
+                base = HEADER_SIZE + slot * SLOT_SIZE
+                self.view[base:base + SLOT_SIZE] = zeros
+            self._init_header()
+        self._pid = None
+
+    def _claim(self):
+        """认领一个空闲槽位（或已退出 worker 的槽位，保留其累计数据）"""
+        pid = os.getpid()
+        v = self.view
+        with self._locked():
+            for slot in range(self.slots):
+                base = HEADER_SIZE + slot * SLOT_SIZE
+                owner = v[base]
+                if owner == 0 or owner == pid or not _pid_alive(owner):
+                    v[base] = pid
+                    v[base + 1] = int(time.time())
+                    self._writer, self._base = v, base
+                    break
+            else:
+                logger.warning("No free shared stats slot, stats of this worker will not be aggregated", slots=self.slots)
+                self._writer = memoryview(bytearray(8 * SLOT_SIZE)).cast("q")
+                self._base = 0
+        self._pid = pid
+
+    def _slot(self) -> tuple:
+        if self._pid != os.getpid():
+            self._claim()
+        return self._writer, self._base
+
+    # ===== 写入（当前进程的槽位） =====
+
+    def incr(self, name: str, value: int = 1):
+        v, base = self._slot()
+        v[base + _COUNTERS_OFFSET + _COUNTER_INDEX[name]] += value
+
+    def incr_error(self, error_type: str | None, value: int = 1):
+        v, base = self._slot()
+        index = _ERROR_INDEX.get(error_type or "other", _ERROR_INDEX["other"])
+        v[base + _ERRORS_OFFSET + index] += value
+
+    def add_series(self, now: float, requests: int = 0, successes: int = 0, errors: int = 0,
+                   bytes_count: int = 0, input_tokens: int = 0, output_tokens: int = 0):
+        """累加 now 所在的秒、分钟、小时时间桶"""
+        v, base = self._slot()
+        values = (requests, successes, errors, bytes_count, input_tokens, output_tokens)
+        for ring in _RINGS:
+            bucket = int(now // ring.step)
+            row = base + ring.series_offset + (bucket % ring.rows) * _SERIES_ROW
+            if v[row] != bucket:
+                v[row + 1:row + _SERIES_ROW] = _ZEROS[:_SERIES_ROW - 1]
+                v[row] = bucket
+            for i, value in enumerate(values, row + 1):
+                if value:
+                    v[i] += value
+
+    def observe(self, name: str, seconds: float | None, now: float):
+        """记录一次耗时到各分辨率当前时间桶的直方图与累计直方图"""
+        if seconds is None:
+            return
+        ms = max(seconds, 0.0) * 1000
+        self.add_histogram(now, name, {bucket_index(ms): 1}, int(ms * 1000))
+
+    def add_histogram(self, now: float, name: str, counts: dict, total_us: int):
+        """把一组已分桶的耗时（桶序号 -> 次数，总耗时微秒）累加到各分辨率的时间桶与累计直方图"""
+        v, base = self._slot()
+        offset = 1 + _HIST_INDEX[name] * _HIST_SIZE
+        for ring in _RINGS:
+            bucket = int(now // ring.step)
+            row = base + ring.hist_offset + (bucket % ring.hist_rows) * _HIST_ROW
+            if v[row] != bucket:
+                v[row + 1:row + _HIST_ROW] = _ZEROS[:_HIST_ROW - 1]
+                v[row] = bucket
+            hist = row + offset
+            for index, count in counts.items():
+                v[hist + index] += count
+            v[hist + HIST_BUCKETS] += total_us
+        lifetime = base + _LIFETIME_OFFSET + _HIST_INDEX[name] * _HIST_SIZE
+        for index, count in counts.items():
+            v[lifetime + index] += count
+        v[lifetime + HIST_BUCKETS] += total_us
+
+    # ===== 读取（汇总所有槽位） =====
+
+    def _slot_bases(self):
+        return [HEADER_SIZE + slot * SLOT_SIZE for slot in range(self.slots)]
+
+    def totals(self) -> dict:
+        """所有槽位的计数器之和"""
+        v = self.view
+        counters = [0] * len(COUNTERS)
+        errors = [0] * len(ERROR_TYPES)
+        for base in self._slot_bases():
+            start = base + _COUNTERS_OFFSET
+            for i, value in enumerate(v[start:start + len(COUNTERS)].tolist()):
+                counters[i] += value
+            start = base + _ERRORS_OFFSET
+            for i, value in enumerate(v[start:start + len(ERROR_TYPES)].tolist()):
+                errors[i] += value
+        result = dict(zip(COUNTERS, counters))
+        result["errors_by_type"] = {name: count for name, count in zip(ERROR_TYPES, errors) if count}
+        return result
+
+    def series(self, resolution: str, start_time: float, end_time: float) -> list:
+        """
+        时间范围内每个时间桶的请求数、成功数、错误数、字节数与 token 数（最多为该分辨率的保留期）
+
+        Returns:
+            list: [{"time": 时间桶起始时间戳, "requests", "successes", "errors", "bytes", "input_tokens", "output_tokens"}, ...]
+        """
+        ring = _RING_BY_NAME[resolution]
+        v = self.view
+        last = int(end_time // ring.step)
+        first = max(int(start_time // ring.step), last - ring.rows + 1)
+        bases = [base + ring.series_offset for base in self._slot_bases()]
+        series = []
+        for bucket in range(first, last + 1):
+            values = [0] * len(SERIES_FIELDS)
+            position = (bucket % ring.rows) * _SERIES_ROW
+            for base in bases:
+                row = base + position
+                if v[row] == bucket:
+                    for i, value in enumerate(v[row + 1:row + _SERIES_ROW].tolist()):
+                        values[i] += value
+            series.append({"time": bucket * ring.step, **dict(zip(SERIES_FIELDS, values))})
+        return series
+
+    def histogram_series(self, name: str, resolution: str, start_time: float, end_time: float) -> list:
+        """
+        时间范围内每个时间桶的延迟草图（最多为该分辨率的直方图保留期）
+
+        Returns:
+            list: [(时间桶起始时间戳, LatencySketch), ...]
+        """
+        ring = _RING_BY_NAME[resolution]
+        v = self.view
+        last = int(end_time // ring.step)
+        first = max(int(start_time // ring.step), last - ring.hist_rows + 1)
+        offset = 1 + _HIST_INDEX[name] * _HIST_SIZE
+        bases = [base + ring.hist_offset for base in self._slot_bases()]
+        result = []
+        for bucket in range(first, last + 1):
+            sketch = LatencySketch()
+            position = (bucket % ring.hist_rows) * _HIST_ROW
+            for base in bases:
+                row = base + position
+                if v[row] != bucket:
+                    continue
+                hist = v[row + offset:row + offset + _HIST_SIZE].tolist()
+                sketch.merge(LatencySketch(hist[:HIST_BUCKETS], hist[HIST_BUCKETS] / 1000))
+            result.append((bucket * ring.step, sketch))
+        return result
+
+    def histogram(self, name: str, start_time: float, end_time: float, resolution: str | None = None) -> tuple:
+        """
+        合并时间范围内的直方图，未指定分辨率时按 pick_resolution 选择
+
+        Returns:
+            tuple: (各桶计数列表, 总耗时毫秒)
+        """
+        resolution = resolution or pick_resolution(start_time, end_time, histogram=True)
+        merged = LatencySketch()
+        for _, sketch in self.histogram_series(name, resolution, start_time, end_time):
+            merged.merge(sketch)
+        return merged.counts, merged.total_ms
+
+    def sketch(self, name: str, start_time: float | None = None, end_time: float | None = None) -> LatencySketch:
+        """
+        所有 worker 的延迟草图：指定时间范围时合并范围内的直方图，否则返回启动以来的累计直方图
+        """
+        if start_time is not None:
+            return LatencySketch(*self.histogram(name, start_time, end_time if end_time is not None else time.time()))
+        v = self.view
+        offset = _LIFETIME_OFFSET + _HIST_INDEX[name] * _HIST_SIZE
+        counts = [0] * HIST_BUCKETS
+        total_us = 0
+        for base in self._slot_bases():
+            hist = v[base + offset:base + offset + _HIST_SIZE].tolist()
+            for i in range(HIST_BUCKETS):
+                counts[i] += hist[i]
+            total_us += hist[HIST_BUCKETS]
+        return LatencySketch(counts, total_us / 1000)
+
+    def workers(self) -> list:
+        """已认领槽位的 worker 进程"""
+        v = self.view
+        result = []
+        for slot, base in enumerate(self._slot_bases()):
+            pid = v[base]
+            if pid:
+                result.append({"slot": slot, "pid": pid, "alive": _pid_alive(pid), "claimed_at": v[base + 1]})
+        return result
+
+
+def _default_path() -> str | None:
+    if SHARED_STATS_PATH:
+        return SHARED_STATS_PATH
+    if WORKERS <= 1:
+        return None
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, f"anyrouter-stats-{PORT}.mmap")
+
+
+# 已退出 worker 的槽位可被新 worker 复用，预留一倍的槽位以覆盖重启期间新旧进程同时存在的情况
+shared_stats = SharedStats(_default_path(), slots=max(2, WORKERS * 2))
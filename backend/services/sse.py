@@ -0,0 +1,122 @@
+"""
+SSE 用量解析模块
+
+增量解析上游返回的 SSE（text/event-stream）响应，从 message_start / message_delta 事件中
+提取 token 用量；只读取数据块，不修改也不重组转发给客户端的原始数据块
+"""
+
+import json
+
+# 记录的 token 用量字段（与 Anthropic API usage 字段同名）
+USAGE_FIELDS = (
+    "input_tokens",
+    "output_tokens",
+    "cache_read_input_tokens",
+    "cache_creation_input_tokens"
+)
+
+USAGE_MARKER = b'"usage"'
+CONTENT_DELTA_MARKER = b'"content_block_delta"'
+
+# 跨数据块的未完成行最大缓存长度，超过后丢弃该行（用量事件很短，不会超过）
+MAX_PARTIAL_LINE = 64 * 1024
+
+
+def is_event_stream(headers) -> bool:
+    """响应是否为可直接解析的 SSE 流（压缩透传的响应体未解压，不解析）"""
+    content_type = headers.get("content-type", "")
+    content_encoding = headers.get("content-encoding", "identity").lower()
+    return content_type.startswith("text/event-stream") and content_encoding == "identity"
+
+
+class SSEUsageParser:
+    """
+    SSE 用量解析器
+
+    只在包含 "usage" 的 data 行上做 JSON 解析，其余行（如 content_block_delta）只做一次查找，
+    数据块按原样转发，解析器不复制完整数据块；content_started 表示已收到首个内容增量
+    """
+
+    def __init__(self):
+        self.usage = {}
+        self.content_started = False
+        self._partial = None  # 上一个数据块末尾未完成的行
+        self._overflow = False
+
+    def feed(self, chunk: bytes):
+        """处理一个原始数据块"""
+        if not self.content_started and CONTENT_DELTA_MARKER in chunk:
+            self.content_started = True
+        pos = 0
+        if self._partial is not None:
+            newline = chunk.find(b"\n")
+            if newline < 0:
+                self._append_partial(chunk)
+                return
+            if not self._overflow:
+                self._parse_line(self._partial + chunk[:newline])
+            self._partial = None
+            self._overflow = False
+            pos = newline + 1
+
+        while True:
+            newline = chunk.find(b"\n", pos)
+            if newline < 0:
+                break
+            # 只切出包含 "usage" 的行
+            if chunk.find(USAGE_MARKER, pos, newline) >= 0:
+                self._parse_line(chunk[pos:newline])
+            pos = newline + 1
+
+        if pos < len(chunk):
+            self._partial = b""
+            self._append_partial(chunk[pos:])
+
+    def _append_partial(self, data: bytes):
+        if self._overflow:
+            return
+        if len(self._partial) + len(data) > MAX_PARTIAL_LINE:
+            self._overflow = True
+            self._partial = b""
+        else:
+            self._partial += data
+
+    def _parse_line(self, line: bytes):
+        line = line.rstrip(b"\r")
+        if not line.startswith(b"data:") or USAGE_MARKER not in line:
+            return
+        try:
+            event = json.loads(line[5:])
+        except ValueError:
+            return
+        if not isinstance(event, dict):
+            return
+
+        event_type = event.get("type")
+        if event_type == "message_start":
+            usage = (event.get("message") or {}).get("usage")
+        elif event_type == "message_delta":
+            # message_delta 中的用量为累计值，覆盖 message_start 中的同名字段
+            usage = event.get("usage")
+        else:
+            return
+        if not isinstance(usage, dict):
+            return
+        for field in USAGE_FIELDS:
+            value = usage.get(field)
+            if isinstance(value, int):
+                self.usage[field] = value
+
+    def result(self) -> dict | None:
+        """
+        流结束后获取解析出的用量
+
+        Returns:
+            dict | None: 各字段的 token 数，未解析到用量事件时返回 None
+        """
+        if self._partial and not self._overflow:
+            self._parse_line(self._partial)
+            self._partial = None
+        if not self.usage:
+            return None
+        return {field: self.usage.get(field, 0) for field in USAGE_FIELDS}
@@ -1,7 +1,9 @@
 """
 统计服务模块
 
-负责收集和管理代理服务的统计数据，包括请求统计、性能指标和错误日志
+负责收集和管理代理服务的统计数据，包括请求统计、性能指标和错误日志。
+计数器、延迟直方图与每分钟统计写入共享内存（见 shared_stats），多 worker 部署时查询返回所有 worker 的汇总；
+最近请求、错误日志与路径统计为当前 worker 的明细
 """
 
 import asyncio
@@ -10,20 +12,25 @@ from collections import defaultdict, deque
 from datetime import datetime
 from typing import Optional, Tuple
 
+from ..config import STATS_FLUSH_INTERVAL, RECENT_REQUESTS_SIZE
+from ..utils.logger import get_logger
+from ..utils.request_ring import RequestRing, RequestView
+from ..utils.sketch import LatencySketch, bucket_index
+from .shared_stats import shared_stats, pick_resolution, HISTOGRAMS, RESOLUTION_STEPS
+from .sse import USAGE_FIELDS
+
+logger = get_logger("stats")
+
 # ===== 统计数据收集器 =====
-# 全局统计数据（线程安全）
-stats_lock = asyncio.Lock()
-request_stats = {
-    "total_requests": 0,
-    "successful_requests": 0,
-    "failed_requests": 0,
-    "total_bytes_sent": 0,
-    "total_bytes_received": 0,
-    "start_time": time.time()
-}
+# 请求生命周期事件：代理请求路径上只做 deque.append（不 await、不加锁），
+# 由聚合任务（stats_aggregator）在事件循环线程内批量应用；查询前先同步应用剩余事件，读到的数据总是最新的
+_events = deque()
+# 未应用的事件超过该数量时在请求路径上直接应用一批，避免聚合任务被阻塞时队列无限增长
+STATS_MAX_PENDING = 10000
 
 # 性能指标（最近的请求）
-recent_requests = deque(maxlen=1000)  # 保存最近1000个请求的性能数据
+# 保存最近 RECENT_REQUESTS_SIZE 个请求的性能数据（列式环形缓冲区，request_id 中包含序号，完成时 O(1) 找到对应记录）
+recent_requests = RequestRing(RECENT_REQUESTS_SIZE, nested={"usage": USAGE_FIELDS})
 error_logs = deque(maxlen=500)  # 保存最近500个错误
 
 # 按路径分组的统计
@@ -31,196 +38,464 @@ path_stats = defaultdict(lambda: {
     "count": 0,
     "bytes": 0,
     "errors": 0,
-    "avg_response_time": 0
+    "avg_response_time": 0,
+    # 完整流耗时与首个内容增量耗时的累计（各自按有该数据的请求数求平均）
+    "total_duration": 0.0,
+    "duration_count": 0,
+    "total_first_token_time": 0.0,
+    "first_token_count": 0
 })
 
-# 按时间窗口的统计（用于图表）
-time_window_stats = {
-    "requests_per_minute": deque(maxlen=1440),  # 24小时的分钟数据
-    "errors_per_minute": deque(maxlen=1440),
-    "bytes_per_minute": deque(maxlen=1440)
-}
-
-
-async def record_request_start(path: str, method: str, bytes_sent: int) -> str:
-    """记录请求开始，返回请求ID，并立即添加到 recent_requests"""
-    request_id = f"{int(time.time() * 1000)}-{id(asyncio.current_task())}"
+# 按路径的延迟草图（当前 worker 启动以来的响应头延迟与完整流耗时，固定内存，可与其他草图合并）
+PATH_SKETCHES = ("response_time", "duration")
+# 流式耗时分解的直方图（响应头延迟之外）
+TIMING_HISTOGRAMS = HISTOGRAMS[1:]
+path_latency = defaultdict(lambda: {name: LatencySketch() for name in PATH_SKETCHES})
+
+# 响应缓存来源对应的共享计数器（命中和合并的请求不访问上游，bytes_saved 为因此节省的上游响应字节数）
+CACHE_SOURCE_COUNTERS = {"hit": "cache_hits", "coalesced": "cache_coalesced", "miss": "cache_misses"}
+
+# 批量应用的统计信息
+aggregator_stats = {"events": 0, "batches": 0, "inline_batches": 0, "max_batch": 0}
+
+
+class _Batch:
+    """一批事件的计数器、时间序列与延迟直方图增量，批次结束时每个计数器、每秒的时间桶只写一次共享内存"""
+
+    __slots__ = ("counters", "errors", "seconds", "histograms")
+
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.errors = defaultdict(int)  # 错误类型 -> 次数
+        self.seconds = {}  # 秒 -> [请求数, 成功数, 错误数, 字节数, 输入 token 数, 输出 token 数]
+        self.histograms = {}  # (秒, 直方图名称) -> [{桶序号: 次数}, 总耗时微秒]
+
+    def add_series(self, now: float, requests: int = 0, successes: int = 0, errors: int = 0,
+                   bytes_count: int = 0, input_tokens: int = 0, output_tokens: int = 0):
+        second = int(now)
+        row = self.seconds.get(second)
+        if row is None:
+            row = self.seconds[second] = [0, 0, 0, 0, 0, 0]
+        row[0] += requests
+        row[1] += successes
+        row[2] += errors
+        row[3] += bytes_count
+        row[4] += input_tokens
+        row[5] += output_tokens
+
+    def observe(self, name: str, seconds: float | None, second: int):
+        if seconds is None:
+            return
+        ms = seconds * 1000 if seconds > 0 else 0.0
+        key = (second, name)
+        entry = self.histograms.get(key)
+        if entry is None:
+            entry = self.histograms[key] = [defaultdict(int), 0]
+        entry[0][bucket_index(ms)] += 1
+        entry[1] += int(ms * 1000)
+
+    def commit(self):
+        for name, value in self.counters.items():
+            shared_stats.incr(name, value)
+        for error_type, value in self.errors.items():
+            shared_stats.incr_error(error_type, value)
+        for second, values in self.seconds.items():
+            shared_stats.add_series(second, *values)
+        for (second, name), (counts, total_us) in self.histograms.items():
+            shared_stats.add_histogram(second, name, counts, total_us)
+
+
+def _emit(event: tuple):
+    _events.append(event)
+    if len(_events) >= STATS_MAX_PENDING:
+        aggregator_stats["inline_batches"] += 1
+        apply_stats_events()
+
+
+def _observe_timings(batch: _Batch, path: str, response_time: float, timings: dict | None, now: float):
+    """记录响应头延迟与流式耗时分解到共享延迟直方图与路径的延迟草图"""
+    sketches = path_latency[path]
+    second = int(now)
+    if response_time > 0:
+        batch.observe("response_time", response_time, second)
+        sketches["response_time"].add(response_time)
+    if timings:
+        for name in TIMING_HISTOGRAMS:
+            batch.observe(name, timings.get(name), second)
+        sketches["duration"].add(timings.get("duration"))
+
+
+def record_request_start(path: str, method: str, bytes_sent: int) -> str:
+    """记录请求开始，返回请求ID（记录在下一批事件应用时写入 recent_requests 的对应序号，状态为 pending）"""
     current_time = time.time()
+    seq = recent_requests.allocate()
+    request_id = f"{int(current_time * 1000)}-{seq}"
+    _emit((_apply_start, (seq, request_id, path, method, bytes_sent, current_time)))
+    return request_id
 
-    async with stats_lock:
-        request_stats["total_requests"] += 1
-        request_stats["total_bytes_sent"] += bytes_sent
-        path_stats[path]["count"] += 1
-        path_stats[path]["bytes"] += bytes_sent
 
-        # 立即添加到 recent_requests（状态为 pending）
-        recent_requests.append({
-            "request_id": request_id,
-            "path": path,
-            "method": method,
-            "status": "pending",  # 标记为进行中
-            "status_code": None,  # 尚未完成，无状态码
-            "bytes": 0,
-            "response_time": 0,
-            "timestamp": current_time
-        })
+def record_request_bytes_sent(path: str, bytes_sent: int):
+    """记录流式转发的请求体字节数（请求体在上传完成后才知道实际大小）"""
+    if bytes_sent > 0:
+        _emit((_apply_bytes_sent, (path, bytes_sent)))
 
-    return request_id
 
-
-async def record_request_success(
+def record_request_success(
     request_id: str,
     path: str,
     method: str,
     bytes_received: int,
     response_time: float,
-    status_code: int
+    status_code: int,
+    upstream: str | None = None,
+    attempts: int = 1,
+    cache: str | None = None,
+    usage: dict | None = None,
+    timings: dict | None = None
 ):
-    """记录成功请求，更新已存在的记录"""
-    async with stats_lock:
-        existing_req = None
-        for req in reversed(recent_requests):
-            if req["request_id"] == request_id:
-                existing_req = req
-                break
-
-        # 如果请求已被标记为超时或错误，直接跳过，避免成功与失败双计数
-        if existing_req and (existing_req.get("status_code") == 504 or existing_req.get("error")):
-            return
+    """
+    记录成功请求，更新已存在的记录
+
+    response_time 为收到上游响应头的耗时；upstream 为实际处理请求的上游名称，
+    attempts 为含重试的上游请求次数，cache 为响应缓存来源（hit / coalesced，未走缓存时为 None），
+    usage 为从 SSE 流中解析出的 token 用量，timings 为 StreamTimings.result() 的耗时分解
+    """
+    _emit((_apply_success, (
+        request_id, path, method, bytes_received, response_time, status_code,
+        upstream, attempts, cache, usage, timings, time.time()
+    )))
 
-        request_stats["successful_requests"] += 1
-        request_stats["total_bytes_received"] += bytes_received
-
-        # 更新路径统计
-        current_avg = path_stats[path]["avg_response_time"]
-        count = path_stats[path]["count"]
-        path_stats[path]["avg_response_time"] = (current_avg * (count - 1) + response_time) / count
-
-        # 查找并更新 recent_requests 中的记录
-        found = False
-        if existing_req:
-            existing_req["status"] = "completed"
-            existing_req["status_code"] = status_code
-            existing_req["bytes"] = bytes_received
-            existing_req["response_time"] = response_time
-            found = True
-
-        # 如果没找到（可能被 deque 清除了），则添加新记录
-        if not found:
-            recent_requests.append({
-                "request_id": request_id,
-                "path": path,
-                "method": method,
-                "status": "completed",
-                "status_code": status_code,
-                "bytes": bytes_received,
-                "response_time": response_time,
-                "timestamp": time.time()
-            })
-
-
-async def record_request_error(
+
+def record_request_error(
     request_id: str,
     path: str,
     method: str,
     error_msg: str,
     response_time: float = 0,
     response_content: str = None,
-    status_code: int | None = None
+    status_code: int | None = None,
+    error_type: str | None = None,
+    upstream: str | None = None,
+    attempts: int = 1,
+    timings: dict | None = None
 ):
-    """记录请求错误，更新已存在的记录"""
-    async with stats_lock:
-        existing_req = None
-        for req in reversed(recent_requests):
-            if req["request_id"] == request_id:
-                existing_req = req
-                break
-
-        # 如果请求已被标记为成功，直接跳过，避免成功与失败双计数
-        if existing_req and existing_req.get("status_code") is not None and existing_req.get("status_code", 0) < 400 and not existing_req.get("error"):
-            return
-
-        request_stats["failed_requests"] += 1
-        path_stats[path]["errors"] += 1
-
-        # 记录错误日志
-        error_logs.append({
+    """
+    记录请求错误，更新已存在的记录
+
+    error_type 为错误分类（如 connect_timeout / first_byte_timeout / idle_timeout / http_error），
+    用于按类型统计错误以便调整超时配置；timings 为已开始流式传输的请求的耗时分解
+    """
+    _emit((_apply_error, (
+        request_id, path, method, error_msg, response_time, response_content,
+        status_code, error_type, upstream, attempts, timings, time.time()
+    )))
+
+
+def record_cache_result(source: str, body_bytes: int):
+    """
+    记录一次响应缓存查询结果
+
+    Args:
+        source: "hit"（缓存命中）/ "coalesced"（合并到进行中的请求）/ "miss"（访问上游）
+        body_bytes: 响应体字节数，命中和合并时计入节省的字节数
+    """
+    _emit((_apply_cache_result, (source, body_bytes)))
+
+
+# ===== 事件应用（只在事件循环线程内调用，过程中没有 await，无需加锁） =====
+
+def _apply_start(batch: _Batch, seq: int, request_id: str, path: str, method: str, bytes_sent: int, now: float):
+    batch.counters["total_requests"] += 1
+    batch.counters["total_bytes_sent"] += bytes_sent
+    batch.add_series(now, requests=1)
+    path_stats[path]["count"] += 1
+    path_stats[path]["bytes"] += bytes_sent
+    recent_requests.put(seq, {
+        "path": path,
+        "method": method,
+        "status": "pending",  # 标记为进行中
+        "status_code": None,  # 尚未完成，无状态码
+        "bytes": 0,
+        "response_time": 0,
+        "timestamp": now
+    }, request_id)
+
+
+def _apply_bytes_sent(batch: _Batch, path: str, bytes_sent: int):
+    batch.counters["total_bytes_sent"] += bytes_sent
+    path_stats[path]["bytes"] += bytes_sent
+
+
+def _apply_cache_result(batch: _Batch, source: str, body_bytes: int):
+    batch.counters[CACHE_SOURCE_COUNTERS[source]] += 1
+    if source != "miss":
+        batch.counters["cache_bytes_saved"] += body_bytes
+
+
+def _record_path_timings(path: str, timings: dict | None):
+    """累计路径的流耗时与首 token 耗时"""
+    if not timings:
+        return
+    stats = path_stats[path]
+    stats["total_duration"] += timings["duration"]
+    stats["duration_count"] += 1
+    if timings["first_token_time"] is not None:
+        stats["total_first_token_time"] += timings["first_token_time"]
+        stats["first_token_count"] += 1
+
+
+def _apply_success(
+    batch: _Batch, request_id, path, method, bytes_received, response_time, status_code,
+    upstream, attempts, cache, usage, timings, now
+):
+    slot = recent_requests.find(request_id)
+
+    # 如果请求已被标记为超时或错误，直接跳过，避免成功与失败双计数
+    if slot is not None and (recent_requests.value(slot, "status_code") == 504 or recent_requests.value(slot, "error")):
+        return
+
+    generation_time = timings["duration"] - response_time if timings else 0.0
+    output_tps = None
+    if usage:
+        output_tps = usage["output_tokens"] / generation_time if generation_time > 0 else None
+
+    counters = batch.counters
+    counters["successful_requests"] += 1
+    counters["total_bytes_received"] += bytes_received
+    _observe_timings(batch, path, response_time, timings, now)
+    if usage:
+        counters["token_requests"] += 1
+        for field, value in usage.items():
+            counters[field] += value
+        counters["generation_ms"] += int(generation_time * 1000)
+        batch.add_series(now, successes=1, bytes_count=bytes_received,
+                         input_tokens=usage.get("input_tokens", 0), output_tokens=usage.get("output_tokens", 0))
+    else:
+        batch.add_series(now, successes=1, bytes_count=bytes_received)
+
+    # 更新路径统计
+    current_avg = path_stats[path]["avg_response_time"]
+    count = path_stats[path]["count"]
+    path_stats[path]["avg_response_time"] = (current_avg * (count - 1) + response_time) / count
+    _record_path_timings(path, timings)
+
+    # 更新 recent_requests 中的记录
+    if slot is not None:
+        fields = {
+            "status": "completed",
+            "status_code": status_code,
+            "bytes": bytes_received,
+            "response_time": response_time,
+            "upstream": upstream,
+            "attempts": attempts
+        }
+        if cache:
+            fields["cache"] = cache
+        if usage:
+            fields["usage"] = usage
+            fields["output_tokens_per_second"] = output_tps
+        if timings:
+            fields.update(timings)
+        recent_requests.update(slot, fields)
+    else:
+        # 没找到（可能已滑出窗口），则添加新记录
+        recent_requests.append({
             "request_id": request_id,
             "path": path,
-            "error": error_msg,
+            "method": method,
+            "status": "completed",
             "status_code": status_code,
-            "response_content": response_content,
-            "timestamp": time.time(),
-            "response_time": response_time
+            "bytes": bytes_received,
+            "response_time": response_time,
+            "upstream": upstream,
+            "attempts": attempts,
+            "cache": cache,
+            "usage": usage,
+            "output_tokens_per_second": output_tps,
+            **(timings or {}),
+            "timestamp": now
         })
 
-        # 查找并更新 recent_requests 中的记录
-        found = False
-        if existing_req:
-            existing_req["status"] = "completed"
-            existing_req["status_code"] = status_code
-            existing_req["error"] = error_msg
-            existing_req["response_content"] = response_content
-            existing_req["response_time"] = response_time
-            found = True
-
-        # 如果没找到，则添加新记录
-        if not found:
-            recent_requests.append({
-                "request_id": request_id,
-                "path": path,
-                "method": method,
-                "status": "completed",
-                "status_code": status_code,
-                "error": error_msg,
-                "response_content": response_content,
-                "response_time": response_time,
-                "timestamp": time.time()
-            })
-
-
-async def update_time_window_stats():
-    """更新时间窗口统计（每分钟调用一次）"""
-    current_time = time.time()
-    # 将当前时间戳向下取整到分钟级别（秒级时间戳）
-    current_minute_timestamp = int(current_time // 60) * 60
-
-    async with stats_lock:
-        # 计算本分钟的请求数
-        minute_requests = sum(1 for req in recent_requests
-                            if req["timestamp"] > current_time - 60)
-        minute_errors = sum(1 for req in recent_requests
-                          if (
-                              (req.get("status_code") is not None and req.get("status_code", 0) >= 400) or
-                              req.get("status") == "error"
-                          ) and req["timestamp"] > current_time - 60)
-        minute_bytes = sum(req.get("bytes", 0) for req in recent_requests
-                         if req["timestamp"] > current_time - 60)
-
-        time_window_stats["requests_per_minute"].append({
-            "time": current_minute_timestamp,  # 使用 Unix 时间戳（秒级）
-            "count": minute_requests
-        })
-        time_window_stats["errors_per_minute"].append({
-            "time": current_minute_timestamp,  # 使用 Unix 时间戳（秒级）
-            "count": minute_errors
+
+def _apply_error(
+    batch: _Batch, request_id, path, method, error_msg, response_time, response_content,
+    status_code, error_type, upstream, attempts, timings, now
+):
+    slot = recent_requests.find(request_id)
+
+    # 如果请求已被标记为成功、超时或错误，直接跳过，避免成功与失败双计数、同一请求的错误重复计数
+    if slot is not None:
+        existing_status = recent_requests.value(slot, "status_code")
+        if recent_requests.value(slot, "error") or (existing_status is not None and (existing_status < 400 or existing_status == 504)):
+            return
+
+    batch.counters["failed_requests"] += 1
+    batch.errors[error_type] += 1
+    batch.add_series(now, errors=1)
+    _observe_timings(batch, path, response_time, timings, now)
+    path_stats[path]["errors"] += 1
+    _record_path_timings(path, timings)
+
+    # 记录错误日志
+    error_logs.append({
+        "request_id": request_id,
+        "path": path,
+        "error": error_msg,
+        "error_type": error_type,
+        "upstream": upstream,
+        "attempts": attempts,
+        "status_code": status_code,
+        "response_content": response_content,
+        "timestamp": now,
+        "response_time": response_time
+    })
+
+    # 更新 recent_requests 中的记录
+    if slot is not None:
+        recent_requests.update(slot, {
+            "status": "completed",
+            "status_code": status_code,
+            "error": error_msg,
+            "error_type": error_type,
+            "upstream": upstream,
+            "attempts": attempts,
+            "response_content": response_content,
+            "response_time": response_time,
+            **(timings or {})
         })
-        time_window_stats["bytes_per_minute"].append({
-            "time": current_minute_timestamp,  # 使用 Unix 时间戳（秒级）
-            "count": minute_bytes
+    else:
+        # 没找到，则添加新记录
+        recent_requests.append({
+            "request_id": request_id,
+            "path": path,
+            "method": method,
+            "status": "completed",
+            "status_code": status_code,
+            "error": error_msg,
+            "error_type": error_type,
+            "upstream": upstream,
+            "attempts": attempts,
+            "response_content": response_content,
+            "response_time": response_time,
+            **(timings or {}),
+            "timestamp": now
         })
 
 
-async def periodic_stats_update():
-    """定期更新统计数据"""
-    while True:
+def apply_stats_events() -> int:
+    """
+    按顺序应用队列中的全部事件（聚合任务定期调用，查询统计前也会调用）
+
+    Returns:
+        int: 应用的事件数
+    """
+    events = _events
+    if not events:
+        return 0
+    batch = _Batch()
+    applied = 0
+    while events:
+        apply, args = events.popleft()
         try:
-            await update_time_window_stats()
+            apply(batch, *args)
         except Exception as e:
-            print(f"[Stats] Failed to update time window stats: {e}")
-
-        # 每分钟更新一次
-        await asyncio.sleep(60)
+            logger.error("Failed to apply stats event", event=apply.__name__, error=str(e))
+        applied += 1
+    batch.commit()
+    aggregator_stats["events"] += applied
+    aggregator_stats["batches"] += 1
+    aggregator_stats["max_batch"] = max(aggregator_stats["max_batch"], applied)
+    return applied
+
+
+async def stats_aggregator():
+    """定期批量应用统计事件（后台任务），取消时应用剩余事件"""
+    try:
+        while True:
+            await asyncio.sleep(STATS_FLUSH_INTERVAL)
+            apply_stats_events()
+    finally:
+        apply_stats_events()
+
+
+def get_aggregator_stats() -> dict:
+    """统计事件队列的积压与批量应用情况，以及最近请求窗口的容量与列存储占用"""
+    return {
+        **aggregator_stats,
+        "pending": len(_events),
+        "flush_interval": STATS_FLUSH_INTERVAL,
+        "recent_capacity": recent_requests.capacity,
+        "recent_bytes": recent_requests.nbytes()
+    }
+
+
+def get_request_totals() -> dict:
+    """所有 worker 的累计计数器（请求数、字节数、token 用量、缓存与按类型的错误数）"""
+    apply_stats_events()
+    return shared_stats.totals()
+
+
+def get_response_cache_summary(totals: dict | None = None) -> dict:
+    """响应缓存命中率（命中与合并都视为未访问上游）与节省的字节数"""
+    totals = totals or get_request_totals()
+    hits = totals["cache_hits"]
+    coalesced = totals["cache_coalesced"]
+    total = hits + coalesced + totals["cache_misses"]
+    return {
+        "hits": hits,
+        "coalesced": coalesced,
+        "misses": totals["cache_misses"],
+        "bytes_saved": totals["cache_bytes_saved"],
+        "bytes_saved_formatted": format_bytes(totals["cache_bytes_saved"]),
+        "hit_ratio": (hits + coalesced) / total if total > 0 else 0.0
+    }
+
+
+def get_token_usage_summary(totals: dict | None = None) -> dict:
+    """token 用量累计、输出速度与 prompt 缓存命中率（缓存读取 token 占全部输入 token 的比例）"""
+    totals = totals or get_request_totals()
+    prompt_tokens = (
+        totals["input_tokens"]
+        + totals["cache_read_input_tokens"]
+        + totals["cache_creation_input_tokens"]
+    )
+    generation_seconds = totals["generation_ms"] / 1000
+    return {
+        "requests": totals["token_requests"],
+        "input_tokens": totals["input_tokens"],
+        "output_tokens": totals["output_tokens"],
+        "cache_read_input_tokens": totals["cache_read_input_tokens"],
+        "cache_creation_input_tokens": totals["cache_creation_input_tokens"],
+        "generation_seconds": generation_seconds,
+        "output_tokens_per_second": totals["output_tokens"] / generation_seconds if generation_seconds > 0 else 0.0,
+        "cache_hit_ratio": totals["cache_read_input_tokens"] / prompt_tokens if prompt_tokens > 0 else 0.0
+    }
+
+
+def get_uptime_seconds() -> float:
+    """统计起始（共享统计段创建）至今的秒数"""
+    return time.time() - shared_stats.created_at
+
+
+def get_latency_summary(name: str, start_time: float | None = None, end_time: float | None = None) -> dict:
+    """
+    所有 worker 的延迟分布：指定时间范围时为范围内的分布，否则为统计起始以来的分布
+
+    范围按长度选择秒级 / 分钟级 / 小时级直方图，分别保留最近 2 分钟 / 60 分钟 / 48 小时，
+    超出所选分辨率保留期的部分不计入
+
+    Returns:
+        dict: {"count", "avg", "p50", "p95", "p99", "p999"}，单位为毫秒
+    """
+    return shared_stats.sketch(name, start_time, end_time).summary()
+
+
+def get_path_latency(path: str) -> dict:
+    """当前 worker 中某个路径的响应头延迟与完整流耗时分布（毫秒）"""
+    sketches = path_latency.get(path)
+    if sketches is None:
+        return {name: LatencySketch().summary() for name in PATH_SKETCHES}
+    return {name: sketch.summary() for name, sketch in sketches.items()}
 
 
 # ===== 工具函数 =====
@@ -244,8 +519,51 @@ def calculate_percentiles(values: list, percentiles: list = [50, 95, 99]) -> dic
     return {p: sorted_values[int(p * n / 100)] for p in percentiles}
 
 
+# 时间序列输出的字段（与 shared_stats.SERIES_FIELDS 对应）
+TIME_SERIES_FIELDS = ("requests", "successes", "errors", "bytes", "input_tokens", "output_tokens")
+
+
+def get_time_series(start_time: float, end_time: float, latency_name: str = "response_time") -> dict:
+    """
+    所有 worker 的时间序列，按时间范围选择分辨率（10 分钟内为秒级，24 小时内为分钟级，更长为小时级）
+
+    Returns:
+        dict: {
+            "resolution", "step": 分辨率名称与时间桶长度（秒）,
+            "requests" / "successes" / "errors" / "bytes" / "input_tokens" / "output_tokens": [{"time", "count"}, ...],
+            "totals": 各字段在范围内的合计,
+            "latency": 按直方图保留期选择分辨率的延迟分布序列 {"resolution", "step", "points": [{"time", "count", "p50", ...}]}
+        }
+    """
+    # 分辨率按请求的范围选择，读取时从统计起始的时间桶开始
+    resolution = pick_resolution(start_time, end_time)
+    latency_resolution = pick_resolution(start_time, end_time, histogram=True)
+    start_time = max(start_time, shared_stats.created_at)
+    points = shared_stats.series(resolution, start_time, end_time)
+    result = {"resolution": resolution, "step": RESOLUTION_STEPS[resolution]}
+    for field in TIME_SERIES_FIELDS:
+        result[field] = [{"time": point["time"], "count": point[field]} for point in points]
+    result["totals"] = {field: sum(point[field] for point in points) for field in TIME_SERIES_FIELDS}
+
+    result["latency"] = {
+        "resolution": latency_resolution,
+        "step": RESOLUTION_STEPS[latency_resolution],
+        "points": [
+            {"time": bucket_time, **sketch.summary()}
+            for bucket_time, sketch in shared_stats.histogram_series(latency_name, latency_resolution, start_time, end_time)
+        ]
+    }
+    return result
+
+
 async def get_time_filtered_data(start_time: float = None, end_time: float = None) -> Tuple:
-    """获取时间过滤的数据"""
+    """
+    获取时间过滤的数据
+
+    Returns:
+        tuple: (RequestView, 错误日志列表, 时间序列)；最近请求按时间戳列过滤，
+        视图的 len() 不生成 dict，需要明细时调用 tail(limit) 只生成最新的 limit 条
+    """
     current_time = time.time()
 
     # 默认时间范围：最近1小时
@@ -254,34 +572,18 @@ async def get_time_filtered_data(start_time: float = None, end_time: float = Non
     if not end_time:
         end_time = current_time
 
-    async with stats_lock:
-        # 过滤最近的请求
-        filtered_requests = [
-            req for req in recent_requests
-            if start_time <= req["timestamp"] <= end_time
-        ]
+    apply_stats_events()
 
-        # 过滤错误日志
-        filtered_errors = [
-            error for error in error_logs
-            if start_time <= error["timestamp"] <= end_time
-        ]
+    # 过滤最近的请求（只读取时间戳列）
+    filtered_requests: RequestView = recent_requests.select(start_time, end_time)
 
-        # 过滤时间窗口统计（time 字段现在是 Unix 时间戳）
-        filtered_time_series = {
-            "requests_per_minute": [
-                data for data in time_window_stats["requests_per_minute"]
-                if start_time <= data["time"] <= end_time
-            ],
-            "errors_per_minute": [
-                data for data in time_window_stats["errors_per_minute"]
-                if start_time <= data["time"] <= end_time
-            ],
-            "bytes_per_minute": [
-                data for data in time_window_stats["bytes_per_minute"]
-                if start_time <= data["time"] <= end_time
-            ]
-        }
+    # 过滤错误日志
+    filtered_errors = [
+        error for error in error_logs
+        if start_time <= error["timestamp"] <= end_time
+    ]
+
+    filtered_time_series = get_time_series(start_time, end_time)
 
     return filtered_requests, filtered_errors, filtered_time_series
 
@@ -297,29 +599,29 @@ async def cleanup_stale_requests():
             current_time = time.time()
             stale_requests = []  # 收集超时请求，统一记录错误
 
-            async with stats_lock:
-                # 遍历并标记超时的 pending 请求
-                for req in list(recent_requests):
-                    if req.get("status") == "pending":
-                        age = current_time - req["timestamp"]
-                        if age > TIMEOUT_SECONDS:
-                            stale_requests.append({
-                                "request_id": req["request_id"],
-                                "path": req["path"],
-                                "method": req["method"],
-                                "response_time": age
-                            })
+            apply_stats_events()
+            # 遍历并标记超时的 pending 请求（只为进行中的记录读取字段）
+            for slot in recent_requests.matching("status", "pending"):
+                age = current_time - recent_requests.value(slot, "timestamp")
+                if age > TIMEOUT_SECONDS:
+                    stale_requests.append({
+                        "request_id": recent_requests.request_id(slot),
+                        "path": recent_requests.value(slot, "path"),
+                        "method": recent_requests.value(slot, "method"),
+                        "response_time": age
+                    })
 
             for req in stale_requests:
-                await record_request_error(
+                record_request_error(
                     req["request_id"],
                     req["path"],
                     req["method"],
                     f"请求超时（{req['response_time']:.0f}秒）",
                     response_time=req["response_time"],
-                    status_code=504
+                    status_code=504,
+                    error_type="stale_timeout"
                 )
-                print(f"[Stats] Request {req['request_id']} timed out after {req['response_time']:.0f}s")
+                logger.warning(f"Request {req['request_id']} timed out after {req['response_time']:.0f}s", path=req["path"])
 
         except Exception as e:
-            print(f"[Stats] Failed to cleanup stale requests: {e}")
+            logger.error("Failed to cleanup stale requests", error=str(e))
@@ -0,0 +1,50 @@
+"""
+请求耗时分解模块
+
+把一次代理请求的耗时拆分为：响应头延迟、首个响应体字节、首个内容增量（SSE content_block_delta）、
+流结束时间，以及上游数据块之间的间隔，用于区分"上游慢"（首字节/间隔大）和"模型慢"（首 token 晚、输出慢）
+"""
+
+import time
+
+
+class StreamTimings:
+    """
+    单个请求的耗时记录（时间均为相对请求开始的秒数）
+
+    数据块间隔只统计等待上游数据的时间，不包含向客户端写出的时间
+    """
+
+    def __init__(self, start_time: float):
+        self.start_time = start_time
+        self.first_byte_time = None
+        self.first_token_time = None
+        self.chunks = 0
+        self.gap_total = 0.0
+        self.gap_max = 0.0
+
+    def on_chunk(self, wait: float):
+        """收到一个上游数据块，wait 为等待该数据块的时间"""
+        self.chunks += 1
+        if self.first_byte_time is None:
+            self.first_byte_time = time.time() - self.start_time
+            return
+        self.gap_total += wait
+        if wait > self.gap_max:
+            self.gap_max = wait
+
+    def on_first_token(self):
+        if self.first_token_time is None:
+            self.first_token_time = time.time() - self.start_time
+
+    def result(self) -> dict:
+        """流结束时调用，返回写入 recent_requests 的耗时字段"""
+        gaps = self.chunks - 1
+        return {
+            "first_byte_time": self.first_byte_time,
+            "first_token_time": self.first_token_time,
+            "duration": time.time() - self.start_time,
+            "chunks": self.chunks,
+            "chunk_gap_avg": self.gap_total / gaps if gaps > 0 else None,
+            "chunk_gap_max": self.gap_max if gaps > 0 else None
+        }
@@ -0,0 +1,384 @@
+"""
+上游连接服务模块
+
+负责创建共享的 httpx.AsyncClient（连接池、HTTP/2、代理），启动时预热连接，
+按路径解析分阶段超时，并通过 httpcore trace 事件统计连接池占用和排队等待时间
+"""
+
+import asyncio
+import fnmatch
+import json
+import os
+import time
+from collections import deque
+from typing import NamedTuple
+
+import httpx
+
+from ..config import (
+    UPSTREAM_MAX_CONNECTIONS,
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+    UPSTREAM_KEEPALIVE_EXPIRY,
+    UPSTREAM_HTTP2,
+    UPSTREAM_PREWARM_CONNECTIONS,
+    UPSTREAM_CONNECT_TIMEOUT,
+    UPSTREAM_POOL_TIMEOUT,
+    UPSTREAM_WRITE_TIMEOUT,
+    UPSTREAM_FIRST_BYTE_TIMEOUT,
+    UPSTREAM_IDLE_TIMEOUT,
+    UPSTREAM_TIMEOUT_RULES
+)
+from ..utils.logger import get_logger
+from .balancer import upstreams
+from .stats import calculate_percentiles
+
+logger = get_logger("upstream")
+
+# 当前使用的共享客户端（由 create_http_client 设置）
+_http_client: httpx.AsyncClient = None  # type: ignore
+_http2_enabled = False
+
+# 连接池实时占用统计读取 httpx / httpcore 的内部属性，只在这些版本上验证过（requirements.txt 固定 httpx 版本）；
+# 其他版本上读取失败时只影响这部分统计
+POOL_INTROSPECTION_HTTPX_VERSIONS = ("0.28.",)
+
+# 连接池指标
+pool_metrics = {
+    "requests": 0,
+    "new_connections": 0,
+    "reused_connections": 0,
+    "pool_wait_total": 0.0,
+    "pool_wait_max": 0.0,
+    "connect_time_total": 0.0,
+    "prewarmed_connections": 0
+}
+recent_pool_waits = deque(maxlen=1000)  # 最近的连接池等待时间（秒）
+
+
+class TimeoutPolicy(NamedTuple):
+    """单个请求的分阶段超时（秒，None 表示不限制）"""
+    connect: float | None
+    pool: float | None
+    write: float | None
+    first_byte: float | None
+    idle: float | None
+
+    def to_httpx(self) -> httpx.Timeout:
+        """
+        转换为 httpx 超时：首字节与空闲超时由代理自行计时，以便区分错误类型，
+        因此 httpx 的 read 超时不设限
+        """
+        return httpx.Timeout(connect=self.connect, pool=self.pool, write=self.write, read=None)
+
+
+def _timeout_value(value) -> float | None:
+    """将配置值转换为超时秒数，0 或负数表示不限制"""
+    value = float(value)
+    return value if value > 0 else None
+
+
+DEFAULT_TIMEOUT_POLICY = TimeoutPolicy(
+    connect=_timeout_value(UPSTREAM_CONNECT_TIMEOUT),
+    pool=_timeout_value(UPSTREAM_POOL_TIMEOUT),
+    write=_timeout_value(UPSTREAM_WRITE_TIMEOUT),
+    first_byte=_timeout_value(UPSTREAM_FIRST_BYTE_TIMEOUT),
+    idle=_timeout_value(UPSTREAM_IDLE_TIMEOUT)
+)
+
+
+def parse_timeout_rules(raw: str) -> list:
+    """
+    解析按路径覆盖的超时配置
+
+    Args:
+        raw: JSON 字符串，形如 {"v1/messages*": {"first_byte": 600, "idle": 120}}
+
+    Returns:
+        list: [(路径通配模式, TimeoutPolicy), ...]，保持配置中的顺序
+    """
+    if not raw.strip():
+        return []
+    try:
+        rules = json.loads(raw)
+        if not isinstance(rules, dict):
+            raise ValueError(f"expected a JSON object, got {type(rules).__name__}")
+        parsed = []
+        for pattern, overrides in rules.items():
+            unknown = set(overrides) - set(TimeoutPolicy._fields)
+            if unknown:
+                raise ValueError(f"unknown timeout fields for '{pattern}': {sorted(unknown)}")
+            values = {name: _timeout_value(value) for name, value in overrides.items()}
+            parsed.append((pattern.lstrip("/"), DEFAULT_TIMEOUT_POLICY._replace(**values)))
+        return parsed
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.warning("Invalid UPSTREAM_TIMEOUT_RULES, using default timeouts for all paths", rules=raw, error=str(e))
+        return []
+
+
+timeout_rules = parse_timeout_rules(UPSTREAM_TIMEOUT_RULES)
+
+
+def get_timeout_policy(path: str) -> TimeoutPolicy:
+    """
+    获取指定路径的超时策略（按配置顺序首个匹配的规则生效）
+
+    Args:
+        path: 请求路径（不含开头的 /）
+
+    Returns:
+        TimeoutPolicy: 匹配到的超时策略，未匹配时返回全局默认值
+    """
+    for pattern, policy in timeout_rules:
+        if fnmatch.fnmatchcase(path, pattern):
+            return policy
+    return DEFAULT_TIMEOUT_POLICY
+
+
+def classify_request_error(error: httpx.RequestError) -> str:
+    """
+    将 httpx 请求异常归类为错误类型，用于按类型统计错误
+
+    Returns:
+        str: connect_timeout / pool_timeout / write_timeout / read_timeout /
+             connect_error / protocol_error / request_error
+    """
+    if isinstance(error, httpx.ConnectTimeout):
+        return "connect_timeout"
+    if isinstance(error, httpx.PoolTimeout):
+        return "pool_timeout"
+    if isinstance(error, httpx.WriteTimeout):
+        return "write_timeout"
+    if isinstance(error, httpx.ReadTimeout):
+        return "read_timeout"
+    if isinstance(error, httpx.ConnectError):
+        return "connect_error"
+    if isinstance(error, httpx.ProtocolError):
+        return "protocol_error"
+    return "request_error"
+
+
+def _http2_available() -> bool:
+    """检查是否安装了 HTTP/2 依赖 h2"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    按环境变量创建共享的上游 HTTP 客户端
+
+    Returns:
+        httpx.AsyncClient: 配置好连接池、HTTP/2 与代理的客户端
+    """
+    global _http_client, _http2_enabled
+
+    limits = httpx.Limits(
+        max_connections=UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY
+    )
+
+    http2 = UPSTREAM_HTTP2
+    if http2 and not _http2_available():
+        logger.warning("HTTP/2 requested but 'h2' is not installed, falling back to HTTP/1.1")
+        http2 = False
+    _http2_enabled = http2
+
+    # 读取代理配置
+    http_proxy = os.getenv("HTTP_PROXY")
+    https_proxy = os.getenv("HTTPS_PROXY")
+
+    # 构建 mounts 配置（httpx 0.28.0+ 的新语法）
+    # 注意：使用 mounts 时客户端自身的 limits/http2 不会作用于这些 transport，需要分别传入
+    mounts = {}
+
+    if http_proxy:
+        # 确保代理 URL 包含协议
+        if "://" not in http_proxy:
+            http_proxy = f"http://{http_proxy}"
+        mounts["http://"] = httpx.AsyncHTTPTransport(proxy=http_proxy, limits=limits, http2=http2)
+        logger.info("HTTP proxy configured", proxy=http_proxy)
+
+    if https_proxy:
+        # 注意：HTTPS 代理通常也使用 http:// 协议（这不是错误！）
+        if "://" not in https_proxy:
+            https_proxy = f"http://{https_proxy}"
+        mounts["https://"] = httpx.AsyncHTTPTransport(proxy=https_proxy, limits=limits, http2=http2)
+        logger.info("HTTPS proxy configured", proxy=https_proxy)
+
+    _http_client = httpx.AsyncClient(
+        follow_redirects=False,
+        timeout=DEFAULT_TIMEOUT_POLICY.to_httpx(),
+        limits=limits,
+        http2=http2,
+        mounts=mounts or None
+    )
+
+    logger.info(
+        "HTTP client initialized",
+        protocol="HTTP/2" if http2 else "HTTP/1.1",
+        max_connections=UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive=UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+        proxy_mounts=list(mounts.keys())
+    )
+    logger.info(
+        "Upstream timeouts",
+        **DEFAULT_TIMEOUT_POLICY._asdict(),
+        path_rules=[pattern for pattern, _ in timeout_rules]
+    )
+    if not httpx.__version__.startswith(POOL_INTROSPECTION_HTTPX_VERSIONS):
+        logger.warning(
+            "Untested httpx version, connection pool occupancy stats may be unavailable",
+            httpx_version=httpx.__version__
+        )
+    return _http_client
+
+
+async def prewarm_connections(client: httpx.AsyncClient, count: int = UPSTREAM_PREWARM_CONNECTIONS):
+    """
+    并发向每个上游发送 HEAD 请求，提前完成 TCP/TLS 握手，使连接进入连接池保活
+
+    启用 HTTP/2 时并发请求在同一连接上多路复用，每个上游实际只建立一个连接；
+    prewarmed_connections 按实际新建的连接数计数（来自 PoolTrace），而不是成功的请求数
+
+    Args:
+        client: 共享客户端
+        count: 每个上游的预热连接数
+    """
+    if count <= 0:
+        return
+
+    async def warm(base_url: str):
+        trace = PoolTrace()
+        try:
+            resp = await client.head(f"{base_url}/", extensions={"trace": trace})
+            await resp.aclose()
+            return True, trace.new_connection
+        except httpx.HTTPError as e:
+            logger.warning("Connection pre-warm failed", upstream=base_url, error=str(e))
+            return False, False
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(warm(u.base_url) for u in upstreams for _ in range(count)))
+    opened = sum(new_connection for _, new_connection in results)
+    pool_metrics["prewarmed_connections"] += opened
+    logger.info(
+        "Pre-warmed upstream connections",
+        succeeded=sum(ok for ok, _ in results),
+        requested=len(results),
+        connections=opened,
+        http2=_http2_enabled,
+        elapsed_ms=round((time.perf_counter() - start) * 1000, 1)
+    )
+
+
+class PoolTrace:
+    """
+    httpcore trace 回调：记录请求从进入连接池到拿到连接的等待时间，以及新建连接的耗时；
+    传入 deadline 时，在开始等待响应头的时刻启动首字节超时计时
+
+    用法：client.build_request(..., extensions={"trace": PoolTrace()})
+    """
+
+    __slots__ = ("started", "assigned", "new_connection", "connect_started", "deadline", "first_byte_timeout")
+
+    def __init__(self, deadline: asyncio.Timeout = None, first_byte_timeout: float | None = None):
+        self.started = time.perf_counter()
+        self.assigned = False
+        self.new_connection = False  # 本次请求是否新建了连接（而非复用连接池中的连接）
+        self.connect_started = None
+        self.deadline = deadline
+        self.first_byte_timeout = first_byte_timeout
+
+    async def __call__(self, event_name: str, info: dict):
+        if event_name == "connection.connect_tcp.started":
+            self._assign(new_connection=True)
+            self.connect_started = time.perf_counter()
+        elif event_name.endswith("send_request_headers.started"):
+            # 新建连接时，从开始建连到发送请求头的时间即为建连耗时（TCP + TLS）
+            if self.connect_started is not None:
+                pool_metrics["connect_time_total"] += time.perf_counter() - self.connect_started
+                self.connect_started = None
+            self._assign(new_connection=False)
+        elif event_name.endswith("receive_response_headers.started"):
+            # 请求已完整发出，开始计算首字节超时（不包含排队、建连和上传请求体的时间）
+            if self.deadline is not None and self.first_byte_timeout is not None:
+                self.deadline.reschedule(asyncio.get_running_loop().time() + self.first_byte_timeout)
+
+    def _assign(self, new_connection: bool):
+        if self.assigned:
+            return
+        self.assigned = True
+        self.new_connection = new_connection
+        wait = time.perf_counter() - self.started
+        pool_metrics["requests"] += 1
+        pool_metrics["new_connections" if new_connection else "reused_connections"] += 1
+        pool_metrics["pool_wait_total"] += wait
+        if wait > pool_metrics["pool_wait_max"]:
+            pool_metrics["pool_wait_max"] = wait
+        recent_pool_waits.append(wait)
+
+
+def _iter_pools(client: httpx.AsyncClient):
+    """遍历客户端内部的 httpcore 连接池（默认 transport 与代理 mounts），内部属性不存在时跳过"""
+    mounts = getattr(client, "_mounts", None) or {}
+    transports = [getattr(client, "_transport", None)] + list(mounts.values())
+    for transport in transports:
+        pool = getattr(transport, "_pool", None)
+        if pool is not None:
+            yield pool
+
+
+def get_pool_stats() -> dict:
+    """
+    获取连接池实时占用与等待时间统计
+
+    Returns:
+        dict: 连接数、空闲/活跃连接、排队请求数、等待时间百分位等
+    """
+    connections = idle = active_requests = queued_requests = 0
+    introspection = False  # 是否读到了连接池内部状态
+    if _http_client is not None:
+        try:
+            for pool in _iter_pools(_http_client):
+                pool_connections = pool.connections
+                connections += len(pool_connections)
+                idle += sum(1 for conn in pool_connections if conn.is_idle())
+                for pool_request in list(pool._requests):
+                    if pool_request.is_queued():
+                        queued_requests += 1
+                    else:
+                        active_requests += 1
+                introspection = True
+        except AttributeError:
+            # httpcore 内部结构变化时不影响其余统计
+            introspection = False
+
+    requests = pool_metrics["requests"]
+    wait_ms = calculate_percentiles([w * 1000 for w in recent_pool_waits], [50, 95, 99])
+    return {
+        "max_connections": UPSTREAM_MAX_CONNECTIONS,
+        "max_keepalive_connections": UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+        "keepalive_expiry": UPSTREAM_KEEPALIVE_EXPIRY,
+        "http2": _http2_enabled,
+        "pool_introspection": introspection,
+        "connections": connections,
+        "idle_connections": idle,
+        "active_requests": active_requests,
+        "queued_requests": queued_requests,
+        "new_connections": pool_metrics["new_connections"],
+        "reused_connections": pool_metrics["reused_connections"],
+        "prewarmed_connections": pool_metrics["prewarmed_connections"],
+        "avg_connect_time_ms": round(pool_metrics["connect_time_total"] / pool_metrics["new_connections"] * 1000, 2) if pool_metrics["new_connections"] else 0,
+        "pool_wait_ms": {
+            "avg": round(pool_metrics["pool_wait_total"] / requests * 1000, 3) if requests else 0,
+            "max": round(pool_metrics["pool_wait_max"] * 1000, 3),
+            "p50": round(wait_ms.get(50, 0), 3),
+            "p95": round(wait_ms.get(95, 0), 3),
+            "p99": round(wait_ms.get(99, 0), 3)
+        }
+    }
@@ -1,10 +1,21 @@
 """
 编码处理工具模块
 
-提供文本编码转换和长度限制功能
+提供文本编码转换、长度限制与响应体解压功能
 """
 
 import codecs
+import zlib
+
+try:
+    import brotli
+except ImportError:  # 可选依赖：未安装时 br 编码的内容保持原样
+    brotli = None
+
+# br 解压时每次送入解压器的输入字节数（达到输出上限后不再送入剩余输入）
+BROTLI_INPUT_CHUNK = 1024
+# Brotli >= 1.2 支持限制单次解压的输出缓冲区（output_buffer_limit / can_accept_more_data）
+_BROTLI_OUTPUT_LIMIT = brotli is not None and hasattr(brotli.Decompressor, "can_accept_more_data")
 
 
 def ensure_unicode(text, max_length=50*1024):
@@ -43,3 +54,59 @@ def ensure_unicode(text, max_length=50*1024):
             decoded = f"[响应内容长度 {len(decoded)} 超过限制 {max_length}]"
 
     return decoded
+
+
+def _decompress_step(data: bytes, encoding: str, max_length: int) -> bytes:
+    """按单个编码解压，输出不超过 max_length 字节；允许输入被截断"""
+    if encoding in ("gzip", "x-gzip"):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(data, max_length)
+    if encoding == "deflate":
+        # deflate 可能是 zlib 封装或原始 deflate 流
+        try:
+            return zlib.decompressobj().decompress(data, max_length)
+        except zlib.error:
+            return zlib.decompressobj(-zlib.MAX_WBITS).decompress(data, max_length)
+    if encoding == "br" and brotli is not None:
+        return _brotli_decompress(data, max_length)
+    raise ValueError(f"unsupported content encoding: {encoding}")
+
+
+def _brotli_decompress(data: bytes, max_length: int) -> bytes:
+    """分块送入输入，输出达到 max_length 后停止，避免高压缩比的内容被完整解压"""
+    decompressor = brotli.Decompressor()
+    output = bytearray()
+    for start in range(0, len(data), BROTLI_INPUT_CHUNK):
+        chunk = data[start:start + BROTLI_INPUT_CHUNK]
+        if _BROTLI_OUTPUT_LIMIT:
+            output += decompressor.process(chunk, output_buffer_limit=max_length - len(output))
+        else:
+            # 旧版本无法限制输出，只能按输入块限制每次解压的量
+            output += decompressor.process(chunk)
+        if len(output) >= max_length or decompressor.is_finished():
+            break
+    return bytes(output[:max_length])
+
+
+def decompress_body(data: bytes, content_encoding: str = None, max_length=50*1024) -> bytes:
+    """
+    按 Content-Encoding 解压响应体（用于压缩透传模式下记录错误响应内容）
+
+    参数:
+        data: 原始（可能被截断的）响应体字节
+        content_encoding: 响应的 Content-Encoding，可包含多个逗号分隔的编码
+        max_length: 解压输出的最大字节数（默认 50KB），防止压缩炸弹
+
+    返回:
+        解压后的字节；编码不支持或数据损坏时返回原始字节
+    """
+    if not data or not content_encoding:
+        return data
+    decoded = data
+    try:
+        # 多个编码按应用顺序列出，解压时逆序处理
+        for encoding in reversed([e.strip().lower() for e in content_encoding.split(",")]):
+            if encoding and encoding != "identity":
+                decoded = _decompress_step(decoded, encoding, max_length)
+    except Exception:  # zlib.error、brotli.error 或不支持的编码
+        return data
+    return decoded
@@ -0,0 +1,248 @@
+"""
+JSON 字节定位工具模块
+
+在不完整解析 JSON 的前提下定位请求体中 system[0].text 的字节区间，
+用于就地拼接替换 system prompt，避免对数 MB 的会话历史做完整的 json.loads / json.dumps
+"""
+
+import json
+import re
+from typing import NamedTuple, Optional
+
+# 跳过嵌套结构时只关心引号和括号，其余字符（数字、逗号、冒号等）全部跳过
+_STRUCT_RE = re.compile(rb'["\[\]{}]')
+# 标量值（数字、true/false/null）的结束位置
+_SCALAR_END_RE = re.compile(rb'[,\]}\s]')
+
+_WHITESPACE = b" \t\r\n"
+_OPEN = (0x7B, 0x5B)  # '{', '['
+_SYSTEM_KEY = b'"system"'
+
+
+class SpliceError(ValueError):
+    """字节扫描失败（请求体结构不符合预期），调用方应回退到完整 JSON 解析"""
+
+
+class SystemTextLocation(NamedTuple):
+    """system[0].text 在请求体中的位置（均为字节偏移）"""
+    element_start: int  # system[0] 对象的起始位置（插入新元素时使用）
+    text_start: int     # text 字符串值的起始位置（含引号）
+    text_end: int       # text 字符串值的结束位置（含引号，开区间）
+
+
+def _skip_ws(buf: bytes, pos: int) -> int:
+    """跳过空白字符，返回下一个非空白字符的位置"""
+    length = len(buf)
+    while pos < length and buf[pos] in _WHITESPACE:
+        pos += 1
+    if pos >= length:
+        raise SpliceError("unexpected end of body")
+    return pos
+
+
+def _is_escaped(buf: bytes, pos: int) -> bool:
+    """判断 pos 处的字符是否被反斜杠转义（前面有奇数个连续反斜杠）"""
+    count = 0
+    pos -= 1
+    while pos >= 0 and buf[pos] == 0x5C:  # '\\'
+        count += 1
+        pos -= 1
+    return count % 2 == 1
+
+
+def _match_string(buf: bytes, pos: int) -> int:
+    """匹配从 pos 开始的字符串，返回结束位置（开区间）"""
+    end = pos
+    while True:
+        end = buf.find(b'"', end + 1)
+        if end < 0:
+            raise SpliceError(f"unterminated string at {pos}")
+        if not _is_escaped(buf, end):
+            return end + 1
+
+
+def _skip_value(buf: bytes, pos: int) -> int:
+    """跳过从 pos 开始的任意 JSON 值，返回值之后的位置"""
+    first = buf[pos]
+
+    if first == 0x22:  # '"'
+        return _match_string(buf, pos)
+
+    if first in _OPEN:
+        depth = 0
+        search = _STRUCT_RE.search
+        while True:
+            match = search(buf, pos)
+            if match is None:
+                raise SpliceError("unbalanced container")
+            pos = match.start()
+            token = buf[pos]
+            if token == 0x22:
+                pos = _match_string(buf, pos)
+                continue
+            pos += 1
+            if token in _OPEN:
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return pos
+
+    match = _SCALAR_END_RE.search(buf, pos)
+    if match is None:
+        raise SpliceError(f"unterminated value at {pos}")
+    return match.start()
+
+
+def _key_equals(buf: bytes, start: int, end: int, expected: bytes) -> bool:
+    """比较对象键名，键名含转义字符时按 JSON 规则解码后再比较"""
+    raw = buf[start:end]
+    if raw == expected:
+        return True
+    if b"\\" not in raw:
+        return False
+    try:
+        return json.loads(raw) == json.loads(expected)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return False
+
+
+def _find_key(buf: bytes, pos: int, key: bytes) -> Optional[int]:
+    """
+    在从 pos 开始的对象中查找键 key（仅限该对象的顶层），返回对应值的起始位置
+
+    Returns:
+        值的起始位置；对象中不存在该键时返回 None
+    """
+    if buf[pos] != 0x7B:  # '{'
+        raise SpliceError(f"expected object at {pos}")
+    pos = _skip_ws(buf, pos + 1)
+    if buf[pos] == 0x7D:  # '}'
+        return None
+
+    while True:
+        if buf[pos] != 0x22:
+            raise SpliceError(f"expected key at {pos}")
+        key_end = _match_string(buf, pos)
+        is_target = _key_equals(buf, pos, key_end, key)
+
+        pos = _skip_ws(buf, key_end)
+        if buf[pos] != 0x3A:  # ':'
+            raise SpliceError(f"expected ':' at {pos}")
+        pos = _skip_ws(buf, pos + 1)
+        if is_target:
+            return pos
+
+        pos = _skip_ws(buf, _skip_value(buf, pos))
+        if buf[pos] == 0x2C:  # ','
+            pos = _skip_ws(buf, pos + 1)
+        elif buf[pos] == 0x7D:
+            return None
+        else:
+            raise SpliceError(f"expected ',' or '}}' at {pos}")
+
+
+def _is_top_level_key(buf: bytes, key_start: int, value_start: int) -> bool:
+    """
+    校验 key_start 处的键是否属于最外层对象
+
+    从该键的值开始向后解析剩余的 "键: 值" 对，若恰好以一个 '}' 结束于请求体末尾，
+    说明该键位于最外层（嵌套对象中的键之后至少还有一个外层的右括号）
+    """
+    prev = key_start - 1
+    while prev >= 0 and buf[prev] in _WHITESPACE:
+        prev -= 1
+    if prev < 0 or buf[prev] not in (0x7B, 0x2C):  # '{' 或 ','
+        return False
+
+    pos = _skip_ws(buf, _skip_value(buf, value_start))
+    while buf[pos] == 0x2C:  # ','
+        pos = _skip_ws(buf, pos + 1)
+        if buf[pos] != 0x22:
+            return False
+        pos = _skip_ws(buf, _match_string(buf, pos))
+        if buf[pos] != 0x3A:  # ':'
+            return False
+        pos = _skip_ws(buf, _skip_value(buf, _skip_ws(buf, pos + 1)))
+
+    if buf[pos] != 0x7D:  # '}'
+        return False
+    return buf[pos + 1:].strip(_WHITESPACE) == b""
+
+
+def _find_top_level_system(body: bytes) -> Optional[int]:
+    """
+    查找最外层 system 键对应值的起始位置
+
+    从后向前搜索 "system" 字面量（与 json.loads 一样以最后出现的键为准），
+    每个候选只需校验其后的剩余内容，无需扫描位于 system 之前的 messages
+
+    Returns:
+        值的起始位置；请求体中不存在 system 键时返回 None
+
+    Raises:
+        SpliceError: 存在 "system" 字面量但都无法确认位于最外层
+    """
+    candidate = len(body)
+    found_literal = False
+    while True:
+        candidate = body.rfind(_SYSTEM_KEY, 0, candidate)
+        if candidate < 0:
+            break
+        found_literal = True
+        if _is_escaped(body, candidate):
+            continue
+
+        pos = _skip_ws(body, candidate + len(_SYSTEM_KEY))
+        if body[pos] != 0x3A:  # 不是键（例如值为 "system" 的字符串）
+            continue
+        value_start = _skip_ws(body, pos + 1)
+
+        try:
+            if _is_top_level_key(body, candidate, value_start):
+                return value_start
+        except SpliceError:
+            continue
+
+    if found_literal:
+        raise SpliceError("no top-level 'system' key could be verified")
+    return None
+
+
+def locate_system_text(body: bytes) -> Optional[SystemTextLocation]:
+    """
+    定位请求体中 system 数组第一个元素的 text 字符串
+
+    从后向前查找最外层的 system 键并只校验其后的内容，位于 system 之前的
+    messages（通常占请求体的绝大部分）完全不需要扫描
+
+    Args:
+        body: 原始请求体（UTF-8 编码的 JSON）
+
+    Returns:
+        SystemTextLocation；若 system 不存在、不是数组、为空或第一个元素没有 text 字段则返回 None
+
+    Raises:
+        SpliceError: 请求体结构无法识别（非对象、括号不匹配、text 不是字符串等）
+    """
+    try:
+        if body[_skip_ws(body, 0)] != 0x7B:  # '{'
+            raise SpliceError("body is not a JSON object")
+
+        pos = _find_top_level_system(body)
+        if pos is None or body[pos] != 0x5B:  # '['
+            return None
+
+        element_start = _skip_ws(body, pos + 1)
+        if body[element_start] != 0x7B:
+            return None
+
+        text_start = _find_key(body, element_start, b'"text"')
+        if text_start is None:
+            return None
+        if body[text_start] != 0x22:
+            raise SpliceError(f"system[0].text is not a string at {text_start}")
+
+        return SystemTextLocation(element_start, text_start, _match_string(body, text_start))
+    except IndexError as e:
+        raise SpliceError(f"unexpected end of body: {e}") from e
@@ -0,0 +1,202 @@
+"""
+异步日志模块
+
+请求热路径上的日志只追加到内存队列，由后台线程批量写入 stdout，
+避免同步 print 阻塞事件循环。支持日志级别、按分类采样和结构化 JSON 输出，
+队列满时丢弃新日志并计数
+"""
+
+import atexit
+import json
+import random
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from ..config import LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATES, LOG_QUEUE_SIZE
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+# 后台线程的写入间隔（秒）
+FLUSH_INTERVAL = 0.05
+
+
+def _parse_sample_rates(raw: str) -> dict:
+    """解析 "proxy=0.1,system_prompt=0.5" 格式的采样配置"""
+    rates = {}
+    for item in raw.split(","):
+        if "=" not in item:
+            continue
+        category, rate = item.split("=", 1)
+        try:
+            rates[category.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            continue
+    return rates
+
+
+class _LogWriter:
+    """后台日志写入器：生产者只做 deque.append，写 stdout 在独立线程中完成"""
+
+    def __init__(self, maxsize: int, json_format: bool):
+        self.maxsize = maxsize
+        self.json_format = json_format
+        self._queue = deque()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+
+    def emit(self, record: tuple):
+        """放入一条日志记录（不阻塞），队列已满时丢弃并计数"""
+        if len(self._queue) >= self.maxsize:
+            self.dropped += 1
+            return
+        self._queue.append(record)
+        if self._thread is None:
+            self._start()
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, args=(self._stop,), name="log-writer", daemon=True)
+                try:
+                    thread.start()
+                except RuntimeError:
+                    # 解释器退出中无法再创建线程：同步写出
+                    self._drain()
+                    return
+                self._thread = thread
+
+    def _run(self, stop: threading.Event):
+        while not stop.wait(FLUSH_INTERVAL):
+            self._drain()
+        self._drain()
+
+    def _drain(self):
+        """取出队列中的全部日志并一次性写出"""
+        lines = []
+        queue = self._queue
+        while queue:
+            lines.append(self._format(queue.popleft()))
+        if not lines:
+            return
+        try:
+            sys.stdout.write("\n".join(lines) + "\n")
+            sys.stdout.flush()
+        except Exception:
+            # stdout 不可用时（如进程退出中）静默丢弃
+            self.dropped += len(lines)
+            return
+        self.written += len(lines)
+
+    def _format(self, record: tuple) -> str:
+        timestamp, level, category, message, fields = record
+        if self.json_format:
+            entry = {
+                "ts": timestamp,
+                "level": level,
+                "category": category,
+                "message": message,
+            }
+            if fields:
+                entry.update(fields)
+            return json.dumps(entry, ensure_ascii=False, default=str)
+
+        formatted_time = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        line = f"{formatted_time} {level:<7} [{category}] {message}"
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+    def flush(self):
+        """
+        同步写出队列中剩余的日志并停止后台线程（关闭时调用）
+
+        之后再有日志时重新启动后台线程，flush 之后的日志不会丢失
+        """
+        with self._start_lock:
+            if self._thread is not None:
+                self._stop.set()
+                self._thread.join(timeout=2)
+                self._thread = None
+                self._stop = threading.Event()
+        self._drain()
+        # flush 期间入队的日志（当时后台线程还未清空）由新线程写出
+        if self._queue:
+            self._start()
+
+    def stats(self) -> dict:
+        return {
+            "level": _min_level_name,
+            "format": "json" if self.json_format else "text",
+            "queued": len(self._queue),
+            "written": self.written,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out
+        }
+
+
+_min_level_name = LOG_LEVEL if LOG_LEVEL in LEVELS else "INFO"
+_min_level = LEVELS[_min_level_name]
+_sample_rates = _parse_sample_rates(LOG_SAMPLE_RATES)
+_writer = _LogWriter(LOG_QUEUE_SIZE, LOG_FORMAT == "json")
+_loggers = {}
+atexit.register(_writer.flush)
+
+
+class Logger:
+    """按分类记录日志，调用 debug/info/warning/error 时只做入队"""
+
+    def __init__(self, category: str):
+        self.category = category
+        self.sample_rate = _sample_rates.get(category, 1.0)
+
+    @property
+    def debug_enabled(self) -> bool:
+        """DEBUG 级别是否启用，用于跳过开销较大的日志内容构造"""
+        return _min_level <= LEVELS["DEBUG"]
+
+    def _log(self, level: str, message: str, fields: dict):
+        level_no = LEVELS[level]
+        if level_no < _min_level:
+            return
+        # 采样只作用于 WARNING 以下级别，告警和错误始终保留
+        if level_no < LEVELS["WARNING"] and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            _writer.sampled_out += 1
+            return
+        _writer.emit((time.time(), level, self.category, message, fields))
+
+    def debug(self, message: str, **fields):
+        self._log("DEBUG", message, fields)
+
+    def info(self, message: str, **fields):
+        self._log("INFO", message, fields)
+
+    def warning(self, message: str, **fields):
+        self._log("WARNING", message, fields)
+
+    def error(self, message: str, **fields):
+        self._log("ERROR", message, fields)
+
+
+def get_logger(category: str) -> Logger:
+    """获取指定分类的日志记录器"""
+    logger = _loggers.get(category)
+    if logger is None:
+        logger = _loggers[category] = Logger(category)
+    return logger
+
+
+def flush_logs():
+    """写出剩余日志（应用关闭时调用）"""
+    _writer.flush()
+
+
+def get_log_stats() -> dict:
+    """返回日志子系统的统计信息（已写出、丢弃、采样跳过的行数等）"""
+    return _writer.stats()
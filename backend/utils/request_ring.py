@@ -0,0 +1,357 @@
+"""
+最近请求记录的列式环形缓冲区
+
+每个字段保存在一个预分配的定长 array 列中（时间戳、耗时、状态码、字节数、token 数等），
+路径、方法、状态、上游等重复率高的字符串驻留为整数编号；错误信息、响应内容等少见且不定长的字段
+按槽位保存在稀疏字典中。列的固定开销每条约 124 字节，加上下述 request_id 索引每条约 270 字节，
+10 万条约 27MB（另加稀疏字段），同样数量的 dict 记录需要约 3.5 倍的内存（见 tests/bench_recent_requests.py）
+
+记录按序号（seq）寻址：槽位 = seq % capacity，槽位中保存的序号仍在最近 capacity 个序号之内时记录有效。
+request_id -> seq 的索引字典与记录同步维护（写入时加入，槽位被覆盖时删除），按 request_id 查找为 O(1)；
+索引与每个槽位保存的 request_id 字符串每条另占约 140 字节。
+时间范围过滤只读取时间戳列，只有最终返回的记录才会生成 dict（仅在事件循环线程内使用，无需加锁）
+"""
+
+from array import array
+from bisect import bisect_left
+from typing import Any, Iterator
+
+# 列类型：浮点（'d'）、整数（取值超出列类型范围时存入稀疏字段）、驻留字符串、整数字典
+FLOAT, INT, STRING, NESTED = range(4)
+
+# 字段 -> (列类型, array 类型码)，顺序即生成 dict 时的键顺序
+FIELDS = {
+    "path": (STRING, "H"),
+    "method": (STRING, "H"),
+    "status": (STRING, "H"),
+    "status_code": (INT, "h"),
+    "bytes": (INT, "q"),
+    "response_time": (FLOAT, "d"),
+    "upstream": (STRING, "H"),
+    "attempts": (INT, "H"),
+    "cache": (STRING, "H"),
+    "error_type": (STRING, "H"),
+    "first_byte_time": (FLOAT, "d"),
+    "first_token_time": (FLOAT, "d"),
+    "duration": (FLOAT, "d"),
+    "chunks": (INT, "I"),
+    "chunk_gap_avg": (FLOAT, "d"),
+    "chunk_gap_max": (FLOAT, "d"),
+    "output_tokens_per_second": (FLOAT, "d"),
+    "timestamp": (FLOAT, "d"),
+}
+
+# 驻留字符串数量上限（编号为 'H'），超出后新字符串存入稀疏字段，避免客户端构造的路径无限占用内存
+MAX_STRINGS = 65535
+
+
+def _zeros(typecode: str, length: int) -> array:
+    return array(typecode, bytes(array(typecode).itemsize * length))
+
+
+class RequestRing:
+    """
+    容量固定的列式请求记录窗口，迭代顺序为序号顺序（从旧到新）
+
+    nested 为取值是整数字典的字段（如 usage -> token 字段），每个键单独成列；
+    字典的键与声明不完全一致时整体存入稀疏字段
+    """
+
+    __slots__ = (
+        "capacity", "_next_seq", "_seqs", "_present", "_nulls", "_fields",
+        "_layout", "_timestamps", "_strings", "_codes", "_sparse", "_ids", "_index"
+    )
+
+    def __init__(self, capacity: int, nested: dict | None = None):
+        self.capacity = capacity
+        self._next_seq = 0
+        self._seqs = array("q", [-1]) * capacity
+        self._fields = {}  # 字段 -> (存在位, 列类型, 列)
+        self._layout = []
+        fields = {name: spec for name, spec in FIELDS.items() if name != "timestamp"}
+        nested = {name: tuple(keys) for name, keys in (nested or {}).items()}
+        for name in nested:
+            fields[name] = (NESTED, "I")
+        fields["timestamp"] = FIELDS["timestamp"]
+        if len(fields) > 32:
+            raise ValueError("too many fields for the presence bitmask")
+
+        for bit, (name, (kind, typecode)) in enumerate(fields.items()):
+            if kind == NESTED:
+                column = {key: _zeros(typecode, capacity) for key in nested[name]}
+            else:
+                column = _zeros(typecode, capacity)
+            self._fields[name] = (1 << bit, kind, column)
+            self._layout.append((name, 1 << bit, kind, column))
+        self._timestamps = self._fields["timestamp"][2]
+        # 每个槽位的字段存在位与取值为 None 的位
+        self._present = _zeros("I", capacity)
+        self._nulls = _zeros("I", capacity)
+        self._strings: list = []
+        self._codes: dict = {}
+        self._sparse: dict = {}  # 槽位 -> {字段: 值}
+        self._ids: list = [None] * capacity  # 槽位 -> request_id
+        self._index: dict = {}  # request_id -> seq
+
+    # ===== 写入 =====
+
+    def allocate(self) -> int:
+        """分配下一个序号（记录可以稍后用 put 写入）"""
+        seq = self._next_seq
+        self._next_seq = seq + 1
+        return seq
+
+    def put(self, seq: int, record: dict, request_id: str | None = None) -> int | None:
+        """
+        写入序号为 seq 的记录，覆盖槽位中更早的记录
+
+        request_id 也可以放在 record 中；都未提供时按 "<毫秒时间戳>-<seq>" 生成
+
+        Returns:
+            int | None: 槽位；序号已滑出窗口时返回 None（不写入）
+        """
+        if seq < self._next_seq - self.capacity:
+            return None
+        slot = seq % self.capacity
+        self._evict(slot)
+        self._seqs[slot] = seq
+        self._present[slot] = 0
+        self._nulls[slot] = 0
+        fields = record
+        if "request_id" in record:
+            fields = dict(record)
+            request_id = fields.pop("request_id")
+        self.update(slot, fields)
+        if request_id is None:
+            request_id = self._canonical_id(slot, seq)
+        self._ids[slot] = request_id
+        if request_id is not None:
+            self._index[request_id] = seq
+        return slot
+
+    def append(self, record: dict, request_id: str | None = None) -> int:
+        """分配序号并写入记录，窗口已满时覆盖最早的记录"""
+        return self.put(self.allocate(), record, request_id)
+
+    def update(self, slot: int, fields: dict):
+        """更新槽位中记录的字段（不能写入列的值存入稀疏字段）"""
+        columns = self._fields
+        codes = self._codes
+        present = self._present[slot]
+        nulls = self._nulls[slot]
+        written = 0  # 本次写入非 None 值的字段位
+        sparse = self._sparse.get(slot)
+        for name, value in fields.items():
+            field = columns.get(name)
+            if field is not None:
+                bit, kind, column = field
+                if value is None:
+                    nulls |= bit
+                    stored = True
+                elif kind <= INT:
+                    # 类型不符或超出列类型范围时由 array 拒绝写入
+                    try:
+                        column[slot] = value
+                        stored = True
+                    except (TypeError, OverflowError):
+                        stored = False
+                    written |= bit
+                elif kind == STRING:
+                    code = codes.get(value) if type(value) is str else None
+                    if code is None:
+                        stored = self._store_string(slot, column, value)
+                    else:
+                        column[slot] = code
+                        stored = True
+                    written |= bit
+                else:
+                    stored = self._store_nested(slot, column, value)
+                    written |= bit
+                if stored:
+                    present |= bit
+                    if sparse and name in sparse:
+                        del sparse[name]
+                    continue
+                present &= ~bit
+            if sparse is None:
+                sparse = self._sparse[slot] = {}
+            sparse[name] = value
+        self._present[slot] = present
+        self._nulls[slot] = nulls & ~written
+
+    def clear(self):
+        self._next_seq = 0
+        self._seqs = array("q", [-1]) * self.capacity
+        self._sparse.clear()
+        self._ids = [None] * self.capacity
+        self._index.clear()
+
+    def _evict(self, slot: int):
+        """覆盖槽位前删除旧记录的稀疏字段与索引（同一 request_id 已指向更新的记录时保留索引）"""
+        self._sparse.pop(slot, None)
+        request_id = self._ids[slot]
+        if request_id is not None:
+            if self._index.get(request_id) == self._seqs[slot]:
+                del self._index[request_id]
+            self._ids[slot] = None
+
+    def _store_string(self, slot: int, column, value: Any) -> bool:
+        if type(value) is not str:
+            return False
+        code = self._codes.get(value)
+        if code is None:
+            if len(self._strings) >= MAX_STRINGS:
+                return False
+            code = self._codes[value] = len(self._strings)
+            self._strings.append(value)
+        column[slot] = code
+        return True
+
+    def _store_nested(self, slot: int, column: dict, value: Any) -> bool:
+        """键必须与声明一致且均为范围内的整数，否则整体存入稀疏字段（已写入的部分列不会被读取）"""
+        if type(value) is not dict or len(value) != len(column):
+            return False
+        try:
+            for key, values in column.items():
+                values[slot] = value[key]
+        except (KeyError, TypeError, OverflowError):
+            return False
+        return True
+
+    # ===== 读取 =====
+
+    def _canonical_id(self, slot: int, seq: int) -> str | None:
+        timestamp_bit = self._layout[-1][1]
+        if self._present[slot] & timestamp_bit and not self._nulls[slot] & timestamp_bit:
+            return f"{int(self._timestamps[slot] * 1000)}-{seq}"
+        return None
+
+    def request_id(self, slot: int) -> str | None:
+        return self._ids[slot]
+
+    def find(self, request_id: str) -> int | None:
+        """按 request_id 查找仍在窗口中的记录的槽位（O(1)）"""
+        seq = self._index.get(request_id)
+        if seq is None or seq < self._next_seq - self.capacity:
+            return None
+        slot = seq % self.capacity
+        return slot if self._seqs[slot] == seq else None
+
+    def value(self, slot: int, name: str, default: Any = None) -> Any:
+        """读取槽位中记录的单个字段，字段不存在时返回 default"""
+        sparse = self._sparse.get(slot)
+        if sparse and name in sparse:
+            return sparse[name]
+        if name == "request_id":
+            return self._ids[slot]
+        field = self._fields.get(name)
+        if field is None:
+            return default
+        bit, kind, column = field
+        if not self._present[slot] & bit:
+            return default
+        if self._nulls[slot] & bit:
+            return None
+        if kind == STRING:
+            return self._strings[column[slot]]
+        if kind == NESTED:
+            return {key: values[slot] for key, values in column.items()}
+        return column[slot]
+
+    def record(self, slot: int) -> dict:
+        """生成槽位中记录的 dict（新对象，修改它不会影响窗口中的记录）"""
+        present = self._present[slot]
+        nulls = self._nulls[slot]
+        result = {"request_id": self._ids[slot]}
+        strings = self._strings
+        for name, bit, kind, column in self._layout:
+            if present & bit:
+                if nulls & bit:
+                    result[name] = None
+                elif kind == STRING:
+                    result[name] = strings[column[slot]]
+                elif kind == NESTED:
+                    result[name] = {key: values[slot] for key, values in column.items()}
+                else:
+                    result[name] = column[slot]
+        sparse = self._sparse.get(slot)
+        if sparse:
+            result.update(sparse)
+        return result
+
+    def get(self, request_id: str, default: Any = None) -> Any:
+        """按 request_id 查找记录，返回生成的 dict"""
+        slot = self.find(request_id)
+        return default if slot is None else self.record(slot)
+
+    def __contains__(self, request_id: str) -> bool:
+        return self.find(request_id) is not None
+
+    def slots(self, start_time: float | None = None, end_time: float | None = None) -> list:
+        """按序号顺序返回有效记录的槽位，可按时间戳范围过滤（只读取时间戳列）"""
+        capacity = self.capacity
+        low = max(0, self._next_seq - capacity)
+        if start_time is None and end_time is None:
+            hits = [slot for slot, seq in enumerate(self._seqs) if seq >= low]
+        else:
+            start = float("-inf") if start_time is None else start_time
+            end = float("inf") if end_time is None else end_time
+            hits = [
+                slot for slot, timestamp, seq in zip(range(capacity), self._timestamps, self._seqs)
+                if start <= timestamp <= end and seq >= low
+            ]
+        # 按槽位顺序遍历后旋转为序号顺序：最早的有效序号位于下一个待分配序号的槽位之后
+        split = bisect_left(hits, self._next_seq % capacity)
+        return hits[split:] + hits[:split]
+
+    def select(self, start_time: float | None = None, end_time: float | None = None) -> "RequestView":
+        """时间范围内的记录视图，按需生成 dict"""
+        return RequestView(self, self.slots(start_time, end_time))
+
+    def matching(self, name: str, value: str) -> list:
+        """按序号顺序返回驻留字符串字段等于 value 的记录槽位（如 status == "pending"）"""
+        code = self._codes.get(value)
+        if code is None:
+            return []
+        bit, _, column = self._fields[name]
+        present = self._present
+        nulls = self._nulls
+        return [slot for slot in self.slots() if column[slot] == code and present[slot] & bit and not nulls[slot] & bit]
+
+    def __len__(self) -> int:
+        return len(self.slots())
+
+    def __iter__(self) -> Iterator[dict]:
+        return (self.record(slot) for slot in self.slots())
+
+    def __reversed__(self) -> Iterator[dict]:
+        return (self.record(slot) for slot in reversed(self.slots()))
+
+    def nbytes(self) -> int:
+        """列与序号数组占用的字节数（不含驻留字符串、稀疏字段与 request_id 索引）"""
+        total = self._seqs.itemsize * self.capacity + 2 * self._present.itemsize * self.capacity
+        for _, _, column in self._fields.values():
+            for values in (column.values() if isinstance(column, dict) else (column,)):
+                total += values.itemsize * len(values)
+        return total
+
+
+class RequestView:
+    """一组记录槽位的只读视图，len() 不生成 dict，迭代与 tail() 时才生成"""
+
+    __slots__ = ("ring", "slots")
+
+    def __init__(self, ring: RequestRing, slots: list):
+        self.ring = ring
+        self.slots = slots
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def __iter__(self) -> Iterator[dict]:
+        return (self.ring.record(slot) for slot in self.slots)
+
+    def tail(self, limit: int) -> list:
+        """最新的 limit 条记录（limit <= 0 时返回全部）"""
+        slots = self.slots[-limit:] if limit > 0 else self.slots
+        return [self.ring.record(slot) for slot in slots]
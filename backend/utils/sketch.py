@@ -0,0 +1,105 @@
+"""
+延迟分布草图工具模块
+
+对数分桶的固定内存直方图（HDR 直方图的简化形式）：每个样本 O(1) 计入一个桶，
+百分位查询只遍历固定数量的桶，与样本数无关；两个草图按桶相加即可合并
+（跨 worker、跨时间段、跨路径），合并结果与把所有样本记录到同一个草图完全相同。
+
+分桶：桶 0 为 <= 1ms，桶 i 为 (1.1^(i-1), 1.1^i] ms，最后一个桶收纳约 1 小时以上的值；
+桶的代表值取上下界的几何中点，百分位的相对误差不超过约 5%
+"""
+
+import math
+
+HIST_BUCKETS = 160
+HIST_GROWTH = 1.1
+_LOG_GROWTH = math.log(HIST_GROWTH)
+
+# 默认输出的百分位
+PERCENTILES = (50, 95, 99, 99.9)
+
+
+def bucket_index(ms: float) -> int:
+    """耗时（毫秒）所在的桶"""
+    if ms <= 1.0:
+        return 0
+    return min(HIST_BUCKETS - 1, math.ceil(math.log(ms) / _LOG_GROWTH))
+
+
+def bucket_value(index: int) -> float:
+    """桶的代表值（毫秒）：取桶上下界的几何中点"""
+    if index == 0:
+        return 0.5
+    return HIST_GROWTH ** (index - 0.5)
+
+
+def percentile_key(p: float) -> str:
+    """百分位在输出中的键名：50 -> p50，99.9 -> p999"""
+    return "p" + f"{p:g}".replace(".", "")
+
+
+def histogram_percentiles(counts: list, percentiles=PERCENTILES) -> dict:
+    """根据各桶计数估算百分位数（毫秒），没有样本时返回空字典"""
+    total = sum(counts)
+    if total == 0:
+        return {}
+    ranks = sorted((max(1, math.ceil(total * p / 100)), p) for p in percentiles)
+    result = {}
+    seen = 0
+    pending = iter(ranks)
+    rank, p = next(pending)
+    for index, count in enumerate(counts):
+        seen += count
+        while seen >= rank:
+            result[p] = round(bucket_value(index), 2)
+            try:
+                rank, p = next(pending)
+            except StopIteration:
+                return result
+    return result
+
+
+class LatencySketch:
+    """可合并的固定内存延迟草图"""
+
+    __slots__ = ("counts", "total_ms")
+
+    def __init__(self, counts: list | None = None, total_ms: float = 0.0):
+        self.counts = list(counts) if counts is not None else [0] * HIST_BUCKETS
+        self.total_ms = total_ms
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def add(self, seconds: float | None):
+        """记录一个耗时样本（秒），None 表示没有数据"""
+        if seconds is None:
+            return
+        ms = max(seconds, 0.0) * 1000
+        self.counts[bucket_index(ms)] += 1
+        self.total_ms += ms
+
+    def merge(self, other: "LatencySketch") -> "LatencySketch":
+        """把另一个草图合并到当前草图"""
+        counts = self.counts
+        for i, value in enumerate(other.counts):
+            if value:
+                counts[i] += value
+        self.total_ms += other.total_ms
+        return self
+
+    def percentiles(self, percentiles=PERCENTILES) -> dict:
+        return histogram_percentiles(self.counts, percentiles)
+
+    def summary(self, percentiles=PERCENTILES) -> dict:
+        """
+        Returns:
+            dict: {"count", "avg", "p50", "p95", "p99", "p999"}，单位为毫秒，没有样本时均为 0
+        """
+        count = self.count
+        values = histogram_percentiles(self.counts, percentiles)
+        result = {"count": count, "avg": round(self.total_ms / count, 2) if count else 0}
+        for p in percentiles:
+            result[percentile_key(p)] = values.get(p, 0)
+        return result
@@ -19,23 +19,27 @@ export interface SystemStats {
     uptime_seconds: number
   }
   performance: {
-    response_time_ms: {
-      p50: number
-      p95: number
-      p99: number
+    response_time_ms: Percentiles  // 响应头延迟
+    first_byte_ms?: Percentiles  // 首个响应体字节
+    first_token_ms?: Percentiles  // 首个内容增量（SSE content_block_delta）
+    duration_ms?: Percentiles  // 完整流耗时
+    chunk_gap_max_ms?: Percentiles  // 单个请求内上游数据块的最大间隔
+    lifetime?: {  // 统计起始以来（不限于查询范围）的分布
+      response_time_ms: LatencySummary
+      first_token_ms: LatencySummary
+      duration_ms: LatencySummary
     }
   }
-  time_series: {
-    requests_per_minute: Array<{ time: number; count: number }>  // time 为 Unix 时间戳（秒级）
-    errors_per_minute: Array<{ time: number; count: number }>    // time 为 Unix 时间戳（秒级）
-    bytes_per_minute: Array<{ time: number; count: number }>     // time 为 Unix 时间戳（秒级）
-  }
+  time_series: TimeSeries
   top_paths: Record<string, {
     count: number
     bytes: number
     errors: number
     avg_response_time: number
+    avg_duration?: number | null
+    avg_first_token_time?: number | null
     success_rate: number
+    latency_ms?: { response_time: LatencySummary; duration: LatencySummary }  // 当前 worker 启动以来
   }>
   recent_requests: Array<{
     request_id: string
@@ -47,8 +51,183 @@ export interface SystemStats {
     response_time: number
     timestamp: number
     error?: string
+    error_type?: string | null
+    upstream?: string | null  // 实际处理请求的上游名称
+    attempts?: number  // 发往上游的请求次数（含重试与对冲）
+    cache?: 'hit' | 'coalesced' | null  // 响应缓存来源
+    usage?: TokenUsage | null  // 从 SSE 流中解析出的 token 用量
+    output_tokens_per_second?: number | null
+    // 耗时分解（秒，相对请求开始），response_time 为响应头延迟
+    first_byte_time?: number | null
+    first_token_time?: number | null
+    duration?: number
+    chunks?: number
+    chunk_gap_avg?: number | null
+    chunk_gap_max?: number | null
     response_content?: string
   }>
+  upstreams?: UpstreamStats[]
+  token_usage?: TokenUsageSummary
+  concurrency?: ConcurrencyStats
+  clients?: ClientUsageStats
+  error_types?: Record<string, number>  // 所有 worker 按错误类型的累计数
+  workers?: WorkerStats
+  stats_pipeline?: StatsPipelineStats
+}
+
+// 统计事件队列：请求路径只入队，由后台任务批量应用
+export interface StatsPipelineStats {
+  events: number
+  batches: number
+  inline_batches: number  // 积压超过上限时在请求路径上直接应用的批次
+  max_batch: number
+  pending: number
+  flush_interval: number
+  recent_capacity: number  // 最近请求窗口的容量（条）
+  recent_bytes: number     // 最近请求窗口列存储占用的字节数
+}
+
+// 时间序列：后端按查询范围选择分辨率（10 分钟内秒级，24 小时内分钟级，更长为小时级），
+// 各序列的 time 为时间桶起始的 Unix 时间戳（秒级）
+export type TimeSeriesResolution = 'second' | 'minute' | 'hour'
+
+export interface TimeSeries {
+  resolution: TimeSeriesResolution
+  step: number  // 时间桶长度（秒）
+  requests: Array<{ time: number; count: number }>
+  successes: Array<{ time: number; count: number }>
+  errors: Array<{ time: number; count: number }>
+  bytes: Array<{ time: number; count: number }>
+  input_tokens: Array<{ time: number; count: number }>
+  output_tokens: Array<{ time: number; count: number }>
+  totals: Record<'requests' | 'successes' | 'errors' | 'bytes' | 'input_tokens' | 'output_tokens', number>
+  latency: {  // 响应头延迟分布（直方图保留期较短，分辨率可能比上面的序列粗）
+    resolution: TimeSeriesResolution
+    step: number
+    points: Array<{ time: number } & LatencySummary>
+  }
+}
+
+// 多 worker 部署信息（汇总统计来自共享内存，recent_requests 与 top_paths 为 current_pid 的明细）
+export interface WorkerStats {
+  configured: number
+  shared: boolean
+  current_pid: number
+  slots: Array<{ slot: number; pid: number; alive: boolean; claimed_at: number }>
+}
+
+// 按客户端的限流配置与使用计数
+export interface ClientUsageStats {
+  enabled: boolean
+  rps: number
+  burst: number
+  max_concurrent: number
+  tracked: number
+  evicted: number
+  clients: Array<{
+    client: string  // "key:<鉴权头哈希>" 或 "ip:<客户端 IP>"
+    requests: number
+    in_flight: number
+    rejected: { rate_limited: number; client_concurrency: number }
+    tokens: number | null
+    idle_seconds: number
+    first_seen: number
+  }>
+}
+
+// 并发限制与排队统计
+export interface ConcurrencyStats {
+  enabled: boolean
+  limit: number
+  in_flight: number
+  queue_depth: number
+  max_queue: number
+  queue_timeout: number
+  admitted: number
+  queued: number
+  rejected: { queue_full: number; queue_timeout: number }
+  wait_ms: Percentiles
+  adaptive: AdaptiveLimitStats | null
+}
+
+// 自适应并发上限（AIMD）状态
+export interface AdaptiveLimitStats {
+  limit: number
+  min_limit: number
+  max_limit: number
+  baseline_ttfb_ms: number | null
+  tolerance: number
+  backoff_ratio: number
+  increases: number
+  decreases: number
+}
+
+// 并发上限调整记录（GET /api/admin/concurrency 的 history）
+export interface LimitHistoryEntry {
+  timestamp: number
+  limit: number
+  reason: string
+}
+
+// 耗时分位数（毫秒）
+export interface Percentiles {
+  p50: number
+  p95: number
+  p99: number
+  p999?: number
+}
+
+// 延迟草图的分布摘要（毫秒）
+export interface LatencySummary extends Percentiles {
+  count: number
+  avg: number
+  p999: number
+}
+
+// token 用量（与 Anthropic API usage 字段同名）
+export interface TokenUsage {
+  input_tokens: number
+  output_tokens: number
+  cache_read_input_tokens: number
+  cache_creation_input_tokens: number
+}
+
+// token 用量累计统计
+export interface TokenUsageSummary extends TokenUsage {
+  requests: number
+  generation_seconds: number
+  output_tokens_per_second: number
+  cache_hit_ratio: number  // 缓存读取 token 占全部输入 token 的比例
+}
+
+// 上游负载均衡统计
+export interface UpstreamStats {
+  name: string
+  base_url: string
+  weight: number
+  draining: boolean
+  in_flight: number
+  requests: number
+  errors: number
+  error_rate: number
+  ewma_ttfb_ms: number | null
+  ttfb_ms: LatencySummary
+  duration_ms: LatencySummary
+  circuit_breaker?: CircuitBreakerStats
+}
+
+// 上游熔断器状态
+export interface CircuitBreakerStats {
+  enabled: boolean
+  state: 'closed' | 'open' | 'half_open'
+  window_requests: number
+  window_failures: number
+  window_failure_rate: number
+  probes_in_flight: number
+  probe_successes: number
+  rejected: number
+  retry_after: number
+  transitions: Array<{ timestamp: number; from: string; to: string; reason: string }>
 }
 
 // 错误日志类型
@@ -56,6 +235,7 @@ export interface ErrorLog {
   request_id: string
   path: string
   error: string
+  error_type?: string | null
   timestamp: number
   formatted_time: string
   response_time: number
@@ -75,6 +255,7 @@ export interface ErrorLogsResponse {
     total_requests: number
     error_rate: number
     errors_by_path: Record<string, number>
+    errors_by_type?: Record<string, number>
   }
 }
 
@@ -88,10 +269,16 @@ export interface SystemConfig {
   port: number
   custom_headers: Record<string, string>
   dashboard_enabled: boolean
+  config_version: number
+  config_loaded_at: number
+  config_source: 'startup' | 'file' | 'admin'
 }
 
 export interface ConfigUpdateRequest {
   custom_headers?: Record<string, string>
+  system_prompt_replacement?: string | null
+  system_prompt_block_insert_if_not_exist?: boolean
+  api_base_urls?: string
 }
 
 // 日志流类型
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+基准测试 - 最近请求窗口：dict 记录的 deque（按 request_id 建索引） vs 列式环形缓冲区
+
+对比内容：
+- 内存：窗口写满典型的已完成请求记录（含 usage 与流耗时字段，10% 带错误信息）后占用的内存
+- 按 request_id 查找窗口中最早的记录
+- 管理面板查询：按时间范围过滤（范围覆盖窗口的一半）并返回最新 100 条记录（含 status_code 规范化时的复制）
+
+用法: python tests/bench_recent_requests.py
+"""
+
+import os
+import sys
+import timeit
+import tracemalloc
+from collections import deque
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.sse import USAGE_FIELDS
+from backend.utils.request_ring import RequestRing
+
+WINDOWS = [1000, 10_000, 100_000]
+LIMIT = 100
+
+
+def make_record(i: int) -> dict:
+    """与 stats 写入的已完成请求记录结构相同"""
+    timestamp = 1_700_000_000.0 + i * 0.01
+    record = {
+        "request_id": f"{int(timestamp * 1000)}-{i}",
+        "path": ("v1/messages", "v1/messages/count_tokens", "v1/models")[i % 3],
+        "method": "POST",
+        "status": "completed",
+        "status_code": 200,
+        "bytes": 2048 + i % 512,
+        "response_time": 0.3 + (i % 97) / 1000,
+        "upstream": "https://anyrouter.top",
+        "attempts": 1,
+        "usage": {field: (i * 7 + n) % 5000 for n, field in enumerate(USAGE_FIELDS)},
+        "output_tokens_per_second": 42.0 + i % 13,
+        "first_byte_time": 0.3 + (i % 97) / 1000,
+        "first_token_time": 0.5,
+        "duration": 3.2 + (i % 31) / 10,
+        "chunks": 40 + i % 20,
+        "chunk_gap_avg": 0.07,
+        "chunk_gap_max": 0.4,
+        "timestamp": timestamp
+    }
+    if i % 10 == 0:
+        record.update(status_code=529, error="HTTP 529", error_type="http_error", response_content="overloaded " * 10)
+    return record
+
+
+def build_dicts(window: int):
+    records = deque(maxlen=window)
+    index = {}
+    for i in range(window):
+        record = make_record(i)
+        records.append(record)
+        index[record["request_id"]] = record
+    return records, index
+
+
+def build_ring(window: int) -> RequestRing:
+    ring = RequestRing(window, nested={"usage": USAGE_FIELDS})
+    for i in range(window):
+        ring.append(make_record(i))
+    return ring
+
+
+def measure(build, window: int):
+    """返回 (构建结果, 占用内存 MB)"""
+    tracemalloc.start()
+    result = build(window)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size / 1024 / 1024
+
+
+def bench(func, number: int) -> float:
+    """返回单次调用的平均耗时（微秒）"""
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1_000_000
+
+
+def query_dicts(records: deque, start: float, end: float) -> list:
+    """原实现：过滤全部记录、逐条复制后取最新 LIMIT 条"""
+    filtered = [req for req in records if start <= req["timestamp"] <= end]
+    copied = [dict(req) for req in filtered]
+    return copied[-LIMIT:]
+
+
+def main():
+    print(f"{'window':>8} | {'dict MB':>8} | {'ring MB':>8} | {'dict find':>10} | {'ring find':>10} | {'dict query':>11} | {'ring query':>11}")
+    print("-" * 86)
+    for window in WINDOWS:
+        (records, index), dict_mb = measure(build_dicts, window)
+        ring, ring_mb = measure(build_ring, window)
+        oldest = records[0]["request_id"]
+        assert ring.get(oldest) == records[0]
+
+        start = records[window // 2]["timestamp"]
+        end = records[-1]["timestamp"]
+        assert [r["request_id"] for r in ring.select(start, end).tail(LIMIT)] == \
+            [r["request_id"] for r in query_dicts(records, start, end)]
+
+        number = max(1, 100_000 // window)
+        dict_find = bench(lambda: index.get(oldest), 20_000)
+        ring_find = bench(lambda: ring.find(oldest), 20_000)
+        dict_query = bench(lambda: query_dicts(records, start, end), number)
+        ring_query = bench(lambda: ring.select(start, end).tail(LIMIT), number)
+        print(f"{window:>8} | {dict_mb:>8.1f} | {ring_mb:>8.1f} | {dict_find:>7.3f} us | {ring_find:>7.3f} us | "
+              f"{dict_query / 1000:>8.2f} ms | {ring_query / 1000:>8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
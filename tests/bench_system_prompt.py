@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+基准测试 - system prompt 字节拼接 vs 完整 JSON 改写
+
+用法: python tests/bench_system_prompt.py
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+import timeit
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services import proxy
+
+SIZES = [10 * 1024, 100 * 1024, 1024 * 1024, 5 * 1024 * 1024]
+
+
+def build_body(target_size: int) -> bytes:
+    """构造接近 Claude Code 请求结构的请求体（messages 在 system 之前）"""
+    turn = {
+        "role": "user",
+        "content": [
+            {"type": "text", "text": "请阅读下面的代码并解释 {braces} [brackets] \"quotes\"。" + "x = compute(a, b)\n" * 40},
+            {"type": "tool_result", "tool_use_id": "toolu_01", "content": "ok"},
+        ],
+    }
+    turn_size = len(json.dumps(turn, ensure_ascii=False).encode('utf-8'))
+    data = {
+        "model": "claude-sonnet-4",
+        "messages": [turn] * max(1, target_size // turn_size),
+        "system": [
+            {"type": "text", "text": "You are Claude Code, Anthropic's official CLI for Claude.", "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": "Environment details..." * 50},
+        ],
+        "tools": [{"name": f"tool_{i}", "description": "d" * 200, "input_schema": {"type": "object"}} for i in range(20)],
+        "max_tokens": 32000,
+        "stream": True,
+    }
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return body
+
+
+def bench(func, body: bytes) -> float:
+    """返回单次调用的平均耗时（毫秒）"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        number = max(3, int(20_000_000 / len(body)))
+        return min(timeit.repeat(lambda: func(body), number=number, repeat=3)) / number * 1000
+
+
+def splice_uncached(body: bytes) -> bytes:
+    """每次调用前清空改写缓存，测量未命中时的耗时"""
+    proxy.system_prompt_cache.clear()
+    return proxy._splice_system_prompt(body)
+
+
+def main():
+    proxy.SYSTEM_PROMPT_REPLACEMENT = "You are Claude Code, Anthropic's official CLI for Claude."
+    print(f"{'body size':>12} | {'json rewrite':>14} | {'byte splice':>14} | {'cached splice':>14} | {'speedup':>8}")
+    print("-" * 75)
+    for size in SIZES:
+        body = build_body(size)
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert json.loads(proxy._splice_system_prompt(body)) == json.loads(proxy._rewrite_system_prompt_json(body))
+        json_ms = bench(proxy._rewrite_system_prompt_json, body)
+        splice_ms = bench(splice_uncached, body)
+        cached_ms = bench(proxy._splice_system_prompt, body)
+        print(f"{len(body) / 1024:>9.0f} KB | {json_ms:>11.3f} ms | {splice_ms:>11.3f} ms | {cached_ms:>11.3f} ms | {json_ms / cached_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+测试多上游解析与基于 EWMA / 进行中请求数 / 权重的上游选择
+"""
+
+import sys
+import os
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services import balancer
+
+
+def _with_upstreams(raw: str):
+    """替换全局上游列表与权重表，返回原列表与权重表以便恢复"""
+    saved = list(balancer.upstreams), balancer.weights
+    balancer._install(balancer.parse_upstreams(raw, "https://default.example.com"))
+    return saved
+
+
+def _restore(saved):
+    upstreams, weights = saved
+    balancer.upstreams[:] = upstreams
+    balancer.weights = weights
+
+
+def test_parse_upstreams():
+    """测试上游列表解析：权重、默认值、重名处理"""
+    parsed = balancer.parse_upstreams(" https://a.example.com/|3, https://b.example.com ,https://a.example.com|x", "https://d.example.com")
+    assert [(u.name, u.base_url, weight) for u, weight in parsed] == [
+        ("a.example.com", "https://a.example.com", 3.0),
+        ("b.example.com", "https://b.example.com", 1.0),
+        ("a.example.com#3", "https://a.example.com", 1.0),
+    ]
+    assert parsed[0][0].host == "a.example.com"
+
+    default = balancer.parse_upstreams("", "https://d.example.com")
+    assert [u.base_url for u, _ in default] == ["https://d.example.com"]
+    print("✓ 上游列表解析正确")
+
+
+def test_validate_upstreams():
+    """测试管理面板保存前的上游列表校验：地址必须是 http(s)，权重必须是正数"""
+    balancer.validate_upstreams(" https://a.example.com|3, http://b.example.com ,")
+    for raw in ("a.example.com", "https://a.example.com|x", "https://a.example.com|0",
+                "https://a.example.com|-1", "https://a.example.com,ftp://b.example.com", "https://|2"):
+        try:
+            balancer.validate_upstreams(raw)
+        except ValueError:
+            continue
+        raise AssertionError(f"{raw!r} should be rejected")
+    print("✓ 上游列表校验正确")
+
+
+def test_reload_keeps_weights_per_snapshot():
+    """测试重新加载上游时沿用已有对象，新权重不影响持有旧权重表的进行中请求"""
+    saved = _with_upstreams("https://a.example.com|3,https://b.example.com|1")
+    try:
+        a, b = balancer.upstreams
+        old_pool, old_weights = tuple(balancer.upstreams), balancer.weights
+        pairs = balancer.reload_upstreams("https://a.example.com|1,https://b.example.com|3", "https://default.example.com")
+        assert [u for u, _ in pairs] == [a, b]
+        assert old_weights == {"a.example.com": 3.0, "b.example.com": 1.0}
+        assert balancer.weights == {"a.example.com": 1.0, "b.example.com": 3.0}
+
+        a.observe_ttfb(0.2)
+        b.observe_ttfb(0.2)
+        # 旧快照按旧权重分配，新请求按新权重分配
+        calls = [balancer.select_upstream(pool=old_pool, pool_weights=old_weights).start() for _ in range(40)]
+        assert a.in_flight == 30 and b.in_flight == 10, (a.in_flight, b.in_flight)
+        for call in calls:
+            call.finish()
+        calls = [balancer.select_upstream().start() for _ in range(40)]
+        assert a.in_flight == 10 and b.in_flight == 30, (a.in_flight, b.in_flight)
+        for call in calls:
+            call.finish()
+        assert {s["name"]: s["weight"] for s in balancer.get_upstream_stats()} == {"a.example.com": 1.0, "b.example.com": 3.0}
+        print("✓ 权重按配置快照生效")
+    finally:
+        _restore(saved)
+
+
+def test_select_prefers_fast_and_idle_upstream():
+    """测试优先选择 EWMA 低、进行中请求少的上游"""
+    saved = _with_upstreams("https://fast.example.com,https://slow.example.com")
+    try:
+        fast, slow = balancer.upstreams
+        fast.observe_ttfb(0.1)
+        slow.observe_ttfb(1.0)
+        assert balancer.select_upstream() is fast
+
+        # 快速上游积压的请求足够多时，分数超过慢速上游
+        calls = [fast.start() for _ in range(10)]
+        assert balancer.select_upstream() is slow
+        for call in calls:
+            call.finish()
+        assert fast.in_flight == 0
+        print("✓ 按 EWMA 与进行中请求数选择上游")
+    finally:
+        _restore(saved)
+
+
+def test_weights_and_draining():
+    """测试权重分配比例与摘流"""
+    saved = _with_upstreams("https://a.example.com|3,https://b.example.com|1")
+    try:
+        a, b = balancer.upstreams
+        a.observe_ttfb(0.2)
+        b.observe_ttfb(0.2)
+
+        # 模拟并发：选中后不结束，统计分配比例
+        calls = [balancer.select_upstream().start() for _ in range(40)]
+        assert a.in_flight == 30 and b.in_flight == 10, (a.in_flight, b.in_flight)
+        for call in calls:
+            call.finish()
+
+        assert balancer.set_draining("a.example.com", True)
+        assert all(balancer.select_upstream() is b for _ in range(5))
+        # 全部摘流时仍然可以选择
+        assert balancer.set_draining("b.example.com", True)
+        assert balancer.select_upstream() in (a, b)
+        assert not balancer.set_draining("missing.example.com", True)
+        print("✓ 权重比例与摘流生效")
+    finally:
+        _restore(saved)
+
+
+def test_exclude_and_avoid():
+    """测试 exclude 排除后没有候选时返回 None（单上游时不对冲），avoid 只是优先避开（单上游时仍可重试）"""
+    saved = _with_upstreams("https://only.example.com")
+    try:
+        only, = balancer.upstreams
+        assert balancer.select_upstream() is only
+        assert balancer.select_upstream(exclude=(only,)) is None
+        assert balancer.select_upstream(avoid=(only,)) is only
+    finally:
+        _restore(saved)
+
+    saved = _with_upstreams("https://a.example.com,https://b.example.com")
+    try:
+        a, b = balancer.upstreams
+        a.observe_ttfb(0.1)
+        b.observe_ttfb(1.0)
+        assert balancer.select_upstream(exclude=(a,)) is b
+        assert balancer.select_upstream(avoid=(a,)) is b
+        assert balancer.select_upstream(exclude=(a, b)) is None
+        assert balancer.select_upstream(avoid=(a, b)) is a
+        print("✓ exclude 与 avoid 正确")
+    finally:
+        _restore(saved)
+
+
+def test_failure_penalizes_ewma():
+    """测试请求失败后 EWMA 被惩罚，错误率计入统计"""
+    saved = _with_upstreams("https://a.example.com,https://b.example.com")
+    try:
+        a, b = balancer.upstreams
+        a.observe_ttfb(0.1)
+        b.observe_ttfb(0.3)
+        a.start().finish(failed=True)
+        assert a.ewma_ttfb > b.ewma_ttfb
+        assert balancer.select_upstream() is b
+
+        stats = {s["name"]: s for s in balancer.get_upstream_stats()}
+        assert stats["a.example.com"]["errors"] == 1
+        assert stats["a.example.com"]["error_rate"] == 1.0
+        print("✓ 失败惩罚与统计正确")
+    finally:
+        _restore(saved)
+
+
+if __name__ == "__main__":
+    try:
+        test_parse_upstreams()
+        test_validate_upstreams()
+        test_reload_keeps_weights_per_snapshot()
+        test_select_prefers_fast_and_idle_upstream()
+        test_weights_and_draining()
+        test_exclude_and_avoid()
+        test_failure_penalizes_ewma()
+        print("\n✓ 所有负载均衡测试通过！")
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        sys.exit(1)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+测试上游熔断器的状态转换：按滚动窗口失败率熔断、半开探测、探测成功恢复与失败重新熔断
+"""
+
+import sys
+import os
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services import balancer
+from backend.services.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+def _breaker(open_seconds: float = 0.0) -> CircuitBreaker:
+    return CircuitBreaker("test", failure_rate=0.5, min_requests=4, window=30,
+                          open_seconds=open_seconds, half_open_probes=2, enabled=True)
+
+
+def test_opens_on_failure_rate():
+    """测试请求数达到下限且失败率达到阈值时熔断"""
+    breaker = _breaker(open_seconds=60)
+    for failed in (True, False, True):
+        breaker.on_result(failed)
+    assert breaker.state == CLOSED  # 请求数不足
+    breaker.on_result(True)
+    assert breaker.state == OPEN
+    assert not breaker.available()
+    assert breaker.retry_after() > 0
+    print("✓ 失败率达到阈值时熔断")
+
+
+def test_half_open_probes_close_circuit():
+    """测试半开状态只放行有限的探测请求，全部成功后恢复"""
+    breaker = _breaker(open_seconds=0)
+    for _ in range(4):
+        breaker.on_result(True)
+    assert breaker.available()  # 熔断时长为 0，立即进入半开
+    assert breaker.state == HALF_OPEN
+
+    probes = [breaker.on_request(), breaker.on_request()]
+    assert all(probes)
+    assert not breaker.available()  # 探测名额已用完
+
+    for probe in probes:
+        breaker.on_result(False, probe)
+    assert breaker.state == CLOSED
+    assert [t["to"] for t in breaker.transitions] == [OPEN, HALF_OPEN, CLOSED]
+    print("✓ 探测全部成功后恢复")
+
+
+def test_failed_probe_reopens_and_stale_probe_ignored():
+    """测试探测失败重新熔断，上一轮半开的迟到探测结果不影响新一轮"""
+    breaker = _breaker(open_seconds=0)
+    for _ in range(4):
+        breaker.on_result(True)
+    breaker.available()
+    first_probe = breaker.on_request()
+    stale_probe = breaker.on_request()
+    breaker.on_result(True, first_probe)
+    assert breaker.state == OPEN
+
+    breaker.available()
+    assert breaker.state == HALF_OPEN
+    new_probe = breaker.on_request()
+    breaker.on_result(False, stale_probe)  # 上一轮的探测，忽略
+    assert breaker.probes_in_flight == 1 and breaker.probe_successes == 0
+    breaker.on_cancel(new_probe)
+    assert breaker.probes_in_flight == 0
+    print("✓ 探测失败重新熔断，迟到的探测结果被忽略")
+
+
+def test_select_upstream_skips_open_circuit():
+    """测试负载均衡跳过已熔断的上游，全部熔断时返回 None"""
+    saved = list(balancer.upstreams), balancer.weights
+    balancer._install(balancer.parse_upstreams("https://a.example.com,https://b.example.com", ""))
+    try:
+        a, b = balancer.upstreams
+        for upstream in (a, b):
+            upstream.breaker = _breaker(open_seconds=60)
+        for _ in range(4):
+            a.start().finish(failed=True)
+        assert a.breaker.state == OPEN
+        assert all(balancer.select_upstream() is b for _ in range(5))
+
+        for _ in range(4):
+            b.start().finish(failed=True)
+        assert balancer.select_upstream() is None
+        assert balancer.circuit_retry_after() > 0
+        print("✓ 负载均衡跳过已熔断的上游")
+    finally:
+        balancer.upstreams[:], balancer.weights = saved
+
+
+if __name__ == "__main__":
+    try:
+        test_opens_on_failure_rate()
+        test_half_open_probes_close_circuit()
+        test_failed_probe_reopens_and_stale_probe_ignored()
+        test_select_upstream_skips_open_circuit()
+        print("\n✓ 所有熔断器测试通过！")
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        sys.exit(1)
@@ -3,13 +3,17 @@
 测试 encoding 模块的功能
 """
 
+import gzip
 import sys
 import os
+import zlib
 
 # 将 backend 目录添加到路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from backend.utils.encoding import ensure_unicode
+from backend.utils.encoding import ensure_unicode, decompress_body
+from backend.services.header_rules import HeaderRewriter
+from backend.services.proxy import filter_response_headers
 
 def test_encoding_conversion():
     """测试编码转换功能"""
@@ -72,8 +76,60 @@ def test_encoding_conversion():
     print("=" * 60)
     return 0
 
+def test_decompress_body():
+    """测试压缩透传模式下错误响应内容的解压"""
+    original = '{"error": {"message": "当前模型无法访问"}}'.encode('utf-8') * 100
+
+    assert decompress_body(gzip.compress(original), "gzip") == original
+    assert decompress_body(zlib.compress(original), "deflate") == original
+    assert decompress_body(original, None) == original
+    # 截断的压缩数据尽量解压已有部分，输出受长度限制
+    assert original.startswith(decompress_body(gzip.compress(original)[:200], "gzip"))
+    assert len(decompress_body(gzip.compress(original), "gzip", max_length=100)) == 100
+    # 不支持的编码或损坏的数据返回原始字节
+    assert decompress_body(b"raw", "zstd") == b"raw"
+    assert decompress_body(b"not gzip", "gzip") == b"not gzip"
+    print("✓ 错误响应解压正确")
+
+
+def test_decompress_brotli_capped():
+    """测试 br 编码的解压：高压缩比的内容只解压到长度上限"""
+    from backend.utils import encoding
+    if encoding.brotli is None:
+        print("- 未安装 brotli，跳过 br 解压测试")
+        return
+    original = '{"error": {"message": "当前模型无法访问"}}'.encode('utf-8') * 100
+    assert decompress_body(encoding.brotli.compress(original), "br") == original
+
+    # 16MB 的重复内容压缩后只有几十字节，解压输出应被限制在 max_length
+    bomb = encoding.brotli.compress(b"A" * (16 * 1024 * 1024), quality=1)
+    result = decompress_body(bomb, "br", max_length=1000)
+    assert result == b"A" * 1000
+    # 截断的压缩数据解压已有部分
+    assert original.startswith(decompress_body(encoding.brotli.compress(original)[:40], "br"))
+    print("✓ br 解压输出受长度限制")
+
+
+def test_compression_passthrough_headers():
+    """测试压缩透传模式下 Accept-Encoding 与 Content-Encoding 的处理"""
+    rewriter = HeaderRewriter({}, [], "api.example.com")
+    request_headers = [("Accept-Encoding", "gzip, br"), ("X-Api-Key", "k")]
+    assert rewriter.rewrite(request_headers, passthrough=False)["Accept-Encoding"] == "identity"
+    assert rewriter.rewrite(request_headers, passthrough=True)["Accept-Encoding"] == "gzip, br"
+    # 客户端未声明编码时仍要求未压缩内容，避免 httpx 默认补充 gzip
+    assert rewriter.rewrite([("X-Api-Key", "k")], passthrough=True)["Accept-Encoding"] == "identity"
+
+    response_headers = [("Content-Encoding", "gzip"), ("Content-Length", "10")]
+    assert filter_response_headers(response_headers, passthrough=False) == {}
+    assert filter_response_headers(response_headers, passthrough=True) == {"Content-Encoding": "gzip"}
+    print("✓ 压缩透传请求头处理正确")
+
+
 if __name__ == "__main__":
     try:
+        test_decompress_body()
+        test_decompress_brotli_capped()
+        test_compression_passthrough_headers()
         sys.exit(test_encoding_conversion())
     except Exception as e:
         print(f"\n✗ 测试失败: {e}")
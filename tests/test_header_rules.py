@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+测试请求头改写规则：内置过滤、自定义请求头、drop / set / append / rename、路径条件与 X-Forwarded-For
+"""
+
+import sys
+import os
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.header_rules import HeaderRewriter, parse_rules
+
+INCOMING = [
+    ("host", "localhost:8088"),
+    ("connection", "keep-alive"),
+    ("content-length", "42"),
+    ("accept-encoding", "gzip, br"),
+    ("user-agent", "client/1.0"),
+    ("x-api-key", "sk-test"),
+    ("x-forwarded-for", "10.0.0.1")
+]
+
+
+def test_builtin_filtering():
+    """测试移除 hop-by-hop 头与 Content-Length、改写 Host、Accept-Encoding 与 X-Forwarded-For"""
+    rewriter = HeaderRewriter({}, [], "api.example.com")
+    out = rewriter.rewrite(INCOMING, "v1/messages", "10.0.0.2", passthrough=False)
+    assert out == {
+        "Host": "api.example.com",
+        "Accept-Encoding": "identity",
+        "user-agent": "client/1.0",
+        "x-api-key": "sk-test",
+        "x-forwarded-for": "10.0.0.1, 10.0.0.2"
+    }
+    assert rewriter.rewrite(INCOMING, "v1/messages", target_host="b.example.com", passthrough=True)["accept-encoding"] == "gzip, br"
+    assert rewriter.rewrite([], "v1/messages", passthrough=True) == {"Host": "api.example.com", "Accept-Encoding": "identity"}
+    # 客户端未发送 X-Forwarded-For 时按标准写法新增
+    assert rewriter.rewrite([("X-Api-Key", "k")], "v1/messages", "10.0.0.2", passthrough=False)["X-Forwarded-For"] == "10.0.0.2"
+    print("✓ 内置过滤正确")
+
+
+def test_custom_headers_override_case_insensitive():
+    """测试自定义请求头不区分大小写地覆盖原请求中的同名头部，转发时保留配置中的头名大小写"""
+    rewriter = HeaderRewriter({"User-Agent": "claude-cli/2.0.8", "X-Custom-Token": "t"}, [], "api.example.com")
+    out = rewriter.rewrite(INCOMING, "v1/messages", passthrough=False)
+    assert out["User-Agent"] == "claude-cli/2.0.8"
+    assert out["X-Custom-Token"] == "t"
+    assert "user-agent" not in out and "x-custom-token" not in out
+    # 未改写的客户端请求头保留原有大小写
+    assert rewriter.rewrite([("X-Api-Key", "k")], "v1/messages", passthrough=False)["X-Api-Key"] == "k"
+    print("✓ 自定义请求头覆盖正确")
+
+
+def test_declarative_rules_and_path_condition():
+    """测试 drop / rename / set / append 规则与按路径生效的规则"""
+    rules = parse_rules([
+        {"action": "drop", "name": "X-Api-Key"},
+        {"action": "rename", "name": "user-agent", "to": "X-Client-Agent"},
+        {"action": "set", "name": "anthropic-beta", "value": "a"},
+        {"action": "append", "name": "anthropic-beta", "value": "b"},
+        {"action": "set", "name": "x-route", "value": "messages", "path": "/v1/messages*"},
+        {"action": "explode", "name": "x"},
+        {"action": "set", "name": "x-missing-value"}
+    ])
+    assert len(rules) == 5  # 无效规则被跳过
+
+    rewriter = HeaderRewriter({"User-Agent": "ignored-after-rename"}, rules, "api.example.com")
+    out = rewriter.rewrite(INCOMING, "v1/messages", passthrough=False)
+    assert "x-api-key" not in out
+    assert out["X-Client-Agent"] == "client/1.0"
+    assert out["anthropic-beta"] == "a, b"
+    assert out["x-route"] == "messages"
+
+    other = rewriter.rewrite(INCOMING, "v1/models", passthrough=False)
+    assert "x-route" not in other
+    assert rewriter.plan_for("v1/messages", False) is rewriter.plan_for("v1/messages", False)  # 按路径缓存
+    print("✓ 声明式规则与路径条件正确")
+
+
+if __name__ == "__main__":
+    try:
+        test_builtin_filtering()
+        test_custom_headers_override_case_insensitive()
+        test_declarative_rules_and_path_condition()
+        print("\n✓ 所有请求头改写规则测试通过！")
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        sys.exit(1)
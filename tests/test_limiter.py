@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+测试并发限制：FIFO 排队、队列满与排队超时拒绝、取消排队、运行时调整上限与 AIMD 自适应上限
+"""
+
+import asyncio
+import sys
+import os
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services import limiter as limiter_module
+from backend.services.limiter import AIMDLimit, ConcurrencyLimiter, LimiterRejected, QUEUE_FULL, QUEUE_TIMEOUT
+
+
+def test_fifo_queue_and_queue_full():
+    """测试名额按排队顺序交给等待者，队列满时立即以 429 拒绝"""
+    async def run():
+        limiter = ConcurrencyLimiter(limit=1, max_queue=2, queue_timeout=5)
+        await limiter.acquire()
+        order = []
+
+        async def waiter(name):
+            await limiter.acquire()
+            order.append(name)
+
+        tasks = [asyncio.create_task(waiter(name)) for name in ("a", "b")]
+        await asyncio.sleep(0)
+        assert limiter.stats()["queue_depth"] == 2
+
+        try:
+            await limiter.acquire()
+            assert False, "队列满时应拒绝"
+        except LimiterRejected as e:
+            assert e.reason == QUEUE_FULL and e.status_code == 429
+
+        limiter.release()
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*tasks)
+        assert order == ["a", "b"]
+        limiter.release()
+        assert limiter.in_flight == 0
+
+    asyncio.run(run())
+    print("✓ FIFO 排队与队列满拒绝正确")
+
+
+def test_queue_timeout_and_cancel():
+    """测试排队超时以 503 拒绝，取消排队不占用名额"""
+    async def run():
+        limiter = ConcurrencyLimiter(limit=1, max_queue=5, queue_timeout=0.05)
+        await limiter.acquire()
+        try:
+            await limiter.acquire()
+            assert False, "排队超时应拒绝"
+        except LimiterRejected as e:
+            assert e.reason == QUEUE_TIMEOUT and e.status_code == 503
+        assert limiter.stats()["queue_depth"] == 0
+
+        limiter.queue_timeout = 5
+        task = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        limiter.release()
+        assert limiter.in_flight == 0 and limiter.stats()["queue_depth"] == 0
+
+    asyncio.run(run())
+    print("✓ 排队超时与取消处理正确")
+
+
+def test_set_limit_wakes_waiters():
+    """测试上调并发上限时立即放行排队的请求"""
+    async def run():
+        limiter = ConcurrencyLimiter(limit=1, max_queue=5, queue_timeout=5)
+        await limiter.acquire()
+        tasks = [asyncio.create_task(limiter.acquire()) for _ in range(2)]
+        await asyncio.sleep(0)
+        limiter.set_limit(3)
+        await asyncio.gather(*tasks)
+        assert limiter.in_flight == 3
+
+        # 下调上限后，释放的名额不再交给等待者，直到进行中的请求数低于新上限
+        limiter.set_limit(1)
+        task = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        limiter.release()
+        limiter.release()
+        await asyncio.sleep(0)
+        assert not task.done() and limiter.in_flight == 1
+        limiter.release()
+        await task
+        assert limiter.in_flight == 1
+
+    asyncio.run(run())
+    print("✓ 运行时调整并发上限正确")
+
+
+def test_aimd_decrease_and_increase():
+    """测试 TTFB 超过基线容忍倍数或失败时乘性下调，并发接近上限时加性上调"""
+    saved = limiter_module.DECREASE_INTERVAL
+    limiter_module.DECREASE_INTERVAL = 0
+    try:
+        aimd = AIMDLimit(initial=20, min_limit=4, max_limit=40, tolerance=2, backoff_ratio=0.5)
+        assert aimd.update(0.1, failed=False, in_flight=2) == 20  # 低负载时不增加
+        assert aimd.baseline_ttfb == 0.1
+        assert aimd.update(0.15, failed=False, in_flight=10) == 20  # 1/20 的增量
+        assert aimd.update(0.3, failed=False, in_flight=10) == 10  # 超过 2 倍基线
+        assert aimd.update(None, failed=True, in_flight=10) == 5
+        assert aimd.update(None, failed=True, in_flight=10) == 4  # 不低于下限
+        for _ in range(1000):  # 每个样本增加 1/上限，从 4 增长到 40 约需 800 个样本
+            aimd.update(0.1, failed=False, in_flight=40)
+        assert aimd.update(0.1, failed=False, in_flight=40) == 40  # 不超过上限
+        assert [h["limit"] for h in aimd.history][:4] == [20, 10, 5, 4]
+        assert aimd.stats()["decreases"] == 3
+    finally:
+        limiter_module.DECREASE_INTERVAL = saved
+    print("✓ AIMD 上限调整正确")
+
+
+def test_aimd_decrease_interval():
+    """测试同一轮过载的多个慢样本在间隔内只下调一次"""
+    aimd = AIMDLimit(initial=20, min_limit=1, max_limit=40, tolerance=2, backoff_ratio=0.5)
+    aimd.update(0.1, failed=False, in_flight=1)
+    for _ in range(5):
+        aimd.update(1.0, failed=False, in_flight=20)
+    assert int(aimd.limit) == 10 and aimd.decreases == 1
+    print("✓ 下调间隔生效")
+
+
+def test_limiter_observe_applies_limit():
+    """测试自适应模式下请求结果反馈会调整限制器上限"""
+    saved = limiter_module.DECREASE_INTERVAL
+    limiter_module.DECREASE_INTERVAL = 0
+    try:
+        aimd = AIMDLimit(initial=8, min_limit=2, max_limit=16, tolerance=2, backoff_ratio=0.5)
+        limiter = ConcurrencyLimiter(limit=0, max_queue=5, queue_timeout=1, adaptive=aimd)
+        assert limiter.limit == 8 and limiter.enabled
+        limiter.observe(None, failed=True)
+        assert limiter.limit == 4
+        assert limiter.stats()["adaptive"]["limit"] == 4
+
+        # 未启用自适应时 observe 不改变上限
+        fixed = ConcurrencyLimiter(limit=8, max_queue=5, queue_timeout=1)
+        fixed.observe(None, failed=True)
+        assert fixed.limit == 8
+    finally:
+        limiter_module.DECREASE_INTERVAL = saved
+    print("✓ 请求结果反馈调整上限")
+
+
+if __name__ == "__main__":
+    try:
+        test_fifo_queue_and_queue_full()
+        test_queue_timeout_and_cancel()
+        test_set_limit_wakes_waiters()
+        test_aimd_decrease_and_increase()
+        test_aimd_decrease_interval()
+        test_limiter_observe_applies_limit()
+        print("\n✓ 所有并发限制测试通过！")
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        sys.exit(1)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+测试异步日志：入队与写出顺序、队列满时丢弃、按分类采样、flush 之后的日志继续写出
+"""
+
+import io
+import json
+import sys
+import os
+import time
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.utils import logger as log_module
+from backend.utils.logger import Logger, _LogWriter, _parse_sample_rates
+
+
+class _Capture:
+    """临时替换 stdout 与写入间隔，收集后台线程写出的内容"""
+
+    def __init__(self, interval: float = 10):
+        self.interval = interval
+        self.buffer = io.StringIO()
+
+    def __enter__(self):
+        self.saved = sys.stdout, log_module.FLUSH_INTERVAL
+        sys.stdout = self.buffer
+        log_module.FLUSH_INTERVAL = self.interval
+        return self
+
+    def __exit__(self, *exc):
+        sys.stdout, log_module.FLUSH_INTERVAL = self.saved
+
+    def lines(self) -> list:
+        # 捕获期间全局日志线程（其他测试的日志）也可能写入 stdout，只保留本测试分类的 JSON 日志
+        lines = []
+        for line in self.buffer.getvalue().splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(record, dict) and record.get("category") in ("test", "sampled"):
+                lines.append(record)
+        return lines
+
+
+def _record(message: str, **fields) -> tuple:
+    return (time.time(), "INFO", "test", message, fields)
+
+
+def test_emit_and_drain_in_order():
+    """测试日志按入队顺序写出，结构化字段写入 JSON"""
+    writer = _LogWriter(100, json_format=True)
+    with _Capture() as capture:
+        for i in range(5):
+            writer.emit(_record(f"m{i}", n=i))
+        # 写入间隔足够长，flush 前不会写出
+        assert writer.stats()["queued"] == 5
+        writer.flush()
+    lines = capture.lines()
+    assert [line["message"] for line in lines] == ["m0", "m1", "m2", "m3", "m4"]
+    assert lines[2]["n"] == 2 and lines[2]["category"] == "test"
+    assert writer.written == 5 and writer.stats()["queued"] == 0
+    print("✓ 日志按顺序写出")
+
+
+def test_drop_when_queue_full():
+    """测试队列已满时丢弃新日志并计数，已入队的日志照常写出"""
+    writer = _LogWriter(3, json_format=True)
+    with _Capture() as capture:
+        for i in range(5):
+            writer.emit(_record(f"m{i}"))
+        writer.flush()
+    assert [line["message"] for line in capture.lines()] == ["m0", "m1", "m2"]
+    assert writer.dropped == 2 and writer.written == 3
+    print("✓ 队列满时丢弃并计数")
+
+
+def test_sampling():
+    """测试采样只作用于 WARNING 以下级别，被采样跳过的日志计数"""
+    assert _parse_sample_rates("proxy=0.1, stats=2,bad,x=y") == {"proxy": 0.1, "stats": 1.0}
+
+    writer = _LogWriter(100, json_format=True)
+    saved = log_module._writer, log_module._min_level
+    log_module._writer, log_module._min_level = writer, log_module.LEVELS["DEBUG"]
+    try:
+        with _Capture() as capture:
+            logger = Logger("sampled")
+            logger.sample_rate = 0.0
+            logger.debug("dropped")
+            logger.info("dropped")
+            logger.warning("kept")
+            logger.error("kept")
+            writer.flush()
+    finally:
+        log_module._writer, log_module._min_level = saved
+    assert [line["level"] for line in capture.lines()] == ["WARNING", "ERROR"]
+    assert writer.sampled_out == 2
+    print("✓ 按分类采样")
+
+
+def test_logging_after_flush():
+    """测试 flush 停止后台线程后，之后的日志重新启动线程并写出"""
+    writer = _LogWriter(100, json_format=True)
+    with _Capture(interval=0.01) as capture:
+        writer.emit(_record("before"))
+        writer.flush()
+        assert writer._thread is None
+        writer.emit(_record("after"))
+        for _ in range(200):
+            if writer.written == 2:
+                break
+            time.sleep(0.01)
+        writer.flush()
+    assert [line["message"] for line in capture.lines()] == ["before", "after"]
+    print("✓ flush 之后的日志继续写出")
+
+
+if __name__ == "__main__":
+    try:
+        test_emit_and_drain_in_order()
+        test_drop_when_queue_full()
+        test_sampling()
+        test_logging_after_flush()
+        print("\n✓ 所有日志测试通过！")
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        sys.exit(1)
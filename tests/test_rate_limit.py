@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+测试按客户端限流：客户端标识、令牌桶、并发上限与空闲客户端清除
+"""
+
+import sys
+import os
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.rate_limit import (
+    ClientRateLimiter,
+    client_key,
+    RATE_LIMITED,
+    TOO_MANY_CONCURRENT
+)
+
+
+def _limiter(**overrides) -> ClientRateLimiter:
+    options = dict(rps=1, burst=2, max_concurrent=0, idle_ttl=600, max_tracked=100)
+    options.update(overrides)
+    return ClientRateLimiter(**options)
+
+
+def test_client_key():
+    """测试按鉴权头哈希区分客户端，不保存原始密钥，没有鉴权头时按 IP 区分"""
+    key_a = client_key({"x-api-key": "sk-secret-a"}, "10.0.0.1")
+    assert key_a.startswith("key:") and "secret" not in key_a
+    assert key_a == client_key({"x-api-key": "sk-secret-a"}, "10.0.0.2")
+    assert key_a != client_key({"x-api-key": "sk-secret-b"}, "10.0.0.1")
+    assert client_key({}, "10.0.0.1") == "ip:10.0.0.1"
+    print("✓ 客户端标识正确")
+
+
+def test_token_bucket():
+    """测试令牌桶允许突发请求，之后按速率补充令牌"""
+    limiter = _limiter()
+    assert limiter.acquire("a") == (None, 0)
+    assert limiter.acquire("a") == (None, 0)
+    reason, retry_after = limiter.acquire("a")
+    assert reason == RATE_LIMITED and retry_after == 1
+    assert limiter.acquire("b") == (None, 0)  # 其他客户端不受影响
+
+    # 模拟经过 1 秒：补充 1 个令牌
+    limiter.clients["a"].updated -= 1.0
+    assert limiter.acquire("a") == (None, 0)
+    assert limiter.clients["a"].rejected[RATE_LIMITED] == 1
+    print("✓ 令牌桶限流正确")
+
+
+def test_concurrent_limit():
+    """测试同时进行的请求数上限，请求结束后释放"""
+    limiter = _limiter(rps=0, max_concurrent=2)
+    assert limiter.acquire("a")[0] is None
+    assert limiter.acquire("a")[0] is None
+    assert limiter.acquire("a")[0] == TOO_MANY_CONCURRENT
+    limiter.release("a")
+    assert limiter.acquire("a")[0] is None
+    assert limiter.clients["a"].in_flight == 2
+    print("✓ 并发上限正确")
+
+
+def test_idle_eviction():
+    """测试空闲客户端从最久未访问的一端清除，有进行中请求的客户端保留"""
+    limiter = _limiter(idle_ttl=10)
+    for key in ("a", "b", "c"):
+        limiter.acquire(key)
+    limiter.release("a")
+    limiter.release("c")
+    for key in ("a", "b", "c"):
+        limiter.clients[key].last_seen -= 60
+    limiter.acquire("d")
+    assert list(limiter.clients) == ["b", "d"]  # b 仍有进行中的请求
+    assert limiter.evicted == 2
+
+    # 超出跟踪数量上限时清除最久未访问的客户端
+    limiter = _limiter(max_tracked=2)
+    for key in ("a", "b", "c"):
+        limiter.acquire(key)
+        limiter.release(key)
+    limiter.acquire("d")
+    assert len(limiter.clients) <= 3 and "a" not in limiter.clients
+    print("✓ 空闲客户端清除正确")
+
+
+if __name__ == "__main__":
+    try:
+        test_client_key()
+        test_token_bucket()
+        test_concurrent_limit()
+        test_idle_eviction()
+        print("\n✓ 所有客户端限流测试通过！")
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        sys.exit(1)
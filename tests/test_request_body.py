@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+测试请求体长度校验：解析 Content-Length、判断是否携带请求体，以及无效的 Content-Length 返回 400
+"""
+
+import asyncio
+import sys
+import os
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starlette.requests import Request
+
+from backend.services.proxy import parse_content_length, has_request_body
+
+
+def test_parse_content_length():
+    """测试 Content-Length 只接受非负整数，缺失时返回 None"""
+    assert parse_content_length({}) is None
+    assert parse_content_length({"content-length": "10"}) == 10
+    assert parse_content_length({"content-length": " 0 "}) == 0
+    for raw in ("abc", "-5", "+5", "1.5", "", "１０"):
+        try:
+            parse_content_length({"content-length": raw})
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"{raw!r} should be rejected")
+    print("✓ Content-Length 解析正确")
+
+
+def test_has_request_body():
+    """测试按 Content-Length 与 Transfer-Encoding 判断是否携带请求体，无效的 Content-Length 抛出 ValueError"""
+    assert has_request_body({}) is False
+    assert has_request_body({"content-length": "0"}) is False
+    assert has_request_body({"content-length": "10"}) is True
+    assert has_request_body({"transfer-encoding": "chunked"}) is True
+    for raw in ("abc", "-5"):
+        try:
+            has_request_body({"content-length": raw})
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"{raw!r} should be rejected")
+    print("✓ 请求体判断正确")
+
+
+def test_invalid_content_length_rejected():
+    """测试无效的 Content-Length 在转发前返回 400，不记录统计也不发往上游"""
+    from backend import app as app_module
+    from backend.services import stats
+
+    def request(content_length: str) -> Request:
+        scope = {
+            "type": "http",
+            "method": "POST",
+            "path": "/v1/models",
+            "query_string": b"",
+            "headers": [(b"content-length", content_length.encode())],
+            "client": ("127.0.0.1", 12345)
+        }
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        return Request(scope, receive)
+
+    async def run():
+        stats.apply_stats_events()
+        total = stats.get_request_totals()["total_requests"]
+        for raw in ("abc", "-5"):
+            response = await app_module.forward_request("v1/models", request(raw))
+            assert response.status_code == 400, response.status_code
+            assert response.body == b"Invalid Content-Length"
+        stats.apply_stats_events()
+        assert stats.get_request_totals()["total_requests"] == total
+
+    asyncio.run(run())
+    print("✓ 无效的 Content-Length 返回 400")
+
+
+if __name__ == "__main__":
+    try:
+        test_parse_content_length()
+        test_has_request_body()
+        test_invalid_content_length_rejected()
+        print("\n✓ 所有请求体长度校验测试通过！")
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        sys.exit(1)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+测试列式请求记录窗口：记录还原、按 request_id 查找、淘汰、时间范围过滤，以及统计记录按 request_id 更新
+"""
+
+import asyncio
+import sys
+import os
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.sse import USAGE_FIELDS
+from backend.utils.request_ring import RequestRing
+
+
+def _ring(capacity: int) -> RequestRing:
+    return RequestRing(capacity, nested={"usage": USAGE_FIELDS})
+
+
+def test_record_roundtrip():
+    """测试写入列与稀疏字段的记录能原样还原，更新后 None、类型不符的值也保持原样"""
+    ring = _ring(4)
+    usage = {field: i * 10 for i, field in enumerate(USAGE_FIELDS)}
+    record = {
+        "path": "v1/messages",
+        "method": "POST",
+        "status": "completed",
+        "status_code": 200,
+        "bytes": 1234,
+        "response_time": 0.25,
+        "upstream": "https://api.example.com",
+        "attempts": 1,
+        "usage": usage,
+        "output_tokens_per_second": None,
+        "duration": 1.5,
+        "chunks": 12,
+        "error": "HTTP 400",
+        "response_content": "Error: 当前模型不可用",
+        "timestamp": 1700000000.123
+    }
+    slot = ring.append(record)
+    restored = ring.record(slot)
+    request_id = restored.pop("request_id")
+    assert request_id == "1700000000123-0"
+    assert restored == record
+
+    # 类型不符的值（字符串状态码、缺少字段的 usage）存入稀疏字段，之后又能写回列
+    ring.update(slot, {"status_code": "400", "usage": {"input_tokens": 1}})
+    assert ring.value(slot, "status_code") == "400"
+    assert ring.record(slot)["usage"] == {"input_tokens": 1}
+    ring.update(slot, {"status_code": 502, "usage": None})
+    assert ring.value(slot, "status_code") == 502 and ring.value(slot, "usage") is None
+    assert ring.value(slot, "cache", "missing") == "missing"
+    print("✓ 记录原样还原")
+
+
+def test_lookup_and_eviction():
+    """测试按 request_id 查找、外部 request_id 的索引，以及淘汰最早记录"""
+    ring = _ring(3)
+    ids = []
+    for i in range(5):
+        slot = ring.append({"path": f"p{i}", "timestamp": 100.0 + i})
+        ids.append(ring.request_id(slot))
+
+    assert len(ring) == 3
+    assert [r["path"] for r in ring] == ["p2", "p3", "p4"]
+    assert [r["path"] for r in reversed(ring)] == ["p4", "p3", "p2"]
+    assert ring.get(ids[1]) is None and ids[1] not in ring
+    assert ring.get(ids[4])["path"] == "p4"
+    # 序号相同但时间戳不同的 request_id 不会误匹配
+    assert ring.find("99999-4") is None and ring.find("not-an-id") is None
+    assert ids[4] == "104000-4"
+
+    ring.append({"request_id": "test-123", "path": "external", "timestamp": 1.0})
+    assert ring.get("test-123")["path"] == "external"
+    for i in range(3):
+        ring.append({"path": "later", "timestamp": 200.0 + i})
+    assert ring.get("test-123") is None
+
+    # 序号已滑出窗口的记录不再写入
+    assert ring.put(0, {"path": "late", "timestamp": 1.0}) is None
+    ring.clear()
+    assert len(ring) == 0 and ring.get(ids[4]) is None
+    print("✓ 按 request_id 查找与淘汰正确")
+
+
+def test_index_lookup_and_eviction():
+    """测试任意 request_id 的索引：按键查找、淘汰最早记录时删除其索引、同一键重复写入时指向最新记录"""
+    ring = _ring(3)
+    for i in range(5):
+        ring.append({"n": i, "timestamp": float(i)}, f"r{i}")
+
+    assert len(ring) == 3
+    assert [r["n"] for r in ring] == [2, 3, 4]
+    assert [r["n"] for r in reversed(ring)] == [4, 3, 2]
+    assert ring.get("r1") is None and "r1" not in ring
+    assert ring.get("r4")["n"] == 4 and ring.get("r4")["request_id"] == "r4"
+    assert len(ring._index) == 3
+
+    # 同一键重复写入：索引指向最新记录，淘汰旧记录时不删除新记录的索引
+    ring.append({"n": 22, "timestamp": 5.0}, "r2")
+    assert ring.get("r2")["n"] == 22
+    ring.append({"n": 5, "timestamp": 6.0}, "r5")
+    ring.append({"n": 6, "timestamp": 7.0}, "r6")
+    assert ring.get("r2")["n"] == 22
+    ring.append({"n": 7, "timestamp": 8.0}, "r7")
+    assert ring.get("r2") is None
+    assert len(ring._index) == 3
+    ring.clear()
+    assert len(ring) == 0 and ring.get("r7") is None and not ring._index
+    print("✓ request_id 索引查找与淘汰正确")
+
+
+def test_range_filter():
+    """测试按时间范围过滤只在 tail() 时生成记录，以及按驻留字符串查找进行中的记录"""
+    ring = _ring(100)
+    for i in range(250):
+        ring.append({"path": "v1/messages", "status": "pending" if i % 50 == 0 else "completed", "timestamp": float(i)})
+
+    view = ring.select(160.0, 199.0)
+    assert len(view) == 40
+    assert [r["timestamp"] for r in view.tail(3)] == [197.0, 198.0, 199.0]
+    assert len(view.tail(0)) == 40
+    assert len(ring.select(0.0, 149.0)) == 0
+    assert [ring.value(slot, "timestamp") for slot in ring.matching("status", "pending")] == [150.0, 200.0]
+    assert ring.matching("status", "unknown") == []
+    print("✓ 时间范围过滤正确")
+
+
+def test_stats_records_updated_by_id():
+    """测试请求完成时按 request_id 更新对应记录，已完成的请求不会再被记为错误"""
+    from backend.services import stats
+
+    async def run():
+        first = stats.record_request_start("v1/messages", "POST", 10)
+        second = stats.record_request_start("v1/messages", "POST", 10)
+        assert first != second
+        stats.record_request_success(second, "v1/messages", "POST", 100, 0.2, 200)
+        stats.record_request_error(first, "v1/messages", "POST", "boom", 0.1, status_code=502)
+        # 已完成的请求不再被记录为错误
+        stats.record_request_error(second, "v1/messages", "POST", "late", 0.1, status_code=502)
+        # 开始记录已不在窗口中的请求完成时追加新记录
+        stats.record_request_success("1-999999999", "v1/messages", "GET", 5, 0.01, 200)
+        stats.apply_stats_events()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert stats.recent_requests.get(first)["error"] == "boom"
+    assert stats.recent_requests.get(second)["status_code"] == 200
+    assert "error" not in stats.recent_requests.get(second)
+    assert stats.recent_requests.get("1-999999999")["method"] == "GET"
+    print("✓ 统计记录按 request_id 更新")
+
+
+if __name__ == "__main__":
+    try:
+        test_record_roundtrip()
+        test_lookup_and_eviction()
+        test_index_lookup_and_eviction()
+        test_range_filter()
+        test_stats_records_updated_by_id()
+        print("\n✓ 所有请求记录窗口测试通过！")
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        sys.exit(1)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+测试响应缓存：TTL 过期、缓存键区分鉴权头、并发请求合并与不可缓存响应
+"""
+
+import asyncio
+import sys
+import os
+import time
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services import response_cache
+from backend.services.response_cache import CachedResponse, build_cache_key, get_or_fetch
+from backend.utils.lru_cache import LRUCache
+
+
+def test_lru_cache_ttl():
+    """测试带 TTL 的 LRU 缓存过期后视为未命中"""
+    cache = LRUCache(2, ttl=0.05)
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+    # 不设置 TTL 时只按容量淘汰
+    cache = LRUCache(2)
+    for key in "abc":
+        cache.put(key, key)
+    assert cache.get("a") is None and cache.get("c") == "c"
+    assert cache.stats()["evictions"] == 1
+    print("✓ TTL 过期与 LRU 淘汰正确")
+
+
+def test_cache_key_includes_auth_headers():
+    """测试缓存键区分 API Key 与查询参数"""
+    key_a = build_cache_key("GET", "v1/models", "", {"x-api-key": "a"})
+    key_b = build_cache_key("GET", "v1/models", "", {"x-api-key": "b"})
+    key_query = build_cache_key("GET", "v1/models", "limit=1", {"x-api-key": "a"})
+    assert len({key_a, key_b, key_query}) == 3
+    assert key_a == build_cache_key("GET", "v1/models", "", {"x-api-key": "a"})
+    print("✓ 缓存键区分鉴权头与查询参数")
+
+
+def test_concurrent_requests_coalesced():
+    """测试并发的相同请求只调用一次 fetch，之后的请求命中缓存"""
+    response_cache.response_cache.clear()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return CachedResponse(200, {"content-type": "application/json"}, b'{"data": []}')
+
+    async def run():
+        key = build_cache_key("GET", "v1/models", "", {})
+        results = await asyncio.gather(*(get_or_fetch(key, fetch) for _ in range(10)))
+        sources = sorted(source for _, source in results)
+        assert sources == ["coalesced"] * 9 + ["miss"], sources
+        _, source = await get_or_fetch(key, fetch)
+        assert source == "hit"
+
+    asyncio.run(run())
+    assert calls == 1
+    print("✓ 并发请求合并为一次上游调用")
+
+
+def test_error_response_not_cached():
+    """测试错误响应与 no-store 响应不写入缓存，fetch 异常传递给所有等待者"""
+    response_cache.response_cache.clear()
+
+    async def run():
+        key = build_cache_key("GET", "v1/models", "", {"x-api-key": "err"})
+
+        async def fail_response():
+            return CachedResponse(503, {}, b"down")
+        await get_or_fetch(key, fail_response)
+        _, source = await get_or_fetch(key, fail_response)
+        assert source == "miss"
+
+        async def no_store():
+            return CachedResponse(200, {"Cache-Control": "no-store"}, b"{}")
+        await get_or_fetch(key, no_store)
+        _, source = await get_or_fetch(key, no_store)
+        assert source == "miss"
+
+        async def raise_error():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+        results = await asyncio.gather(*(get_or_fetch(key, raise_error) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    asyncio.run(run())
+    print("✓ 不可缓存的响应不写入缓存")
+
+
+if __name__ == "__main__":
+    try:
+        test_lru_cache_ttl()
+        test_cache_key_includes_auth_headers()
+        test_concurrent_requests_coalesced()
+        test_error_response_not_cached()
+        print("\n✓ 所有响应缓存测试通过！")
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        sys.exit(1)
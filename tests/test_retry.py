@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+测试上游重试策略：重试预算、可重试判断、退避时间与对冲路径匹配
+"""
+
+import sys
+import os
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services import retry
+
+
+def test_retry_budget_limits_retries():
+    """测试重试预算按流量比例限制重试次数"""
+    budget = retry.RetryBudget(ratio=0.2, min_per_second=0)
+    for _ in range(50):
+        budget.record_request()
+
+    granted = sum(budget.try_acquire() for _ in range(20))
+    assert granted == 10, granted
+    assert budget.exhausted == 10
+    assert budget.stats()["available"] == 0
+
+    # 保底额度：没有流量时也允许少量重试
+    budget = retry.RetryBudget(ratio=0.2, min_per_second=0.5)
+    assert sum(budget.try_acquire() for _ in range(10)) == 5
+    print("✓ 重试预算限制生效")
+
+
+def test_retryable_conditions():
+    """测试可重试的状态码与错误类型"""
+    assert retry.is_retryable_status(529)
+    assert retry.is_retryable_status(503)
+    assert not retry.is_retryable_status(500)
+    assert not retry.is_retryable_status(200)
+
+    # 请求必定未送达上游时任何方法都可重试
+    assert retry.is_retryable_error("connect_error", "POST")
+    assert retry.is_retryable_error("pool_timeout", "POST")
+    # 上游可能已处理请求时仅幂等方法可重试
+    assert not retry.is_retryable_error("first_byte_timeout", "POST")
+    assert retry.is_retryable_error("first_byte_timeout", "GET")
+    print("✓ 可重试判断正确")
+
+
+def test_backoff_delay_bounds():
+    """测试退避时间在 [0, min(MAX, BASE * 2^(n-1))] 范围内"""
+    for retry_number in range(1, 8):
+        cap = min(retry.UPSTREAM_RETRY_BACKOFF_MAX, retry.UPSTREAM_RETRY_BACKOFF_BASE * 2 ** (retry_number - 1))
+        for _ in range(50):
+            assert 0 <= retry.backoff_delay(retry_number) <= cap
+    print("✓ 退避时间范围正确")
+
+
+def test_should_hedge():
+    """测试对冲只作用于匹配路径上的幂等请求"""
+    saved = retry.HEDGE_PATH_PATTERNS
+    retry.HEDGE_PATH_PATTERNS = ["v1/models*"]
+    try:
+        assert retry.should_hedge("v1/models", "GET")
+        assert retry.should_hedge("v1/models/claude", "GET")
+        assert not retry.should_hedge("v1/models", "POST")
+        assert not retry.should_hedge("v1/messages", "GET")
+    finally:
+        retry.HEDGE_PATH_PATTERNS = saved
+    print("✓ 对冲路径匹配正确")
+
+
+if __name__ == "__main__":
+    try:
+        test_retry_budget_limits_retries()
+        test_retryable_conditions()
+        test_backoff_delay_bounds()
+        test_should_hedge()
+        print("\n✓ 所有重试策略测试通过！")
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        sys.exit(1)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+测试运行时配置热更新：文件变化触发快照替换、旧快照保持不变、管理面板修改持久化、上游状态沿用
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services import runtime_config
+from backend.services import balancer
+from backend.services.runtime_config import current_config, reload_config, update_config
+
+
+def _in_temp_dir(test):
+    """在临时目录中运行（配置文件为相对路径 env/...），结束后恢复启动时的配置"""
+    def wrapper():
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                test()
+            finally:
+                os.chdir(cwd)
+                reload_config("startup")
+    wrapper.__name__ = test.__name__
+    wrapper.__doc__ = test.__doc__
+    return wrapper
+
+
+@_in_temp_dir
+def test_file_change_swaps_snapshot():
+    """测试配置文件变化后生成新版本快照，进行中请求持有的旧快照不变"""
+    reload_config()
+    before = current_config()
+    assert reload_config() is None  # 配置未变化时不替换
+
+    os.makedirs("env")
+    with open("env/.env.headers.json", "w", encoding="utf-8") as f:
+        json.dump({"User-Agent": "claude-cli/2.0.8"}, f)
+    after = reload_config()
+    assert after is current_config() and after.version == before.version + 1
+    assert dict(after.custom_headers) == {"User-Agent": "claude-cli/2.0.8"}
+    assert "User-Agent" not in before.custom_headers
+    headers = after.header_rewriter.rewrite([("user-agent", "client")], "v1/messages", passthrough=False)
+    assert headers["User-Agent"] == "claude-cli/2.0.8"
+    assert before.header_rewriter.rewrite([("user-agent", "client")], "v1/messages", passthrough=False)["user-agent"] == "client"
+    print("✓ 文件变化触发快照替换")
+
+
+@_in_temp_dir
+def test_admin_update_persists_and_reuses_upstreams():
+    """测试管理面板修改写入配置文件，同地址的上游沿用已有对象（保留负载与熔断状态）"""
+    reload_config()
+    before = current_config()
+    existing = before.upstreams[0]
+    snapshot = update_config({
+        "system_prompt_replacement": None,
+        "api_base_urls": f"{existing.base_url}|3,https://backup.example.com|1"
+    })
+    assert snapshot.source == "admin"
+    assert snapshot.system_prompt.replacement is None
+    assert snapshot.upstreams[0] is existing and snapshot.weights[existing.name] == 3
+    # 进行中请求持有的旧快照权重不变
+    assert before.weights[existing.name] == 1
+    assert [u.name for u in balancer.upstreams] == [u.name for u in snapshot.upstreams]
+    with open("env/.env.runtime.json", encoding="utf-8") as f:
+        assert json.load(f)["system_prompt_replacement"] is None
+
+    # 删除覆盖文件后恢复环境变量中的配置
+    os.remove("env/.env.runtime.json")
+    restored = reload_config()
+    assert len(restored.upstreams) == 1 and restored.upstreams[0] is existing
+    assert restored.weights[existing.name] == 1
+    print("✓ 管理面板修改持久化并沿用上游状态")
+
+
+@_in_temp_dir
+def test_admin_rejects_invalid_upstreams():
+    """测试管理面板提交无效的上游列表时返回 400，且不写入配置文件"""
+    from fastapi import HTTPException
+    from backend.routers import admin
+
+    reload_config()
+    version = current_config().version
+    for raw in ("not-a-url|2", "https://a.example.com|abc", None):
+        try:
+            asyncio.run(admin.update_config(admin.ConfigUpdateRequest(api_base_urls=raw), True))
+        except HTTPException as e:
+            assert e.status_code == 400, e.status_code
+        else:
+            raise AssertionError(f"{raw!r} should be rejected")
+    assert not os.path.exists("env/.env.runtime.json")
+    assert current_config().version == version
+    print("✓ 无效的上游列表被拒绝")
+
+
+@_in_temp_dir
+def test_watcher_detects_changes():
+    """测试后台轮询任务发现配置文件变化后自动重新加载"""
+    reload_config()
+    saved = runtime_config.CONFIG_WATCH_INTERVAL
+    runtime_config.CONFIG_WATCH_INTERVAL = 0.01
+
+    async def run():
+        version = current_config().version
+        task = asyncio.create_task(runtime_config.watch_config_files())
+        os.makedirs("env")
+        with open("env/.env.header-rules.json", "w", encoding="utf-8") as f:
+            json.dump([{"action": "drop", "name": "x-debug"}], f)
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if current_config().version > version:
+                break
+        task.cancel()
+        assert current_config().version == version + 1
+        assert len(current_config().header_rules) == 1
+
+    try:
+        asyncio.run(run())
+    finally:
+        runtime_config.CONFIG_WATCH_INTERVAL = saved
+    print("✓ 配置文件轮询生效")
+
+
+if __name__ == "__main__":
+    try:
+        test_file_change_swaps_snapshot()
+        test_admin_update_persists_and_reuses_upstreams()
+        test_admin_rejects_invalid_upstreams()
+        test_watcher_detects_changes()
+        print("\n✓ 所有运行时配置测试通过！")
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        sys.exit(1)
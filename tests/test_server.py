@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+测试服务启动配置：事件循环与 HTTP 解析器选择、SO_REUSEPORT 绑定
+"""
+
+import socket
+import sys
+import os
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.server import resolve_loop, resolve_http, server_options, bind_reuse_port, reuse_port_supported
+
+
+def test_resolve_loop_and_http():
+    """测试显式配置原样使用，auto 时按是否安装 uvloop / httptools 选择"""
+    assert resolve_loop("asyncio") == "asyncio"
+    assert resolve_http("h11") == "h11"
+    assert resolve_loop("auto") in ("uvloop", "asyncio")
+    assert resolve_http("auto") in ("httptools", "h11")
+
+    options = server_options()
+    assert options["loop"] != "auto" and options["http"] != "auto"
+    assert options["limit_concurrency"] is None or options["limit_concurrency"] > 0
+    print("✓ 事件循环与 HTTP 解析器选择正确")
+
+
+def test_bind_reuse_port():
+    """测试多个 socket 可以 SO_REUSEPORT 绑定同一端口"""
+    if not reuse_port_supported():
+        print("- 当前平台不支持 SO_REUSEPORT，跳过")
+        return
+    first = bind_reuse_port("127.0.0.1", 0)
+    port = first.getsockname()[1]
+    second = bind_reuse_port("127.0.0.1", port)
+    try:
+        first.listen(8)
+        second.listen(8)
+        client = socket.create_connection(("127.0.0.1", port), timeout=2)
+        client.close()
+    finally:
+        first.close()
+        second.close()
+    print("✓ SO_REUSEPORT 绑定正确")
+
+
+if __name__ == "__main__":
+    try:
+        test_resolve_loop_and_http()
+        test_bind_reuse_port()
+        print("\n✓ 所有服务启动配置测试通过！")
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        sys.exit(1)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+测试共享内存统计：槽位认领与复用、计数器与多分辨率时间序列汇总、延迟直方图百分位、跨进程汇总
+"""
+
+import multiprocessing
+import sys
+import os
+import tempfile
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.shared_stats import SharedStats, pick_resolution
+from backend.utils.sketch import bucket_index, bucket_value, histogram_percentiles, HIST_BUCKETS
+
+NOW = 1_700_000_000.0
+
+
+def _record_in_child(path: str, slots: int, count: int):
+    stats = SharedStats(path, slots)
+    for _ in range(count):
+        stats.incr("total_requests")
+        stats.add_series(NOW, requests=1, successes=1, bytes_count=10)
+        stats.observe("response_time", 0.1, NOW)
+
+
+def test_counters_and_series():
+    """测试计数器、错误类型与各分辨率时间序列的累加，环中的行被新的时间桶覆盖时先清零"""
+    stats = SharedStats(None, slots=2)
+    stats.incr("total_requests", 3)
+    stats.incr("output_tokens", 120)
+    stats.incr_error("first_byte_timeout")
+    stats.incr_error("not_a_known_type")
+    totals = stats.totals()
+    assert totals["total_requests"] == 3 and totals["output_tokens"] == 120
+    assert totals["errors_by_type"] == {"first_byte_timeout": 1, "other": 1}
+
+    stats.add_series(NOW, requests=2, errors=1, bytes_count=100, input_tokens=30, output_tokens=7)
+    stats.add_series(NOW + 60, requests=1)
+    series = stats.series("minute", NOW - 60, NOW + 60)
+    assert [m["requests"] for m in series] == [0, 2, 1]
+    assert series[1]["errors"] == 1 and series[1]["bytes"] == 100
+    assert series[1]["input_tokens"] == 30 and series[1]["output_tokens"] == 7
+
+    # 同一次记录同时计入秒级与小时级时间桶
+    seconds = stats.series("second", NOW - 1, NOW + 1)
+    assert [m["requests"] for m in seconds] == [0, 2, 0] and seconds[1]["time"] == int(NOW)
+    assert sum(m["requests"] for m in stats.series("hour", NOW, NOW + 60)) == 3
+
+    # 24 小时后同一位置被新的分钟复用
+    stats.add_series(NOW + 1440 * 60, requests=5)
+    assert stats.series("minute", NOW, NOW)[0]["requests"] == 0
+    assert stats.series("minute", NOW + 1440 * 60, NOW + 1440 * 60)[0]["requests"] == 5
+    assert stats.series("hour", NOW, NOW)[0]["requests"] == 3  # 小时级保留 30 天
+    print("✓ 计数器与多分辨率时间序列正确")
+
+
+def test_pick_resolution():
+    """测试按时间范围选择能覆盖该范围的最细分辨率"""
+    now = NOW
+    assert pick_resolution(now - 300, now, now=now) == "second"
+    assert pick_resolution(now - 3600, now, now=now) == "minute"
+    assert pick_resolution(now - 86400, now, now=now) == "minute"
+    assert pick_resolution(now - 7 * 86400, now, now=now) == "hour"
+    # 范围较短但起点已超出秒级保留期
+    assert pick_resolution(now - 3600, now - 3500, now=now) == "minute"
+    # 直方图按直方图保留期选择
+    assert pick_resolution(now - 300, now, histogram=True, now=now) == "minute"
+    assert pick_resolution(now - 86400, now, histogram=True, now=now) == "hour"
+    print("✓ 分辨率选择正确")
+
+
+def test_histogram_percentiles():
+    """测试对数分桶与百分位估算（误差在一个桶宽以内）"""
+    assert bucket_index(0.2) == 0
+    assert bucket_index(10 ** 9) == HIST_BUCKETS - 1
+    for ms in (3, 50, 800, 12000):
+        assert abs(bucket_value(bucket_index(ms)) - ms) / ms < 0.15
+
+    stats = SharedStats(None, slots=1)
+    for i in range(1, 101):
+        stats.observe("response_time", i / 1000, NOW)  # 1ms ~ 100ms
+    stats.observe("duration", None, NOW)  # 没有数据时忽略
+    counts, total_ms = stats.histogram("response_time", NOW - 60, NOW)
+    assert sum(counts) == 100 and abs(total_ms - 5050) < 1
+    p = histogram_percentiles(counts, [50, 99])
+    assert 44 <= p[50] <= 56 and 88 <= p[99] <= 112
+    assert stats.histogram("duration", NOW - 60, NOW)[0] == [0] * HIST_BUCKETS
+    # 超过 60 分钟的直方图不在查询范围内，累计直方图仍包含全部样本
+    assert sum(stats.histogram("response_time", NOW + 3600, NOW + 3600)[0]) == 0
+    assert stats.sketch("response_time", NOW + 3600, NOW + 3600).count == 0
+    assert stats.sketch("response_time").count == 100
+    print("✓ 延迟直方图正确")
+
+
+def test_slot_reuse():
+    """测试已退出进程的槽位可被复用，重置后清空数据"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "stats.mmap")
+        stats = SharedStats(path, slots=1)
+        stats.incr("total_requests")
+        # 模拟槽位属于已退出的进程
+        dead = multiprocessing.Process(target=int)
+        dead.start()
+        dead.join()
+        stats.view[8] = dead.pid
+        stats._pid = None
+        stats.incr("total_requests")
+        assert stats.workers()[0]["pid"] == os.getpid()
+        assert stats.totals()["total_requests"] == 2  # 保留已退出进程的累计数据
+
+        stats.reset()
+        assert stats.totals()["total_requests"] == 0 and stats.workers() == []
+    print("✓ 槽位复用与重置正确")
+
+
+def test_cross_process_aggregation():
+    """测试多个进程写入各自槽位，任一进程读取到的是汇总结果"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "stats.mmap")
+        stats = SharedStats(path, slots=4)
+        children = [multiprocessing.Process(target=_record_in_child, args=(path, 4, 50)) for _ in range(3)]
+        for child in children:
+            child.start()
+        for child in children:
+            child.join()
+        stats.incr("total_requests", 7)
+
+        assert stats.totals()["total_requests"] == 157
+        minute = stats.series("minute", NOW, NOW)[0]
+        assert minute["requests"] == 150 and minute["bytes"] == 1500
+        assert sum(stats.histogram("response_time", NOW, NOW)[0]) == 150
+        # 已退出子进程的槽位会被后启动的进程复用，累计数据保留
+        assert os.getpid() in [w["pid"] for w in stats.workers()]
+    print("✓ 跨进程汇总正确")
+
+
+if __name__ == "__main__":
+    try:
+        test_counters_and_series()
+        test_pick_resolution()
+        test_histogram_percentiles()
+        test_slot_reuse()
+        test_cross_process_aggregation()
+        print("\n✓ 所有共享统计测试通过！")
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        sys.exit(1)
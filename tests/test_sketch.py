@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+测试延迟草图：百分位精度、合并结果与直接记录一致、空草图
+"""
+
+import math
+import random
+import sys
+import os
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.utils.sketch import LatencySketch, percentile_key
+
+
+def _exact(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * p / 100) - 1)]
+
+
+def test_percentile_accuracy():
+    """测试长尾分布下 p50 / p95 / p99 / p99.9 的相对误差在 5% 左右"""
+    rng = random.Random(42)
+    samples = [rng.lognormvariate(5, 1.2) / 1000 for _ in range(100_000)]  # 秒，中位数约 150ms
+    sketch = LatencySketch()
+    for seconds in samples:
+        sketch.add(seconds)
+
+    values_ms = [s * 1000 for s in samples]
+    estimated = sketch.percentiles()
+    for p in (50, 95, 99, 99.9):
+        exact = _exact(values_ms, p)
+        assert abs(estimated[p] - exact) / exact < 0.06, (p, estimated[p], exact)
+    summary = sketch.summary()
+    assert summary["count"] == 100_000 and set(summary) == {"count", "avg", "p50", "p95", "p99", "p999"}
+    assert abs(summary["avg"] - sum(values_ms) / len(values_ms)) < 0.01
+    print("✓ 百分位精度正确")
+
+
+def test_merge_matches_single_sketch():
+    """测试分别记录后合并与记录到同一个草图完全相同"""
+    rng = random.Random(7)
+    whole, first, second = LatencySketch(), LatencySketch(), LatencySketch()
+    for i in range(5000):
+        seconds = rng.expovariate(1 / 0.3)
+        whole.add(seconds)
+        (first if i % 3 else second).add(seconds)
+    merged = LatencySketch().merge(first).merge(second)
+    assert merged.counts == whole.counts
+    assert merged.percentiles() == whole.percentiles()
+    assert first.count + second.count == 5000  # 合并不修改被合并的草图
+    print("✓ 草图合并正确")
+
+
+def test_empty_and_edge_values():
+    """测试空草图、None 样本与超出范围的样本"""
+    sketch = LatencySketch()
+    assert sketch.summary() == {"count": 0, "avg": 0, "p50": 0, "p95": 0, "p99": 0, "p999": 0}
+    sketch.add(None)
+    sketch.add(-1)  # 负值计为 0
+    sketch.add(10 ** 6)  # 超出范围计入最后一个桶
+    assert sketch.count == 2
+    assert sketch.counts[0] == 1 and sketch.counts[-1] == 1
+    assert percentile_key(99.9) == "p999" and percentile_key(50) == "p50"
+    print("✓ 边界情况正确")
+
+
+if __name__ == "__main__":
+    try:
+        test_percentile_accuracy()
+        test_merge_matches_single_sketch()
+        test_empty_and_edge_values()
+        print("\n✓ 所有延迟草图测试通过！")
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        sys.exit(1)
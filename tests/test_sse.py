@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+测试 SSE 用量解析：任意数据块切分、CRLF 换行、累计用量覆盖与超长行
+"""
+
+import sys
+import os
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.sse import SSEUsageParser, is_event_stream
+
+STREAM = (
+    b'event: message_start\n'
+    b'data: {"type":"message_start","message":{"id":"msg_1","usage":{"input_tokens":12,'
+    b'"cache_read_input_tokens":300,"cache_creation_input_tokens":7,"output_tokens":1}}}\n\n'
+    b'event: content_block_delta\n'
+    b'data: {"type":"content_block_delta","delta":{"type":"text_delta","text":"usage"}}\n\n'
+    b'event: message_delta\n'
+    b'data: {"type":"message_delta","delta":{"stop_reason":"end_turn"},"usage":{"output_tokens":57}}\n\n'
+    b'event: message_stop\n'
+    b'data: {"type":"message_stop"}\n\n'
+)
+
+EXPECTED = {
+    "input_tokens": 12,
+    "output_tokens": 57,
+    "cache_read_input_tokens": 300,
+    "cache_creation_input_tokens": 7
+}
+
+
+def _parse(chunks) -> dict | None:
+    parser = SSEUsageParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.result()
+
+
+def test_usage_across_chunk_boundaries():
+    """测试用量事件被切分到任意位置时仍能正确解析"""
+    assert _parse([STREAM]) == EXPECTED
+    assert _parse([STREAM[i:i + 1] for i in range(len(STREAM))]) == EXPECTED
+    for size in (3, 17, 64, 100):
+        assert _parse([STREAM[i:i + size] for i in range(0, len(STREAM), size)]) == EXPECTED, size
+    assert _parse([STREAM.replace(b"\n", b"\r\n")]) == EXPECTED
+    print("✓ 任意切分的 SSE 流解析正确")
+
+
+def test_no_usage_and_oversized_lines():
+    """测试没有用量事件时返回 None，超长行被丢弃而不影响后续事件"""
+    assert _parse([b'data: {"type":"ping"}\n\n']) is None
+
+    huge_line = b'data: {"type":"content_block_delta","usage":"' + b"x" * 200000 + b'"}\n\n'
+    chunks = [huge_line[i:i + 4096] for i in range(0, len(huge_line), 4096)] + [STREAM]
+    assert _parse(chunks) == EXPECTED
+
+    # 流末尾缺少换行的用量事件在 result() 时解析
+    assert _parse([STREAM.rstrip(b"\n").rsplit(b"\n\n", 1)[0].rstrip(b"\n")])["output_tokens"] == 57
+    print("✓ 无用量与超长行处理正确")
+
+
+def test_is_event_stream():
+    """测试只解析未压缩的 SSE 响应"""
+    assert is_event_stream({"content-type": "text/event-stream; charset=utf-8"})
+    assert not is_event_stream({"content-type": "application/json"})
+    assert not is_event_stream({"content-type": "text/event-stream", "content-encoding": "gzip"})
+    print("✓ SSE 响应识别正确")
+
+
+if __name__ == "__main__":
+    try:
+        test_usage_across_chunk_boundaries()
+        test_no_usage_and_oversized_lines()
+        test_is_event_stream()
+        print("\n✓ 所有 SSE 用量解析测试通过！")
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        sys.exit(1)
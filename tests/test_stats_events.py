@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+测试统计事件队列：按顺序批量应用、成功与失败不重复计数、同一请求的错误不重复计数、积压时内联应用、单个事件失败不影响同批事件、
+聚合任务取消时应用剩余事件
+"""
+
+import asyncio
+import sys
+import os
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services import stats
+
+PATH = "v1/messages"
+
+
+def _totals() -> dict:
+    return stats.get_request_totals()
+
+
+def _delta(before: dict, after: dict, name: str) -> int:
+    return after[name] - before[name]
+
+
+def test_events_applied_in_order():
+    """测试开始、成功、失败事件入队后不立即生效，批量应用时按顺序更新记录与计数器"""
+    stats.apply_stats_events()
+    before = _totals()
+
+    ok = stats.record_request_start(PATH, "POST", 10)
+    stats.record_request_success(ok, PATH, "POST", 100, 0.2, 200)
+    failed = stats.record_request_start(PATH, "POST", 20)
+    stats.record_request_error(failed, PATH, "POST", "boom", 0.1, status_code=502, error_type="http_error")
+    assert stats.recent_requests.get(ok) is None  # 尚未应用
+    assert len(stats._events) == 4
+
+    assert stats.apply_stats_events() == 4
+    after = _totals()
+    assert _delta(before, after, "total_requests") == 2
+    assert _delta(before, after, "successful_requests") == 1
+    assert _delta(before, after, "failed_requests") == 1
+    assert _delta(before, after, "total_bytes_sent") == 30
+    assert after["errors_by_type"].get("http_error", 0) - before["errors_by_type"].get("http_error", 0) == 1
+    assert stats.recent_requests.get(ok)["status"] == "completed"
+    assert stats.recent_requests.get(failed)["error"] == "boom"
+    print("✓ 事件按顺序批量应用")
+
+
+def test_no_double_counting():
+    """测试已成功的请求不再记为错误，已超时（504）的请求不再记为成功"""
+    stats.apply_stats_events()
+    before = _totals()
+
+    ok = stats.record_request_start(PATH, "POST", 0)
+    stats.record_request_success(ok, PATH, "POST", 100, 0.2, 200)
+    stats.record_request_error(ok, PATH, "POST", "late", 0.3, status_code=502)
+    stale = stats.record_request_start(PATH, "POST", 0)
+    stats.record_request_error(stale, PATH, "POST", "请求超时", 300, status_code=504, error_type="stale_timeout")
+    stats.record_request_success(stale, PATH, "POST", 100, 301, 200)
+    stats.apply_stats_events()
+
+    after = _totals()
+    assert _delta(before, after, "successful_requests") == 1
+    assert _delta(before, after, "failed_requests") == 1
+    assert stats.recent_requests.get(ok)["status_code"] == 200
+    assert stats.recent_requests.get(stale)["status_code"] == 504
+    print("✓ 成功与失败不重复计数")
+
+
+def test_error_after_timeout_not_counted_twice():
+    """测试已超时（504）或已记录错误的请求再次出错时，失败数、错误类型与路径错误数都不重复计数"""
+    stats.apply_stats_events()
+    before = _totals()
+    path_errors = stats.path_stats[PATH]["errors"]
+
+    stale = stats.record_request_start(PATH, "POST", 0)
+    stats.record_request_error(stale, PATH, "POST", "请求超时", 300, status_code=504, error_type="stale_timeout")
+    stats.record_request_error(stale, PATH, "POST", "upstream closed", 301, status_code=502, error_type="http_error")
+    failed = stats.record_request_start(PATH, "POST", 0)
+    stats.record_request_error(failed, PATH, "POST", "boom", 0.1, status_code=502, error_type="http_error")
+    stats.record_request_error(failed, PATH, "POST", "boom again", 0.2, status_code=500, error_type="http_error")
+    stats.apply_stats_events()
+
+    after = _totals()
+    errors_delta = lambda name: after["errors_by_type"].get(name, 0) - before["errors_by_type"].get(name, 0)
+    assert _delta(before, after, "failed_requests") == 2
+    assert errors_delta("stale_timeout") == 1
+    assert errors_delta("http_error") == 1
+    assert stats.path_stats[PATH]["errors"] - path_errors == 2
+    assert stats.recent_requests.get(stale)["error_type"] == "stale_timeout"
+    assert stats.recent_requests.get(failed)["error"] == "boom"
+    print("✓ 超时或已出错的请求不重复计为错误")
+
+
+def test_inline_flush_at_max_pending():
+    """测试积压达到 STATS_MAX_PENDING 时在入队处直接应用一批"""
+    stats.apply_stats_events()
+    saved = stats.STATS_MAX_PENDING
+    stats.STATS_MAX_PENDING = 5
+    inline_before = stats.aggregator_stats["inline_batches"]
+    try:
+        for _ in range(4):
+            stats.record_request_bytes_sent(PATH, 1)
+        assert len(stats._events) == 4
+        stats.record_request_bytes_sent(PATH, 1)
+        assert len(stats._events) == 0
+        assert stats.aggregator_stats["inline_batches"] == inline_before + 1
+    finally:
+        stats.STATS_MAX_PENDING = saved
+    print("✓ 积压时内联应用")
+
+
+def test_failing_event_does_not_drop_batch():
+    """测试单个事件应用失败时记录错误日志，同批的其他事件照常应用"""
+    stats.apply_stats_events()
+    logged = []
+
+    class RecordingLogger:
+        def error(self, message, **fields):
+            logged.append((message, fields))
+
+    def broken(batch):
+        raise RuntimeError("broken event")
+
+    saved = stats.logger
+    stats.logger = RecordingLogger()
+    try:
+        before = _totals()
+        stats.record_request_bytes_sent(PATH, 7)
+        stats._emit((broken, ()))
+        stats.record_request_bytes_sent(PATH, 5)
+        assert stats.apply_stats_events() == 3
+        assert _delta(before, _totals(), "total_bytes_sent") == 12
+    finally:
+        stats.logger = saved
+    assert len(logged) == 1
+    assert logged[0][1] == {"event": "broken", "error": "broken event"}
+    print("✓ 单个事件失败不影响同批事件")
+
+
+def test_aggregator_flushes_on_cancel():
+    """测试聚合任务按间隔应用事件，被取消时应用剩余事件"""
+    stats.apply_stats_events()
+    saved = stats.STATS_FLUSH_INTERVAL
+
+    async def run():
+        before = _totals()["total_bytes_sent"]
+        task = asyncio.create_task(stats.stats_aggregator())
+        await asyncio.sleep(0)
+        stats.record_request_bytes_sent(PATH, 3)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        assert len(stats._events) == 0
+        assert stats.shared_stats.totals()["total_bytes_sent"] - before == 3
+
+    # 间隔足够长，事件只可能在取消时被应用
+    stats.STATS_FLUSH_INTERVAL = 3600
+    try:
+        asyncio.run(run())
+    finally:
+        stats.STATS_FLUSH_INTERVAL = saved
+    print("✓ 聚合任务取消时应用剩余事件")
+
+
+if __name__ == "__main__":
+    try:
+        test_events_applied_in_order()
+        test_no_double_counting()
+        test_error_after_timeout_not_counted_twice()
+        test_inline_flush_at_max_pending()
+        test_failing_event_does_not_drop_batch()
+        test_aggregator_flushes_on_cancel()
+        print("\n✓ 所有统计事件队列测试通过！")
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        sys.exit(1)
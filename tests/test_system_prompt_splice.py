@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+测试 system prompt 字节拼接替换与完整 JSON 改写的结果一致性
+"""
+
+import json
+import sys
+import os
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services import proxy
+from backend.utils.json_splice import SpliceError, locate_system_text
+
+REPLACEMENT = "You are Claude Code, Anthropic's official CLI for Claude. 你好 \"quoted\""
+
+CASES = {
+    "compact": {
+        "model": "claude",
+        "messages": [{"role": "user", "content": "hi [brackets] {braces} \"quotes\" \\ backslash"}],
+        "system": [{"type": "text", "text": "You are Claude Code"}, {"type": "text", "text": "more"}],
+        "stream": True,
+    },
+    "no_keyword": {
+        "messages": [{"role": "user", "content": [{"type": "text", "text": "中文内容"}]}],
+        "system": [{"type": "text", "text": "Some other agent", "cache_control": {"type": "ephemeral"}}],
+        "max_tokens": 1024,
+    },
+    "system_first": {
+        "system": [{"text": "claude code lower case", "type": "text"}],
+        "messages": [],
+        "temperature": 0.5,
+        "metadata": None,
+    },
+    "no_system": {"messages": [{"role": "user", "content": "hi"}], "model": "claude"},
+    "string_system": {"messages": [], "system": "plain string system"},
+    "empty_system": {"messages": [], "system": []},
+    "no_text": {"messages": [], "system": [{"type": "image"}]},
+}
+
+
+def _run(body: bytes, insert_mode: bool, use_splice: bool) -> bytes:
+    """在指定配置下处理请求体"""
+    saved = (proxy.SYSTEM_PROMPT_REPLACEMENT, proxy.SYSTEM_PROMPT_BLOCK_INSERT_IF_NOT_EXIST)
+    proxy.SYSTEM_PROMPT_REPLACEMENT = REPLACEMENT
+    proxy.SYSTEM_PROMPT_BLOCK_INSERT_IF_NOT_EXIST = insert_mode
+    try:
+        if use_splice:
+            return proxy.process_request_body(body)
+        return proxy._rewrite_system_prompt_json(body)
+    finally:
+        proxy.SYSTEM_PROMPT_REPLACEMENT, proxy.SYSTEM_PROMPT_BLOCK_INSERT_IF_NOT_EXIST = saved
+
+
+def test_splice_matches_json_rewrite():
+    """测试字节拼接与完整 JSON 改写得到相同的结果"""
+    for name, data in CASES.items():
+        for indent in (None, 2):
+            separators = (',', ':') if indent is None else None
+            body = json.dumps(data, ensure_ascii=False, indent=indent, separators=separators).encode('utf-8')
+            for insert_mode in (False, True):
+                spliced = _run(body, insert_mode, use_splice=True)
+                rewritten = _run(body, insert_mode, use_splice=False)
+                assert json.loads(spliced) == json.loads(rewritten), f"{name} indent={indent} insert={insert_mode}"
+                print(f"✓ {name} (indent={indent}, insert={insert_mode})")
+
+
+def test_splice_keeps_other_bytes():
+    """测试字节拼接不改动 system[0].text 以外的字节（包括原始格式）"""
+    body = b'{ "messages" : [ {"content": "x"} ],\n  "system": [ {"type": "text", "text": "old"} ] }'
+    result = _run(body, insert_mode=False, use_splice=True)
+    expected = body.replace(b'"old"', json.dumps(REPLACEMENT, ensure_ascii=False).encode('utf-8'))
+    assert result == expected
+    print("✓ 其余字节保持不变")
+
+
+def test_locate_rejects_malformed_body():
+    """测试结构无法识别时抛出 SpliceError，由调用方回退"""
+    for body in (b'', b'[1, 2]', b'{"system": [{"text": "a"}]', b'{"system": [{"text": 1}]}', b'{"system" [1]}'):
+        try:
+            locate_system_text(body)
+        except SpliceError:
+            print(f"✓ {body!r} -> SpliceError")
+            continue
+        raise AssertionError(f"expected SpliceError for {body!r}")
+
+    # 回退后与原实现一致：无效 JSON 保持原样
+    assert _run(b'{"system": [{"text": "a"}]', insert_mode=False, use_splice=True) == b'{"system": [{"text": "a"}]'
+
+
+def test_locate_ignores_nested_system_key():
+    """测试嵌套对象中的 system 键和值为 "system" 的字符串不会被误判为最外层 system"""
+    body = (
+        b'{"messages": [{"role": "user", "content": [{"type": "tool_use", "input": {"system": [{"text": "nested"}]}}]}],'
+        b' "system": [{"type": "text", "text": "top"}],'
+        b' "tools": [{"name": "t", "input_schema": {"properties": {"system": {"type": "string"}}}}],'
+        b' "metadata": {"role": "system", "note": "\\"system\\": [1]"}}'
+    )
+    location = locate_system_text(body)
+    assert location is not None
+    assert body[location.text_start:location.text_end] == b'"top"'
+    print("✓ 嵌套 system 键未被误判")
+
+    # 只有嵌套 system 键时，无法确认最外层 system，回退到完整解析
+    nested_only = b'{"messages": [{"input": {"system": [{"text": "nested"}]}}]}'
+    try:
+        locate_system_text(nested_only)
+    except SpliceError:
+        print("✓ 仅存在嵌套 system 键时回退")
+    else:
+        raise AssertionError("expected SpliceError for nested-only system key")
+    assert _run(nested_only, insert_mode=False, use_splice=True) == nested_only
+
+
+def test_rewrite_cache_hits():
+    """测试相同的 system[0].text 第二次改写命中缓存且结果一致"""
+    proxy.system_prompt_cache.clear()
+    hits_before = proxy.system_prompt_cache.hits
+    body = json.dumps(CASES["no_keyword"], ensure_ascii=False).encode('utf-8')
+
+    first = _run(body, insert_mode=True, use_splice=True)
+    second = _run(body, insert_mode=True, use_splice=True)
+    assert first == second
+    assert proxy.system_prompt_cache.hits == hits_before + 1
+
+    # 配置变化后不复用旧结果
+    replaced = _run(body, insert_mode=False, use_splice=True)
+    assert json.loads(replaced)["system"][0]["text"] == REPLACEMENT
+    assert len(json.loads(replaced)["system"]) == 1
+    print(f"✓ 缓存统计: {proxy.system_prompt_cache.stats()}")
+
+
+if __name__ == "__main__":
+    try:
+        test_splice_matches_json_rewrite()
+        test_splice_keeps_other_bytes()
+        test_locate_rejects_malformed_body()
+        test_locate_ignores_nested_system_key()
+        test_rewrite_cache_hits()
+        print("\n✓ 所有 system prompt 拼接测试通过！")
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        sys.exit(1)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+测试按路径的分阶段超时配置解析和上游错误分类
+"""
+
+import sys
+import os
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from backend.services import upstream
+
+
+def test_parse_timeout_rules():
+    """测试规则解析：保留顺序、未设置的字段继承默认值、0 表示不限制"""
+    rules = upstream.parse_timeout_rules('{"/v1/messages*": {"first_byte": 600, "idle": 0}, "v1/*": {"connect": 3}}')
+    assert [pattern for pattern, _ in rules] == ["v1/messages*", "v1/*"]
+
+    messages_policy = rules[0][1]
+    assert messages_policy.first_byte == 600
+    assert messages_policy.idle is None
+    assert messages_policy.connect == upstream.DEFAULT_TIMEOUT_POLICY.connect
+    assert rules[1][1].connect == 3
+    print("✓ 超时规则解析正确")
+
+
+def test_invalid_timeout_rules_fall_back():
+    """测试无效配置回退到默认超时"""
+    for raw in ('', 'not json', '[1, 2]', '{"v1/*": {"read": 5}}', '{"v1/*": {"idle": "x"}}', '{"v1/*": 5}'):
+        assert upstream.parse_timeout_rules(raw) == [], raw
+    print("✓ 无效超时规则回退到默认值")
+
+
+def test_get_timeout_policy_first_match_wins():
+    """测试按配置顺序首个匹配的规则生效，未匹配时使用默认值"""
+    saved = upstream.timeout_rules
+    upstream.timeout_rules = upstream.parse_timeout_rules('{"v1/messages": {"idle": 120}, "v1/*": {"idle": 5}}')
+    try:
+        assert upstream.get_timeout_policy("v1/messages").idle == 120
+        assert upstream.get_timeout_policy("v1/messages/count_tokens").idle == 5
+        assert upstream.get_timeout_policy("health") == upstream.DEFAULT_TIMEOUT_POLICY
+    finally:
+        upstream.timeout_rules = saved
+
+    timeout = upstream.DEFAULT_TIMEOUT_POLICY.to_httpx()
+    assert timeout.read is None
+    print("✓ 路径匹配顺序正确")
+
+
+def test_classify_request_error():
+    """测试 httpx 异常按类型归类"""
+    cases = {
+        httpx.ConnectTimeout("x"): "connect_timeout",
+        httpx.PoolTimeout("x"): "pool_timeout",
+        httpx.WriteTimeout("x"): "write_timeout",
+        httpx.ReadTimeout("x"): "read_timeout",
+        httpx.ConnectError("x"): "connect_error",
+        httpx.RemoteProtocolError("x"): "protocol_error",
+        httpx.ReadError("x"): "request_error",
+    }
+    for error, expected in cases.items():
+        assert upstream.classify_request_error(error) == expected, type(error).__name__
+    print("✓ 上游错误分类正确")
+
+
+if __name__ == "__main__":
+    try:
+        test_parse_timeout_rules()
+        test_invalid_timeout_rules_fall_back()
+        test_get_timeout_policy_first_match_wins()
+        test_classify_request_error()
+        print("\n✓ 所有超时配置测试通过！")
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        sys.exit(1)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+测试请求耗时分解：首字节、首个内容增量、数据块间隔与流耗时
+"""
+
+import sys
+import os
+import time
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.sse import SSEUsageParser
+from backend.services.timings import StreamTimings
+
+
+def test_stream_timings():
+    """测试首字节之后的等待时间计入数据块间隔"""
+    timings = StreamTimings(time.time() - 0.5)
+    timings.on_chunk(0.4)  # 首个数据块：记录首字节时间，等待时间属于首字节延迟
+    timings.on_chunk(0.1)
+    timings.on_chunk(0.3)
+    timings.on_first_token()
+    first_token_time = timings.first_token_time
+    timings.on_first_token()  # 只记录第一次
+
+    result = timings.result()
+    assert result["first_byte_time"] >= 0.5
+    assert result["first_token_time"] == first_token_time
+    assert result["duration"] >= result["first_byte_time"]
+    assert result["chunks"] == 3
+    assert abs(result["chunk_gap_avg"] - 0.2) < 1e-9
+    assert result["chunk_gap_max"] == 0.3
+    print("✓ 耗时分解正确")
+
+
+def test_single_chunk_has_no_gaps():
+    """测试只有一个数据块时没有间隔统计"""
+    timings = StreamTimings(time.time())
+    timings.on_chunk(0.0)
+    result = timings.result()
+    assert result["chunk_gap_avg"] is None and result["chunk_gap_max"] is None
+    assert result["first_token_time"] is None
+    print("✓ 单数据块响应无间隔统计")
+
+
+def test_parser_detects_first_content_delta():
+    """测试 SSE 解析器在首个 content_block_delta 时标记内容开始"""
+    parser = SSEUsageParser()
+    parser.feed(b'event: message_start\ndata: {"type":"message_start","message":{"usage":{"input_tokens":1}}}\n\n')
+    assert not parser.content_started
+    parser.feed(b'event: content_block_delta\ndata: {"type":"content_block_delta","delta":{"text":"hi"}}\n\n')
+    assert parser.content_started
+    print("✓ 首个内容增量识别正确")
+
+
+if __name__ == "__main__":
+    try:
+        test_stream_timings()
+        test_single_chunk_has_no_gaps()
+        test_parser_detects_first_content_delta()
+        print("\n✓ 所有耗时分解测试通过！")
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        sys.exit(1)
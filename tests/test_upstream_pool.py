@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+测试上游连接池：连接数限制、HTTP/2 开关、预热按实际新建的连接计数、连接池占用统计
+"""
+
+import asyncio
+import sys
+import os
+
+# 将项目根目录添加到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services import balancer, upstream
+
+
+class _Settings:
+    """临时修改 upstream 模块中的配置常量，结束后恢复共享客户端与指标"""
+
+    def __init__(self, **values):
+        self.values = values
+
+    def __enter__(self):
+        self.saved = {name: getattr(upstream, name) for name in self.values}
+        self.saved["_http_client"] = upstream._http_client
+        self.saved["_http2_enabled"] = upstream._http2_enabled
+        self.metrics = dict(upstream.pool_metrics)
+        for name, value in self.values.items():
+            setattr(upstream, name, value)
+        return self
+
+    def __exit__(self, *exc):
+        for name, value in self.saved.items():
+            setattr(upstream, name, value)
+        upstream.pool_metrics.update(self.metrics)
+
+
+async def _serve_head() -> asyncio.AbstractServer:
+    """本地 HTTP/1.1 服务：对每个请求返回空的 200 响应并保持连接"""
+    async def handle(reader, writer):
+        try:
+            while await reader.readuntil(b"\r\n\r\n"):
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+def test_pool_limits():
+    """测试连接池使用配置的连接数上限与保活设置"""
+    with _Settings(UPSTREAM_MAX_CONNECTIONS=7, UPSTREAM_MAX_KEEPALIVE_CONNECTIONS=3, UPSTREAM_KEEPALIVE_EXPIRY=12.5,
+                   UPSTREAM_HTTP2=False):
+        client = upstream.create_http_client()
+        pool = next(upstream._iter_pools(client))
+        assert pool._max_connections == 7
+        assert pool._max_keepalive_connections == 3
+        assert pool._keepalive_expiry == 12.5
+        stats = upstream.get_pool_stats()
+        assert stats["max_connections"] == 7 and stats["pool_introspection"]
+        asyncio.run(client.aclose())
+    print("✓ 连接池限制生效")
+
+
+def test_http2_toggle():
+    """测试 HTTP/2 开关：启用且安装了 h2 时使用 HTTP/2，未安装 h2 时回退到 HTTP/1.1"""
+    with _Settings(UPSTREAM_HTTP2=True, _http2_available=lambda: True):
+        client = upstream.create_http_client()
+        assert upstream.get_pool_stats()["http2"] is True
+        assert next(upstream._iter_pools(client))._http2 is True
+        asyncio.run(client.aclose())
+    with _Settings(UPSTREAM_HTTP2=True, _http2_available=lambda: False):
+        client = upstream.create_http_client()
+        assert upstream.get_pool_stats()["http2"] is False
+        assert next(upstream._iter_pools(client))._http2 is False
+        asyncio.run(client.aclose())
+    print("✓ HTTP/2 开关生效")
+
+
+def test_prewarm_counts_opened_connections():
+    """测试预热并发建立连接，按实际新建的连接计数；再次预热时复用已有连接，不重复计数"""
+    async def run():
+        server = await _serve_head()
+        port = server.sockets[0].getsockname()[1]
+        saved = list(balancer.upstreams), balancer.weights
+        balancer._install(balancer.parse_upstreams(f"http://127.0.0.1:{port}", ""))
+        client = upstream.create_http_client()
+        try:
+            before = upstream.pool_metrics["prewarmed_connections"]
+            await upstream.prewarm_connections(client, count=3)
+            assert upstream.pool_metrics["prewarmed_connections"] - before == 3
+
+            stats = upstream.get_pool_stats()
+            assert stats["connections"] == 3 and stats["idle_connections"] == 3
+            assert stats["active_requests"] == 0 and stats["queued_requests"] == 0
+
+            # 连接已在池中保活，再次预热时全部复用
+            await upstream.prewarm_connections(client, count=3)
+            assert upstream.pool_metrics["prewarmed_connections"] - before == 3
+        finally:
+            await client.aclose()
+            balancer.upstreams[:], balancer.weights = saved
+            server.close()
+            await server.wait_closed()
+
+    with _Settings(UPSTREAM_HTTP2=False):
+        asyncio.run(run())
+    print("✓ 预热按实际新建的连接计数")
+
+
+def test_pool_stats_without_internals():
+    """测试客户端内部结构不可读（httpx 版本变化）时连接池统计仍可返回"""
+    class Opaque:
+        pass
+
+    with _Settings(_http_client=Opaque()):
+        stats = upstream.get_pool_stats()
+    assert stats["connections"] == 0 and stats["pool_introspection"] is False
+    assert "pool_wait_ms" in stats
+    print("✓ 内部结构不可读时统计降级")
+
+
+if __name__ == "__main__":
+    try:
+        test_pool_limits()
+        test_http2_toggle()
+        test_prewarm_counts_opened_connections()
+        test_pool_stats_without_internals()
+        print("\n✓ 所有上游连接池测试通过！")
+    except AssertionError as e:
+        print(f"\n✗ 测试失败: {e}")
+        sys.exit(1)